@@ -1,18 +1,23 @@
 from django.contrib import admin
-from .models import SatelliteData, ProcessingLog
+from django.utils.html import format_html, format_html_join
+from .models import SatelliteData, ProcessingLog, UploadSession
 
 
 @admin.register(SatelliteData)
 class SatelliteDataAdmin(admin.ModelAdmin):
-    list_display = ['file_name', 'satellite_name', 'status', 'cloud_coverage_percentage', 'upload_datetime', 'uploaded_by']
-    list_filter = ['status', 'satellite_name', 'data_type', 'upload_datetime']
+    list_display = ['file_name', 'satellite_name', 'status', 'cloud_coverage_percentage', 'upload_datetime', 'uploaded_by',
+                    'memory_peak_stage']
+    list_filter = ['status', 'priority', 'satellite_name', 'data_type', 'upload_datetime']
     search_fields = ['file_name', 'satellite_name', 'uploaded_by__username']
     ordering = ['-upload_datetime']
-    readonly_fields = ['upload_datetime', 'processing_start_time', 'processing_end_time', 'file_size']
+    readonly_fields = ['upload_datetime', 'processing_start_time', 'processing_end_time', 'file_size',
+                       'content_sha256', 'params_fingerprint', 'reused_from',
+                       'queued_at', 'attempts', 'lease_owner', 'lease_expires_at', 'wait_seconds', 'service_seconds',
+                       'memory_estimate_mb', 'peak_memory_mb', 'stage_timings', 'memory_profile_summary']
     
     fieldsets = (
         ('File Information', {
-            'fields': ('file_name', 'file_path', 'file_size', 'uploaded_by')
+            'fields': ('file_name', 'file_path', 'file_size', 'uploaded_by', 'content_sha256', 'reused_from')
         }),
         ('Satellite Data', {
             'fields': ('satellite_name', 'data_type', 'observation_time')
@@ -20,6 +25,16 @@ class SatelliteDataAdmin(admin.ModelAdmin):
         ('Processing Status', {
             'fields': ('status', 'upload_datetime', 'processing_start_time', 'processing_end_time')
         }),
+        ('Job Queue', {
+            'fields': ('priority', 'queued_at', 'attempts', 'lease_owner', 'lease_expires_at',
+                       'wait_seconds', 'service_seconds',
+                       'memory_estimate_mb', 'peak_memory_mb', 'stage_timings'),
+            'classes': ('collapse',)
+        }),
+        ('Memory Profile', {
+            'fields': ('memory_profile_summary',),
+            'classes': ('collapse',)
+        }),
         ('Results', {
             'fields': ('brightness_temperature_plot', 'cloud_mask_plot', 'processed_data_file')
         }),
@@ -31,6 +46,28 @@ class SatelliteDataAdmin(admin.ModelAdmin):
         }),
     )
     
+    def memory_peak_stage(self, obj):
+        if not obj.memory_profile:
+            return '-'
+        stage, memory = max(obj.memory_profile.items(), key=lambda item: item[1]['traced_peak_mb'])
+        return f"{stage} ({memory['traced_peak_mb']:.0f} MB)"
+    memory_peak_stage.short_description = 'Peak Memory Stage'
+    
+    def memory_profile_summary(self, obj):
+        if not obj.memory_profile:
+            return 'Not profiled (set TCC_MEMORY_PROFILE to record)'
+        rows = format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>', (
+            (stage, f"{memory['traced_peak_mb']:.1f}", f"{memory['rss_delta_mb']:+.1f}",
+             '-' if memory['rss_peak_mb'] is None else f"{memory['rss_peak_mb']:.1f}",
+             format_html_join('', '{} ({} MB)<br>', ((site, size) for site, size, _count in memory['top'][:3])))
+            for stage, memory in sorted(obj.memory_profile.items(), key=lambda item: -item[1]['traced_peak_mb'])
+        ))
+        return format_html(
+            '<table><thead><tr><th>Stage</th><th>Traced peak (MB)</th><th>RSS change (MB)</th>'
+            '<th>RSS high-water (MB)</th><th>Top allocation sites</th></tr></thead><tbody>{}</tbody></table>',
+            rows)
+    memory_profile_summary.short_description = 'Per-stage memory'
+    
     def has_delete_permission(self, request, obj=None):
         return request.user.is_superuser
 
@@ -55,3 +92,14 @@ class ProcessingLogAdmin(admin.ModelAdmin):
     
     def has_delete_permission(self, request, obj=None):
         return request.user.is_superuser
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'user', 'file_size', 'state', 'created_at', 'satellite_data']
+    list_filter = ['state', 'created_at']
+    search_fields = ['file_name', 'user__username']
+    readonly_fields = ['id', 'created_at', 'satellite_data']
+    
+    def has_add_permission(self, request):
+        return False  # Sessions are opened through the upload API
@@ -0,0 +1,155 @@
+"""
+Memory admission control for processing jobs.
+
+A job's peak memory is estimated from the TIR1_BT dataset shape and dtype
+in its HDF5 header (no data is read) and scaled by a correction factor
+learned from the peak RSS observed on recent jobs. A worker only claims a
+job while the estimates of the jobs running on its host, plus the new one,
+stay within JOB_MEMORY_BUDGET_MB; anything else stays queued until running
+jobs finish. A host with nothing running always admits the oldest job, so
+a scene larger than the whole budget still runs, alone.
+"""
+
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+
+from .hdf5_session import HDF5Session
+from .models import SatelliteData
+from .processing import tile_budget_mb
+
+try:
+    import fcntl
+except ImportError:  # Windows: admission is not serialized across workers
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Whole-grid working set per pixel on top of two copies of the raw BT
+# values: the float32 BT grid, decoded lat/lon, band masks, raw and final
+# masks and component labels (~18 B/px measured for float32 input)
+WHOLE_GRID_BYTES_PER_PIXEL = 12
+
+# Tiled mode keeps the tile working set within its budget, but the
+# memory-mapped BT/mask outputs it renders from count towards RSS
+TILED_RESIDENT_BYTES_PER_PIXEL = 5
+
+# Recent jobs whose observed peaks calibrate the estimates, and the range
+# the correction factor is clamped to
+CALIBRATION_JOBS = 20
+CALIBRATION_RANGE = (0.5, 4.0)
+
+# Stored for a job whose header could not be read, so it is tried once
+UNKNOWN_ESTIMATE_MB = 0.0
+
+_LOCK_PATH = os.path.join(tempfile.gettempdir(), 'tcc-admission.lock')
+
+
+def scene_header(path):
+    """(rows, cols) and bytes per value of the scene's BT dataset, read from the header."""
+    with HDF5Session(path) as session:
+        return session.shape, session.itemsize
+
+
+def model_peak_mb(shape, itemsize, max_memory_mb=None):
+    """Uncalibrated peak memory estimate in MB for a scene, whole-grid or tiled."""
+    pixels = shape[0] * shape[1]
+    whole_grid = pixels * (WHOLE_GRID_BYTES_PER_PIXEL + 2 * itemsize) / 1024 / 1024
+    if max_memory_mb is None:
+        return whole_grid
+    return min(whole_grid, max_memory_mb + pixels * TILED_RESIDENT_BYTES_PER_PIXEL / 1024 / 1024)
+
+
+def estimate_job_mb(job):
+    """
+    Uncalibrated estimate for a job's input file, or None if its header is
+    unreadable or not local (GCS inputs are only downloaded once claimed).
+    """
+    if job.upload_source == 'gcs':
+        return None
+    try:
+        path = job.file_path.path
+        shape, itemsize = scene_header(path)
+        return model_peak_mb(shape, itemsize, tile_budget_mb(os.path.getsize(path)))
+    except Exception as e:
+        logger.warning('Could not estimate memory for job %s: %s', job.pk, e)
+        return None
+
+
+def ensure_estimate(job):
+    """
+    Fill in job.memory_estimate_mb from the file header if it has not been
+    tried yet; returns None when it is unknown.
+    """
+    if job.memory_estimate_mb is None and job.upload_source != 'gcs':
+        estimate = estimate_job_mb(job)
+        job.memory_estimate_mb = UNKNOWN_ESTIMATE_MB if estimate is None else estimate
+        SatelliteData.objects.filter(pk=job.pk).update(memory_estimate_mb=job.memory_estimate_mb)
+    return job.memory_estimate_mb or None
+
+
+def calibration_factor():
+    """
+    Largest observed/estimated peak ratio over recent jobs, clamped to
+    CALIBRATION_RANGE; 1.0 until a job has been measured.
+    """
+    runs = (SatelliteData.objects
+            .filter(peak_memory_mb__isnull=False, memory_estimate_mb__gt=0)
+            .order_by('-processing_end_time')
+            .values_list('peak_memory_mb', 'memory_estimate_mb')[:CALIBRATION_JOBS])
+    ratios = [peak / estimate for peak, estimate in runs]
+    if not ratios:
+        return 1.0
+    low, high = CALIBRATION_RANGE
+    return min(max(max(ratios), low), high)
+
+
+def worker_host(worker_id):
+    """Host part of a jobs.make_worker_id() identity."""
+    return worker_id.split(':', 1)[0]
+
+
+class MemoryAdmission:
+    """Admission decisions for one claim by one worker against its host's budget."""
+
+    def __init__(self, worker_id, budget_mb):
+        self.budget_mb = budget_mb
+        self.factor = calibration_factor()
+        running = SatelliteData.objects.filter(
+            status='processing',
+            lease_owner__startswith=f'{worker_host(worker_id)}:',
+            lease_expires_at__gte=timezone.now(),
+        ).values_list('memory_estimate_mb', flat=True)
+        self.reserved_mb = sum(self.cost_mb(estimate) for estimate in running)
+
+    def cost_mb(self, estimate_mb):
+        # Unknown sizes (unreadable or remote headers) cost a tiled budget
+        if not estimate_mb:
+            return settings.TCC_MAX_MEMORY_MB
+        return estimate_mb * self.factor
+
+    def admits(self, job):
+        cost = self.cost_mb(ensure_estimate(job))
+        if not self.reserved_mb or self.reserved_mb + cost <= self.budget_mb:
+            return True
+        logger.info('Job %s (%.0fMB) waits: %.0fMB of the %.0fMB budget in use',
+                    job.pk, cost, self.reserved_mb, self.budget_mb)
+        return False
+
+
+@contextmanager
+def host_lock():
+    """Serialize admission among the workers of this host."""
+    if fcntl is None:
+        yield
+        return
+    with open(_LOCK_PATH, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -6,7 +6,6 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 import json
 import random
-import threading
 
 from .models import SatelliteData, ProcessingLog
 from .serializers import (
@@ -16,7 +15,7 @@ from .serializers import (
     CloudAnalyticsSerializer,
     SystemStatusSerializer
 )
-from .processing import CloudDetectionProcessor
+from .jobs import enqueue_job
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser])
@@ -36,18 +35,8 @@ def upload_file(request):
             processing_status='pending'
         )
         
-        # Start processing in background
-        def process_file():
-            try:
-                processor = CloudDetectionProcessor(satellite_data)
-                processor.process()
-            except Exception as e:
-                satellite_data.processing_status = 'failed'
-                satellite_data.error_message = str(e)
-                satellite_data.save()
-        
-        thread = threading.Thread(target=process_file)
-        thread.start()
+        # Queue for the processing workers (manage.py run_workers)
+        enqueue_job(satellite_data)
         
         return Response({
             'message': 'File uploaded successfully',
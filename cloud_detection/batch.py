@@ -0,0 +1,237 @@
+"""
+Batch cloud detection over archives of INSAT-3DR L1B files.
+
+run_batch() runs extract_tcc_mask on every file in a directory (or matching
+a glob) across a ProcessPoolExecutor and appends one record per file, with
+its statistics and content hash, to a JSON-lines or CSV summary as results
+arrive. Files whose path, size and modification time match a successful
+record for the same parameters in the summary are skipped without being
+read, so an interrupted batch resumes where it stopped. Each file's outputs
+go to a directory named after its path below the source directory, so
+same-named files never overwrite each other. Nothing here needs the web app
+or its database; `manage.py tcc_batch` is the command-line front end.
+"""
+
+import csv
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from .checkpoints import file_digest
+from .insat_algorithm import extract_tcc_mask, parameters_fingerprint
+from .scene_stats import BTStats, CloudBTStats, GeoBounds, PixelCounts, scene_statistics
+
+INPUT_EXTENSIONS = ('.h5', '.hdf5')
+
+# Summary columns (CSV order); JSON-lines records carry the same keys
+SUMMARY_FIELDS = (
+    'file', 'size', 'mtime_ns', 'sha256', 'params_fingerprint', 'status', 'error',
+    'total_pixels', 'cloud_pixels', 'cloud_coverage_percentage', 'cloud_cluster_count',
+    'min_temperature', 'max_temperature', 'avg_temperature', 'cloud_min_temperature', 'cloud_avg_temperature',
+    'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude',
+    'seconds', 'bt_file', 'mask_file', 'plot_file',
+)
+
+
+def find_inputs(source):
+    """L1B files in a directory (not recursive) or matching a glob pattern, sorted."""
+    if os.path.isdir(source):
+        paths = (os.path.join(source, name) for name in os.listdir(source))
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(path for path in paths
+                  if os.path.isfile(path) and os.path.splitext(path)[1].lower() in INPUT_EXTENSIONS)
+
+
+def source_root(source):
+    """The directory input paths of source are named relative to: itself, or a glob's fixed prefix."""
+    if os.path.isdir(source):
+        return source
+    fixed = []
+    for part in os.path.normpath(source).split(os.sep)[:-1]:
+        if glob.has_magic(part):
+            break
+        fixed.append(part)
+    return os.sep.join(fixed) or (os.sep if os.path.isabs(source) else os.curdir)
+
+
+def output_subdir(path, root):
+    """Output directory name of an input: its path below root, extension included (x.h5 -> x_h5)."""
+    stem, extension = os.path.splitext(os.path.relpath(path, root))
+    return stem + extension.replace('.', '_')
+
+
+def file_key(path):
+    """(path, size, mtime_ns) of an input; a successful summary record with the same key skips it."""
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns
+
+
+def _summary_key(path, size, mtime_ns):
+    # CSV summaries read back every value as a string
+    return str(path), str(size), str(mtime_ns)
+
+
+def _builtin(value):
+    """json.dumps fallback for the numpy scalars in statistics."""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def summary_format(summary_path):
+    return 'csv' if summary_path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_summary(summary_path):
+    """Records already in a summary file (none if it does not exist)."""
+    if not os.path.exists(summary_path):
+        return []
+    with open(summary_path, newline='', encoding='utf-8') as f:
+        if summary_format(summary_path) == 'csv':
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class SummaryWriter:
+    """Appends records to a JSON-lines or CSV summary, flushing each one."""
+
+    def __init__(self, summary_path):
+        self.format = summary_format(summary_path)
+        directory = os.path.dirname(summary_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        new = not os.path.exists(summary_path) or os.path.getsize(summary_path) == 0
+        self.file = open(summary_path, 'a', newline='', encoding='utf-8')
+        if self.format == 'csv':
+            self.csv = csv.DictWriter(self.file, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+            if new:
+                self.csv.writeheader()
+
+    def write(self, record):
+        if self.format == 'csv':
+            self.csv.writerow(record)
+        else:
+            self.file.write(json.dumps(record, default=_builtin) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def process_file(path, size, mtime_ns, output_dir, parameters, fingerprint, max_memory_mb=None,
+                 tiled_threshold_mb=0, geo_cache_dir=None, persist='sync', make_plot=False):
+    """
+    Hash one file, detect TCCs in it and summarize it; runs in a pool
+    worker, with output_dir the file's own directory. Errors are reported in
+    the record (status 'error') rather than raised.
+    """
+    record = dict.fromkeys(SUMMARY_FIELDS)
+    record.update(file=path, size=size, mtime_ns=mtime_ns, params_fingerprint=fingerprint)
+    start = time.perf_counter()
+    try:
+        record['sha256'] = file_digest(path)
+        tiled = max_memory_mb is not None and size > tiled_threshold_mb * 1024 * 1024
+        result = extract_tcc_mask(
+            path, output_dir, **parameters,
+            max_memory_mb=max_memory_mb if tiled else None, make_plot=make_plot,
+            geo_cache_dir=geo_cache_dir, persist=persist, render_mode='fast')
+        # The extent comes from the geolocation pass unless it was skipped
+        bounds = result['extent'] is None and result['lat'] is not None
+        accumulators = [PixelCounts(), BTStats(), CloudBTStats()] + ([GeoBounds()] if bounds else [])
+        stats = scene_statistics(result['bt'], result['mask'], result['lat'] if bounds else None,
+                                 result['lon'] if bounds else None, accumulators)
+        if result['persist_future'] is not None:
+            result['persist_future'].result()
+    except Exception as e:
+        record.update(status='error', error=f'{type(e).__name__}: {e}',
+                      seconds=round(time.perf_counter() - start, 3))
+        return record
+
+    pixels, bt, cloud_bt = stats['pixels'], stats['bt'], stats['cloud_bt']
+    extent = stats.get('extent', result['extent'])
+    record.update(
+        status='ok',
+        total_pixels=pixels['total'],
+        cloud_pixels=pixels['cloud'],
+        cloud_coverage_percentage=round(100.0 * pixels['cloud'] / pixels['total'], 4) if pixels['total'] else None,
+        cloud_cluster_count=result['cluster_count'],
+        min_temperature=bt['min'], max_temperature=bt['max'], avg_temperature=bt['mean'],
+        cloud_min_temperature=cloud_bt['min'], cloud_avg_temperature=cloud_bt['mean'],
+        seconds=round(time.perf_counter() - start, 3),
+        bt_file=result['bt_file'], mask_file=result['mask_file'], plot_file=result['plot_file'],
+    )
+    if extent is not None:
+        lon_min, lon_max, lat_min, lat_max = (float(value) for value in extent)
+        record.update(min_latitude=lat_min, max_latitude=lat_max, min_longitude=lon_min, max_longitude=lon_max)
+    return record
+
+
+def run_batch(source, output_dir, summary_path=None, workers=None, parameters=None, max_memory_mb=None,
+              tiled_threshold_mb=0, geo_cache_dir=None, persist='sync', make_plot=False, reprocess=False,
+              progress=None):
+    """
+    Process the L1B files of source (a directory or glob) with workers
+    processes (default: one per CPU), writing BT/mask arrays (and plots,
+    with make_plot) under output_dir and records to summary_path (default
+    output_dir/summary.jsonl; a .csv name selects CSV). parameters are
+    extract_tcc_mask keyword arguments (min_radius_km, ...). With
+    max_memory_mb, files above tiled_threshold_mb use the tiled engine.
+    progress(record, skipped) is called for every file. Returns counts of
+    files processed, skipped and failed with the run's throughput.
+    """
+    parameters = dict(parameters or {})
+    fingerprint = parameters_fingerprint(**parameters)
+    summary_path = summary_path or os.path.join(output_dir, 'summary.jsonl')
+    done = set()
+    if not reprocess:
+        done = {_summary_key(record.get('file'), record.get('size'), record.get('mtime_ns'))
+                for record in read_summary(summary_path)
+                if record.get('status') == 'ok' and record.get('params_fingerprint') == fingerprint}
+
+    start = time.perf_counter()
+    report = {'files': 0, 'processed': 0, 'skipped': 0, 'failed': 0}
+    root = source_root(source)
+    pending = []
+    for path in find_inputs(source):
+        report['files'] += 1
+        key = file_key(path)
+        if _summary_key(*key) in done:
+            report['skipped'] += 1
+            if progress:
+                progress({'file': path, 'status': 'skipped'}, True)
+            continue
+        pending.append(key)
+
+    os.makedirs(output_dir, exist_ok=True)
+    with SummaryWriter(summary_path) as summary:
+        if pending:
+            # Spawned workers do not inherit the caller's threads or connections
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=get_context('spawn')) as pool:
+                futures = [
+                    pool.submit(process_file, path, size, mtime_ns,
+                                os.path.join(output_dir, output_subdir(path, root)), parameters, fingerprint,
+                                max_memory_mb, tiled_threshold_mb, geo_cache_dir, persist, make_plot)
+                    for path, size, mtime_ns in pending
+                ]
+                for future in as_completed(futures):
+                    record = future.result()
+                    summary.write(record)
+                    report['processed' if record['status'] == 'ok' else 'failed'] += 1
+                    if progress:
+                        progress(record, False)
+
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    finished = report['processed'] + report['failed']
+    report['files_per_minute'] = round(60.0 * finished / report['seconds'], 2) if report['seconds'] else 0.0
+    report['summary'] = summary_path
+    return report
@@ -0,0 +1,278 @@
+"""
+Synthetic INSAT-3DR scenes and micro-benchmarks for the TCC algorithm.
+Used by the benchmark_tcc management command and the test suite.
+"""
+
+import time
+import numpy as np
+import h5py
+
+# Full-disk TIR1 grid size for INSAT-3DR L1B products
+FULL_DISK_SHAPE = (2816, 2805)
+
+LATLON_SCALE_FACTOR = 0.01
+LATLON_FILL_VALUE = 32767
+BT_FILL_VALUE = -999
+
+
+def make_synthetic_scene(shape=FULL_DISK_SHAPE, n_small=4000, n_large=40, seed=0):
+    """
+    Build a synthetic full-disk scene as (bt, lat_raw, lon_raw).
+
+    bt is float32 with -999 off the Earth disk; lat_raw/lon_raw are int16
+    grids scaled by 0.01 with 32767 as the fill value, matching the layout
+    read by extract_tcc_mask. The scene holds many small cold blobs (busy
+    monsoon convection) plus a few large clusters that survive filtering.
+    """
+    rng = np.random.default_rng(seed)
+    rows, cols = shape
+
+    y = np.linspace(-1.0, 1.0, rows, dtype=np.float32)[:, None]
+    x = np.linspace(-1.0, 1.0, cols, dtype=np.float32)[None, :]
+    on_disk = (x ** 2 + y ** 2) <= 0.95 ** 2
+
+    lat = np.broadcast_to(-y * 81.0, shape)
+    lon = np.broadcast_to(74.0 + x * 81.0, shape)
+    lat_raw = np.where(on_disk, np.round(lat / LATLON_SCALE_FACTOR), LATLON_FILL_VALUE).astype(np.int16)
+    lon_raw = np.where(on_disk, np.round(lon / LATLON_SCALE_FACTOR), LATLON_FILL_VALUE).astype(np.int16)
+
+    bt = rng.normal(285.0, 6.0, size=shape).astype(np.float32)
+
+    # Convection is concentrated in the tropical band, which is where the
+    # algorithm looks (|lat| <= 30 maps to the middle ~37% of rows).
+    band_top = int(rows * (0.5 - 30.0 / 162.0))
+    band_bottom = int(rows * (0.5 + 30.0 / 162.0))
+
+    def stamp(count, radius_range):
+        for _ in range(count):
+            r = int(rng.integers(*radius_range))
+            cy = int(rng.integers(max(r, band_top), min(rows - r, band_bottom)))
+            cx = int(rng.integers(r, cols - r))
+            yy, xx = np.ogrid[-r:r + 1, -r:r + 1]
+            blob = (yy ** 2 + xx ** 2) <= r ** 2
+            window = bt[cy - r:cy + r + 1, cx - r:cx + r + 1]
+            window[blob] = rng.uniform(195.0, 215.0)
+
+    stamp(n_small, (6, 10))
+    stamp(n_large, (25, 60))
+
+    bt[~on_disk] = BT_FILL_VALUE
+    return bt, lat_raw, lon_raw
+
+
+def write_synthetic_h5(path, shape=FULL_DISK_SHAPE, **scene_kwargs):
+    """Write a synthetic scene to an HDF5 file laid out like an L1B product."""
+    bt, lat_raw, lon_raw = make_synthetic_scene(shape=shape, **scene_kwargs)
+    with h5py.File(path, 'w') as f:
+        f.create_dataset('TIR1_BT', data=bt[np.newaxis, :, :])
+        for name, data in (('Latitude', lat_raw), ('Longitude', lon_raw)):
+            ds = f.create_dataset(name, data=data)
+            ds.attrs['scale_factor'] = np.float32(LATLON_SCALE_FACTOR)
+            ds.attrs['_FillValue'] = np.int16(LATLON_FILL_VALUE)
+    return path
+
+
+def filter_regions_loop(label_img, min_radius_km, pixel_resolution_km):
+    """Reference per-region implementation the vectorized filter replaced."""
+    from skimage.measure import regionprops
+
+    final_mask = np.zeros(label_img.shape, dtype=np.uint8)
+    for region in regionprops(label_img):
+        area = region.area
+        equiv_radius_km = np.sqrt(area / np.pi) * pixel_resolution_km
+        if equiv_radius_km >= min_radius_km:
+            coords = region.coords
+            final_mask[coords[:, 0], coords[:, 1]] = 1
+    return final_mask
+
+
+def filter_regions_by_radius(label_img, min_radius_km, pixel_resolution_km):
+    """
+    Keep labelled regions whose equivalent radius is at least min_radius_km.
+    All region areas come from one bincount over the label image and the
+    keep-set is applied as a lookup table, so the mask is built in a single
+    indexing step instead of one write per region. filter_tcc_components
+    fuses this into its single labelling; this is the two-labelling baseline.
+    """
+    areas = np.bincount(label_img.ravel())
+    equiv_radius_km = np.sqrt(areas / np.pi) * pixel_resolution_km
+    keep = (equiv_radius_km >= min_radius_km).astype(np.uint8)
+    keep[0] = 0  # background
+    return keep[label_img]
+
+
+def _best_of(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _synthetic_raw_mask(shape, n_small, seed):
+    bt, lat_raw, _ = make_synthetic_scene(shape=shape, n_small=n_small, seed=seed)
+    lat = lat_raw.astype(np.float32) * LATLON_SCALE_FACTOR
+    lat[lat_raw == LATLON_FILL_VALUE] = np.nan
+    bt = np.where(bt == BT_FILL_VALUE, np.nan, bt)
+    return (((lat >= 0) & (lat <= 30) & (bt < 218)) |
+            ((lat < 0) & (lat >= -30) & (bt < 221)))
+
+
+def legacy_filter_pipeline(raw_mask, min_size_pixels, min_radius_km, pixel_resolution_km):
+    """Reference remove_small_objects + label + per-region loop pipeline."""
+    from skimage.morphology import remove_small_objects
+    from skimage.measure import label
+
+    label_img = label(remove_small_objects(raw_mask, min_size=min_size_pixels))
+    return filter_regions_loop(label_img, min_radius_km, pixel_resolution_km), int(label_img.max())
+
+
+def benchmark_region_filter(shape=FULL_DISK_SHAPE, repeat=3, min_radius_km=111,
+                            pixel_resolution_km=4.0, min_size_pixels=100, n_small=4000, seed=0):
+    """
+    Time the morphological filtering stage on a synthetic scene three ways:
+    the legacy per-region loop, the bincount/lookup-table radius filter on
+    the same two labellings, and the fused single-labelling pipeline.
+    All three masks are checked for equality.
+    """
+    from skimage.morphology import remove_small_objects
+    from skimage.measure import label
+    from .insat_algorithm import filter_tcc_components
+
+    raw_mask = _synthetic_raw_mask(shape, n_small, seed)
+    label_img = label(remove_small_objects(raw_mask, min_size=min_size_pixels))
+
+    def vectorized():
+        labels = label(remove_small_objects(raw_mask, min_size=min_size_pixels))
+        return filter_regions_by_radius(labels, min_radius_km, pixel_resolution_km)
+
+    loop_s, (loop_mask, _) = _best_of(
+        lambda: legacy_filter_pipeline(raw_mask, min_size_pixels, min_radius_km, pixel_resolution_km), repeat)
+    vector_s, vector_mask = _best_of(vectorized, repeat)
+    fused_s, (fused_mask, _) = _best_of(
+        lambda: filter_tcc_components(raw_mask, min_size_pixels, min_radius_km, pixel_resolution_km), repeat)
+
+    return {
+        'shape': shape,
+        'regions': int(label_img.max()),
+        'loop_seconds': loop_s,
+        'vectorized_seconds': vector_s,
+        'fused_seconds': fused_s,
+        'speedup': loop_s / vector_s if vector_s else float('inf'),
+        'fused_speedup': loop_s / fused_s if fused_s else float('inf'),
+        'identical': bool(np.array_equal(loop_mask, vector_mask) and np.array_equal(loop_mask, fused_mask)),
+    }
+
+
+def legacy_scene_statistics(bt, mask, lat, lon):
+    """Reference multi-pass statistics the chunked kernel replaced."""
+    valid_bt = bt[~np.isnan(bt)]
+    return {
+        'cloud_pixels': int(np.sum(mask)),
+        'bt': (float(np.min(valid_bt)), float(np.max(valid_bt)), float(np.mean(valid_bt)), valid_bt.size),
+        'extent': [float(np.nanmin(lon)), float(np.nanmax(lon)), float(np.nanmin(lat)), float(np.nanmax(lat))],
+    }
+
+
+def benchmark_scene_statistics(shape=FULL_DISK_SHAPE, repeat=3, seed=0):
+    """
+    Time the statistics stage on a synthetic scene: the legacy separate
+    full-array passes against the single chunked pass of scene_statistics
+    (same outputs plus cloud-only BT, which the legacy code did not have).
+    """
+    from .scene_stats import BTStats, CloudBTStats, GeoBounds, PixelCounts, scene_statistics
+
+    bt, lat_raw, lon_raw = make_synthetic_scene(shape=shape, seed=seed)
+    bt = np.where(bt == BT_FILL_VALUE, np.nan, bt)
+    mask = (bt < 218).astype(np.uint8)
+    lat = np.where(lat_raw == LATLON_FILL_VALUE, np.nan, lat_raw * np.float32(LATLON_SCALE_FACTOR))
+    lon = np.where(lon_raw == LATLON_FILL_VALUE, np.nan, lon_raw * np.float32(LATLON_SCALE_FACTOR))
+
+    legacy_s, legacy = _best_of(lambda: legacy_scene_statistics(bt, mask, lat, lon), repeat)
+    fused_s, fused = _best_of(
+        lambda: scene_statistics(bt, mask, lat, lon, [PixelCounts(), BTStats(), CloudBTStats(), GeoBounds()]),
+        repeat)
+
+    bt_stats = fused['bt']
+    identical = (legacy['cloud_pixels'] == fused['pixels']['cloud']
+                 and legacy['bt'][:2] == (bt_stats['min'], bt_stats['max'])
+                 and legacy['bt'][3] == bt_stats['count']
+                 and np.isclose(legacy['bt'][2], bt_stats['mean'])
+                 and np.allclose(legacy['extent'], fused['extent']))
+    return {
+        'shape': shape,
+        'legacy_seconds': legacy_s,
+        'fused_seconds': fused_s,
+        'speedup': legacy_s / fused_s if fused_s else float('inf'),
+        'identical': bool(identical),
+    }
+
+
+def _rss_high_water_kb():
+    """
+    Peak RSS of this process in KB. VmHWM is used where available because
+    ru_maxrss survives exec and would report the spawning parent's peak.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _peak_rss_run(filename, output_dir, max_memory_mb):
+    """Run extract_tcc_mask in a fresh process and report its RSS high-water mark."""
+    from .insat_algorithm import extract_tcc_mask
+
+    baseline_kb = _rss_high_water_kb()
+    start = time.perf_counter()
+    result = extract_tcc_mask(filename, output_dir, max_memory_mb=max_memory_mb, make_plot=False)
+    elapsed = time.perf_counter() - start
+    peak_kb = _rss_high_water_kb()
+    return {
+        'baseline_mb': baseline_kb / 1024,
+        'peak_mb': peak_kb / 1024,
+        'seconds': elapsed,
+        'mask_file': result['mask_file'],
+        'cluster_count': result['cluster_count'],
+    }
+
+
+def benchmark_tiled_memory(shape=FULL_DISK_SHAPE, budgets_mb=(256, 64, 16), seed=0):
+    """
+    Compare peak RSS of whole-grid processing against the tiled engine at
+    several memory budgets. Every run happens in its own spawned process so
+    high-water marks do not leak between runs; masks are checked for parity.
+    """
+    import multiprocessing
+    import os
+    import shutil
+    import tempfile
+
+    workdir = tempfile.mkdtemp(prefix='tcc_bench_')
+    try:
+        h5_path = write_synthetic_h5(os.path.join(workdir, 'synthetic_L1B.h5'), shape=shape, seed=seed)
+        ctx = multiprocessing.get_context('spawn')
+        runs = []
+        for budget in (None,) + tuple(budgets_mb):
+            out_dir = os.path.join(workdir, f'out_{budget or "full"}')
+            with ctx.Pool(1) as pool:
+                run = pool.apply(_peak_rss_run, (h5_path, out_dir, budget))
+            run['budget_mb'] = budget
+            runs.append(run)
+
+        reference = np.load(runs[0]['mask_file'])
+        for run in runs:
+            run['identical'] = bool(np.array_equal(np.load(run['mask_file']), reference)
+                                    and run['cluster_count'] == runs[0]['cluster_count'])
+            del run['mask_file']
+        return runs
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
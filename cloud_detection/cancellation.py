@@ -0,0 +1,46 @@
+"""
+Cooperative cancellation of processing jobs.
+
+A job runs with a CancelToken. The pipeline calls token.check() at its
+cancellation points (between stages, between the row tiles of the tiled
+engine and between statistics chunks), which raises JobCancelled once the
+token has been cancelled. The worker's watchdog (see jobs.JobWatchdog)
+cancels the token when a user asks for the job to be cancelled or when the
+job exceeds its wall-clock budget.
+"""
+
+import threading
+
+
+class JobCancelled(Exception):
+    """A job was stopped at a cancellation point."""
+
+    def __init__(self, reason, timed_out=False):
+        super().__init__(reason)
+        self.reason = reason
+        self.timed_out = timed_out
+
+
+class CancelToken:
+    """Set once, from any thread; checked by the job's own thread."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = None
+        self.timed_out = False
+
+    def cancel(self, reason, timed_out=False):
+        """Cancel the job; the first reason given is kept."""
+        if not self._event.is_set():
+            self.reason = reason
+            self.timed_out = timed_out
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """Cancellation point: raises JobCancelled if the job was cancelled."""
+        if self._event.is_set():
+            raise JobCancelled(self.reason, self.timed_out)
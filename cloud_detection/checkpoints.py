@@ -0,0 +1,106 @@
+"""
+Stage checkpoints of processing jobs.
+
+Each job's output directory holds manifest.json, recording the pipeline
+stages that completed: the artifacts each wrote (path, size and SHA-256)
+and the small results it produced. A retry loads the manifest and skips
+every stage whose artifacts still match, so a job that failed while saving
+thumbnails does not download and label its scene again. The manifest is
+keyed by the job's input and algorithm parameters; a different key (the
+input or the parameters changed) starts from scratch.
+"""
+
+import hashlib
+import json
+import os
+
+from django.utils import timezone
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# Bytes hashed at a time when validating artifacts
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _builtin(value):
+    """json.dump fallback for numpy scalars and arrays in stage results."""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class StageManifest:
+    """The completed stages of one job, persisted in its output directory."""
+
+    def __init__(self, directory, key):
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.key = key
+        self.stages = {}
+        # Stages whose artifacts were already checked by this process
+        self._validated = set()
+
+    @classmethod
+    def load(cls, directory, key):
+        """The manifest in directory if it was written for key, else an empty one."""
+        manifest = cls(directory, key)
+        try:
+            with open(manifest.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if saved.get('version') == MANIFEST_VERSION and saved.get('key') == key:
+            manifest.stages = saved.get('stages', {})
+        return manifest
+
+    def completed(self, stage):
+        """
+        {'artifacts': {name: path}, 'data': {...}} of a completed stage whose
+        artifacts are all intact, else None (a stage with a damaged artifact
+        is forgotten).
+        """
+        entry = self.stages.get(stage)
+        if entry is None:
+            return None
+        if stage not in self._validated:
+            for artifact in entry['artifacts'].values():
+                path = artifact['path']
+                if (not os.path.isfile(path) or os.path.getsize(path) != artifact['size']
+                        or file_digest(path) != artifact['sha256']):
+                    del self.stages[stage]
+                    self.save()
+                    return None
+            self._validated.add(stage)
+        return {
+            'artifacts': {name: artifact['path'] for name, artifact in entry['artifacts'].items()},
+            'data': entry['data'],
+        }
+
+    def record(self, stage, artifacts=None, **data):
+        """Mark stage complete with its artifact files ({name: path}) and results."""
+        self.stages[stage] = {
+            'artifacts': {
+                name: {'path': path, 'size': os.path.getsize(path), 'sha256': file_digest(path)}
+                for name, path in (artifacts or {}).items()
+            },
+            'data': data,
+            'completed_at': timezone.now().isoformat(),
+        }
+        self._validated.add(stage)
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        partial = f'{self.path}.{os.getpid()}.tmp'
+        with open(partial, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'key': self.key, 'stages': self.stages}, f,
+                      default=_builtin, indent=1)
+        os.replace(partial, self.path)
@@ -0,0 +1,238 @@
+"""
+Resumable chunked uploads for large scenes.
+
+A client opens an UploadSession for a file, PUTs its numbered chunks in any
+order (several at once), asks which byte ranges have arrived to resume
+after a dropped connection, and finalizes. Each chunk is written in place
+at its offset in a preallocated staging file under
+MEDIA_ROOT/upload_sessions/<id>/, one block at a time, and a marker file
+records it once it is on disk, so nothing is ever assembled in memory.
+Chunk 0 is checked for the HDF5 signature as it arrives. Finalizing hashes
+the staged file in one streaming pass, moves it into uploads/ (a rename on
+local storage) and submits it to the job queue like any other upload.
+"""
+
+import hashlib
+import os
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+
+from .dedup import save_upload
+from .forms import ALLOWED_EXTENSIONS, MAX_UPLOAD_SIZE
+from .jobs import submit_job
+from .models import SatelliteData, UploadSession
+from .upload_handlers import (
+    SIGNATURE_OFFSETS, SUPERBLOCK_CHECK_BYTES, InvalidUpload, check_hdf5_header, create_in_storage,
+    has_local_paths, upload_name,
+)
+
+SESSION_DIR = 'upload_sessions'
+
+# Chunk sizes clients may choose, and the default
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Bytes read from the request or the staged file at a time
+BLOCK_SIZE = 1024 * 1024
+
+# Enough of the file to find the superblock behind any user block
+HEADER_BYTES = SIGNATURE_OFFSETS[-1] + SUPERBLOCK_CHECK_BYTES
+
+
+class UploadError(ValueError):
+    """A request that does not fit the upload session."""
+
+
+def session_dir(upload):
+    return os.path.join(settings.MEDIA_ROOT, SESSION_DIR, str(upload.pk))
+
+
+def _data_path(upload):
+    return os.path.join(session_dir(upload), 'data')
+
+
+def _chunks_dir(upload):
+    return os.path.join(session_dir(upload), 'chunks')
+
+
+def create_session(user, file_name, file_size, chunk_size=None, satellite_name='INSAT', data_type='HDF5'):
+    """Open an upload session with a preallocated (sparse) staging file."""
+    discard_expired_sessions()
+    file_name = os.path.basename(file_name or '')
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise UploadError(f"File type {extension or '(none)'} is not supported")
+    if not 0 < file_size <= MAX_UPLOAD_SIZE:
+        raise UploadError(f"File size must be between 1 byte and {MAX_UPLOAD_SIZE // 1024 // 1024}MB")
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise UploadError(f"chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes")
+
+    upload = UploadSession.objects.create(
+        user=user, file_name=file_name, file_size=file_size, chunk_size=chunk_size,
+        satellite_name=satellite_name or 'INSAT', data_type=data_type or 'HDF5')
+    os.makedirs(_chunks_dir(upload))
+    with open(_data_path(upload), 'wb') as f:
+        f.truncate(file_size)
+    return upload
+
+
+def chunk_range(upload, index):
+    """[start, end) byte range of chunk index."""
+    if not 0 <= index < upload.chunk_count:
+        raise UploadError(f"Chunk index must be between 0 and {upload.chunk_count - 1}")
+    start = index * upload.chunk_size
+    return start, min(start + upload.chunk_size, upload.file_size)
+
+
+def write_chunk(upload, index, stream, content_length):
+    """Write chunk index from stream (e.g. the request) at its offset in the staging file."""
+    if upload.state != 'open':
+        raise UploadError(f"Upload is {upload.state}")
+    start, end = chunk_range(upload, index)
+    if content_length != end - start:
+        raise UploadError(f"Chunk {index} must be {end - start} bytes, got {content_length}")
+
+    with open(_data_path(upload), 'r+b') as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            block = stream.read(min(BLOCK_SIZE, end - position))
+            if not block:
+                raise UploadError(f"Chunk {index} ended after {position - start} of {end - start} bytes")
+            if position == 0:
+                _check_header(upload, block)
+            f.write(block)
+            position += len(block)
+        f.flush()
+        os.fsync(f.fileno())
+    open(os.path.join(_chunks_dir(upload), str(index)), 'w').close()
+
+
+def _check_header(upload, head):
+    """Reject a file whose first bytes are not HDF5; the session is discarded."""
+    try:
+        check_hdf5_header(head, complete=len(head) == upload.file_size)
+    except InvalidUpload as e:
+        abort_session(upload)
+        raise UploadError(f"{upload.file_name}: {e}") from e
+
+
+def received_chunks(upload):
+    try:
+        return sorted(int(name) for name in os.listdir(_chunks_dir(upload)))
+    except FileNotFoundError:
+        return []
+
+
+def received_ranges(upload):
+    """Received bytes as merged [start, end) ranges."""
+    ranges = []
+    for index in received_chunks(upload):
+        start, end = chunk_range(upload, index)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def upload_status(upload):
+    received = received_chunks(upload)
+    return {
+        'upload_id': str(upload.pk),
+        'file_name': upload.file_name,
+        'file_size': upload.file_size,
+        'chunk_size': upload.chunk_size,
+        'chunk_count': upload.chunk_count,
+        'state': upload.state,
+        'received_chunks': received,
+        'received_ranges': received_ranges(upload),
+        'missing_chunks': sorted(set(range(upload.chunk_count)) - set(received)),
+        'data_id': upload.satellite_data_id,
+    }
+
+
+def finalize(upload):
+    """
+    Move the complete file into uploads/, create its SatelliteData record
+    and submit it for processing. Finalizing a completed session again
+    returns the same record.
+    """
+    if upload.state == 'complete':
+        return upload.satellite_data
+    missing = sorted(set(range(upload.chunk_count)) - set(received_chunks(upload)))
+    if missing:
+        raise UploadError(f"{len(missing)} chunks missing, starting with {missing[:10]}")
+    if not UploadSession.objects.filter(pk=upload.pk, state='open').update(
+            state='finalizing', updated_at=timezone.now()):
+        raise UploadError("Upload is already being finalized")
+
+    try:
+        file_path, content_sha256 = _store(upload)
+    except InvalidUpload as e:
+        abort_session(upload)
+        raise UploadError(f"{upload.file_name}: {e}") from e
+    except Exception:
+        UploadSession.objects.filter(pk=upload.pk).update(state='open', updated_at=timezone.now())
+        raise
+
+    satellite_data = SatelliteData.objects.create(
+        uploaded_by=upload.user, file_name=upload.file_name, file_path=file_path,
+        file_size=upload.file_size, satellite_name=upload.satellite_name, data_type=upload.data_type,
+        content_sha256=content_sha256,
+    )
+    upload.state = 'complete'
+    upload.satellite_data = satellite_data
+    upload.save(update_fields=['state', 'satellite_data'])
+    shutil.rmtree(session_dir(upload), ignore_errors=True)
+    submit_job(satellite_data)
+    return satellite_data
+
+
+def _store(upload):
+    """Move the staged file into storage; returns (storage name, SHA-256 hex digest)."""
+    data_path = _data_path(upload)
+    with open(data_path, 'rb') as f:
+        check_hdf5_header(f.read(HEADER_BYTES), complete=True)
+        if not has_local_paths(default_storage):
+            f.seek(0)
+            return save_upload(File(f, name=upload.file_name), upload_name(upload.file_name))
+        f.seek(0)
+        sha256 = hashlib.sha256()
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            sha256.update(block)
+
+    name, placeholder = create_in_storage(default_storage, upload_name(upload.file_name))
+    placeholder.close()
+    path = default_storage.path(name)
+    os.replace(data_path, path)
+    if default_storage.file_permissions_mode is not None:
+        os.chmod(path, default_storage.file_permissions_mode)
+    return name, sha256.hexdigest()
+
+
+def abort_session(upload):
+    """Delete a session and its staged data."""
+    shutil.rmtree(session_dir(upload), ignore_errors=True)
+    UploadSession.objects.filter(pk=upload.pk).delete()
+
+
+def discard_expired_sessions():
+    """
+    Remove sessions older than UPLOAD_SESSION_TTL_HOURS, with any staged
+    data. A session being finalized is left alone unless it has been
+    finalizing that long too, i.e. the process finalizing it died.
+    """
+    cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    expired = UploadSession.objects.filter(created_at__lt=cutoff).filter(
+        ~Q(state='finalizing') | Q(updated_at__lt=cutoff))
+    for upload in expired:
+        abort_session(upload)
@@ -0,0 +1,105 @@
+"""
+Content-hash deduplication of uploads.
+
+Uploads are hashed (SHA-256) as they are written to storage. A record
+whose hash and algorithm parameters fingerprint match a completed job is
+linked to that job's input file, artifacts and statistics instead of being
+processed again, and its own copy of the input is removed. Files shared
+this way are only deleted with the last record that references them (see
+SatelliteData.delete).
+"""
+
+import hashlib
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .models import ProcessingLog, SatelliteData
+
+# Statistics and metadata copied from the job whose result is reused
+RESULT_FIELDS = (
+    'total_pixels', 'cloud_pixels', 'cloud_coverage_percentage', 'cloud_cluster_count',
+    'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude',
+    'min_temperature', 'max_temperature', 'avg_temperature',
+    'location_name', 'weather_conditions', 'params_fingerprint',
+)
+
+# Artifact files shared with the job whose result is reused
+ARTIFACT_FIELDS = (
+    'brightness_temperature_plot', 'cloud_mask_plot', 'processed_data_file',
+    'thumbnail_image', 'thumbnail_small', 'thumbnail_retina',
+)
+
+
+class HashingFile(File):
+    """Wraps an upload so that the storage backend's chunked write also hashes it."""
+
+    def __init__(self, uploaded_file):
+        super().__init__(uploaded_file, name=uploaded_file.name)
+        self.sha256 = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in self.file.chunks(chunk_size):
+            self.sha256.update(chunk)
+            yield chunk
+
+
+def save_upload(uploaded_file, name, storage=None):
+    """
+    Write an upload to storage under name; returns (saved name, SHA-256 hex
+    digest). Uploads that upload_handlers.StreamingUploadHandler already
+    wrote and hashed are only marked as taken (and their handle closed).
+    """
+    storage = storage or default_storage
+    if getattr(uploaded_file, 'storage_name', None):
+        uploaded_file.committed = True
+        uploaded_file.close()
+        return uploaded_file.storage_name, uploaded_file.sha256
+    if getattr(uploaded_file, 'sha256', None):
+        return storage.save(name, uploaded_file), uploaded_file.sha256
+    content = HashingFile(uploaded_file)
+    saved_name = storage.save(name, content)
+    return saved_name, content.sha256.hexdigest()
+
+
+def find_reusable_result(satellite_data, fingerprint):
+    """The original completed job with the same content and parameters, or None."""
+    if not satellite_data.content_sha256:
+        return None
+    matches = (SatelliteData.objects
+               .filter(status='completed', content_sha256=satellite_data.content_sha256,
+                       params_fingerprint=fingerprint)
+               .exclude(pk=satellite_data.pk)
+               .order_by('-processing_end_time'))
+    original = matches.filter(reused_from__isnull=True).first()
+    if original is not None:
+        return original
+    # Only links are left (their original was reprocessed); share their files
+    return matches.first()
+
+
+def reuse_result(satellite_data, donor):
+    """Complete satellite_data with donor's input, artifacts and statistics."""
+    own_copy = satellite_data.file_path.name
+    for field in RESULT_FIELDS + ARTIFACT_FIELDS:
+        setattr(satellite_data, field, getattr(donor, field))
+    satellite_data.file_path = donor.file_path.name
+    satellite_data.reused_from = donor
+    satellite_data.stage_timings = None
+    satellite_data.memory_profile = None
+    satellite_data.status = 'completed'
+    satellite_data.error_message = None
+    satellite_data.processing_start_time = satellite_data.processing_end_time = timezone.now()
+    # Not a full save: a running job's lease and cancel flag change concurrently
+    satellite_data.save(update_fields=RESULT_FIELDS + ARTIFACT_FIELDS + (
+        'file_path', 'reused_from', 'stage_timings', 'memory_profile', 'status', 'error_message',
+        'processing_start_time', 'processing_end_time'))
+
+    if own_copy and own_copy != donor.file_path.name:
+        default_storage.delete(own_copy)
+    ProcessingLog.objects.create(
+        satellite_data=satellite_data, level='info',
+        message=f'Identical file already processed as job {donor.pk}; reused its results',
+    )
+    return satellite_data
@@ -2,6 +2,11 @@ from django import forms
 from .models import SatelliteData
 import os
 
+# Largest accepted upload and the accepted file extensions
+MAX_UPLOAD_SIZE = 500 * 1024 * 1024
+ALLOWED_EXTENSIONS = ['.h5', '.hdf5', '.nc', '.netcdf']
+
+
 class SatelliteDataForm(forms.ModelForm):
     """Form for uploading satellite data files"""
     
@@ -34,14 +39,13 @@ class SatelliteDataForm(forms.ModelForm):
         
         if file:
             # Check file size (500MB limit)
-            if file.size > 500 * 1024 * 1024:
+            if file.size > MAX_UPLOAD_SIZE:
                 raise forms.ValidationError("File size cannot exceed 500MB.")
             
             # Check file extension
-            allowed_extensions = ['.h5', '.hdf5', '.nc', '.netcdf']
             file_extension = os.path.splitext(file.name)[1].lower()
             
-            if file_extension not in allowed_extensions:
+            if file_extension not in ALLOWED_EXTENSIONS:
                 raise forms.ValidationError(
                     f"File type not supported. Please upload HDF5 (.h5, .hdf5) or NetCDF (.nc, .netcdf) files. "
                     f"Current file extension: {file_extension}"
@@ -0,0 +1,259 @@
+"""
+Geolocation grids for INSAT-3DR L1B files.
+
+INSAT-3DR is geostationary, so the Latitude/Longitude grids are the same for
+every scan. GeolocationCache decodes them once and keeps the float32 grids,
+the NIO/SIO band masks, the tropical window and the geographic extent as
+.npy/.json files that every worker process memory-maps instead of decoding.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Latitude limit of the NIO/SIO bands thresholded by the TCC algorithm
+TROPICAL_BAND_DEG = 30
+
+# Bump when the on-disk layout or the decoding changes
+CACHE_VERSION = 1
+
+# Rows of each raw grid hashed into the fingerprint
+FINGERPRINT_SAMPLE_ROWS = 64
+
+# Rows decoded per block when building a cache entry
+BUILD_BLOCK_ROWS = 256
+
+
+def decode_geolocation(dataset, window=np.s_[:, :]):
+    """Read a Latitude/Longitude grid (or a window of it) as float32 degrees."""
+    raw = dataset[window].astype(np.float32)
+    values = raw * dataset.attrs['scale_factor']
+    values[raw == dataset.attrs['_FillValue']] = np.nan
+    return values
+
+
+def band_masks(lat):
+    """North (0-30N) and south (0-30S) Indian Ocean band masks for a latitude grid."""
+    nio_band = (lat >= 0) & (lat <= TROPICAL_BAND_DEG)
+    sio_band = (lat < 0) & (lat >= -TROPICAL_BAND_DEG)
+    return nio_band, sio_band
+
+
+def window_from_hits(row_hits, col_hits):
+    """Bounding box (as a pair of slices) of the rows and columns flagged True."""
+    rows = np.flatnonzero(row_hits)
+    cols = np.flatnonzero(col_hits)
+    if not rows.size:
+        return np.s_[0:0, 0:0]
+    return np.s_[int(rows[0]):int(rows[-1]) + 1, int(cols[0]):int(cols[-1]) + 1]
+
+
+class ExtentAccumulator:
+    """Running nanmin/nanmax of lat/lon, fed one row block at a time."""
+
+    def __init__(self):
+        self.lat = None
+        self.lon = None
+
+    @staticmethod
+    def _fold(current, values):
+        # fmin/fmax skip NaN in one pass each; the result is NaN only when
+        # every value is
+        low = float(np.fmin.reduce(values, axis=None))
+        high = float(np.fmax.reduce(values, axis=None))
+        if np.isnan(low):
+            return current
+        if current is None:
+            return [low, high]
+        return [min(current[0], low), max(current[1], high)]
+
+    def update(self, lat, lon):
+        self.lat = self._fold(self.lat, lat)
+        self.lon = self._fold(self.lon, lon)
+
+    def extent(self):
+        """[lon_min, lon_max, lat_min, lat_max], or None without valid coordinates."""
+        if self.lat is None or self.lon is None:
+            return None
+        return self.lon + self.lat
+
+
+class GeolocationGrid:
+    """Decoded lat/lon grids plus the values derived from them."""
+
+    def __init__(self, lat, lon, nio_band, sio_band, window, extent, fingerprint=None):
+        self.lat = lat
+        self.lon = lon
+        self.nio_band = nio_band
+        self.sio_band = sio_band
+        self.window = window
+        self.extent = extent
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def decode(cls, f):
+        """Decode the grids of an open HDF5 file in memory."""
+        lat = decode_geolocation(f['Latitude'])
+        lon = decode_geolocation(f['Longitude'])
+        nio_band, sio_band = band_masks(lat)
+        tropical = nio_band | sio_band
+        window = window_from_hits(tropical.any(axis=1), tropical.any(axis=0))
+        extent = ExtentAccumulator()
+        extent.update(lat, lon)
+        return cls(lat, lon, nio_band, sio_band, window, extent.extent())
+
+
+def scan_geolocation(f, block_rows):
+    """
+    Stream Latitude/Longitude in row blocks to find the tropical window and
+    the extent without holding the decoded grids in memory.
+    """
+    rows, cols = f['Latitude'].shape
+    row_hits = np.zeros(rows, dtype=bool)
+    col_hits = np.zeros(cols, dtype=bool)
+    extent = ExtentAccumulator()
+
+    for r0 in range(0, rows, block_rows):
+        block = np.s_[r0:min(r0 + block_rows, rows), :]
+        lat = decode_geolocation(f['Latitude'], block)
+        lon = decode_geolocation(f['Longitude'], block)
+        nio_band, sio_band = band_masks(lat)
+        tropical = nio_band | sio_band
+        row_hits[block[0]] = tropical.any(axis=1)
+        col_hits |= tropical.any(axis=0)
+        extent.update(lat, lon)
+
+    return window_from_hits(row_hits, col_hits), extent.extent()
+
+
+def open_npy(path, shape, dtype):
+    """Open a .npy file for sequential row-major writes of the given array shape."""
+    fh = open(path, 'wb')
+    np.lib.format.write_array_header_1_0(fh, {
+        'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        'fortran_order': False,
+        'shape': tuple(shape),
+    })
+    return fh
+
+
+def geolocation_fingerprint(f):
+    """
+    Fingerprint of the Latitude/Longitude datasets of an open HDF5 file.
+
+    Covers shape, dtype and every attribute (scale_factor, _FillValue, ...)
+    plus an evenly strided sample of raw rows, so it costs a few hundred KB
+    of I/O instead of a full decode.
+    """
+    digest = hashlib.sha256(f'v{CACHE_VERSION}'.encode())
+    for name in ('Latitude', 'Longitude'):
+        ds = f[name]
+        digest.update(name.encode())
+        digest.update(repr(ds.shape).encode())
+        digest.update(ds.dtype.str.encode())
+        for key in sorted(ds.attrs):
+            digest.update(key.encode())
+            digest.update(np.asarray(ds.attrs[key]).tobytes())
+        step = max(1, ds.shape[0] // FINGERPRINT_SAMPLE_ROWS)
+        digest.update(np.ascontiguousarray(ds[::step]).tobytes())
+    return digest.hexdigest()[:32]
+
+
+class GeolocationCache:
+    """
+    Directory of decoded geolocation grids keyed by fingerprint.
+
+    Entries are built in a private temporary directory and renamed into
+    place, so concurrent workers never see a partial entry; if two workers
+    build the same entry the loser discards its copy.
+    """
+
+    ARRAYS = ('lat', 'lon', 'nio_band', 'sio_band')
+
+    def __init__(self, cache_dir):
+        self.cache_dir = str(cache_dir)
+
+    def entry_path(self, fingerprint):
+        return os.path.join(self.cache_dir, fingerprint)
+
+    def get(self, f):
+        """Return the cached grid for an open HDF5 file, building it on a miss."""
+        fingerprint = geolocation_fingerprint(f)
+        grid = self.load(fingerprint)
+        if grid is None:
+            self.build(f, fingerprint)
+            grid = self.load(fingerprint)
+        return grid
+
+    def load(self, fingerprint):
+        path = self.entry_path(fingerprint)
+        try:
+            with open(os.path.join(path, 'meta.json')) as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if meta.get('version') != CACHE_VERSION:
+            return None
+
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in self.ARRAYS}
+        r0, r1, c0, c1 = meta['window']
+        return GeolocationGrid(window=np.s_[r0:r1, c0:c1], extent=meta['extent'],
+                               fingerprint=fingerprint, **arrays)
+
+    def build(self, f, fingerprint):
+        """Decode the grids block by block straight into a new cache entry."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=f'.{fingerprint}-', dir=self.cache_dir)
+        try:
+            rows, cols = f['Latitude'].shape
+            row_hits = np.zeros(rows, dtype=bool)
+            col_hits = np.zeros(cols, dtype=bool)
+            extent = ExtentAccumulator()
+            writers = {
+                name: open_npy(os.path.join(tmp_path, f'{name}.npy'), (rows, cols),
+                               np.float32 if name in ('lat', 'lon') else bool)
+                for name in self.ARRAYS
+            }
+            try:
+                for r0 in range(0, rows, BUILD_BLOCK_ROWS):
+                    block = np.s_[r0:min(r0 + BUILD_BLOCK_ROWS, rows), :]
+                    lat = decode_geolocation(f['Latitude'], block)
+                    lon = decode_geolocation(f['Longitude'], block)
+                    nio_band, sio_band = band_masks(lat)
+                    tropical = nio_band | sio_band
+                    row_hits[block[0]] = tropical.any(axis=1)
+                    col_hits |= tropical.any(axis=0)
+                    extent.update(lat, lon)
+                    for name, values in zip(self.ARRAYS, (lat, lon, nio_band, sio_band)):
+                        writers[name].write(values.tobytes())
+            finally:
+                for fh in writers.values():
+                    fh.close()
+
+            window = window_from_hits(row_hits, col_hits)
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as fh:
+                json.dump({
+                    'version': CACHE_VERSION,
+                    'shape': [rows, cols],
+                    'window': [window[0].start, window[0].stop, window[1].start, window[1].stop],
+                    'extent': extent.extent(),
+                }, fh)
+
+            try:
+                os.rename(tmp_path, self.entry_path(fingerprint))
+            except OSError:
+                # Another worker published the same entry first
+                pass
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_geolocation(f, cache_dir=None):
+    """Geolocation for an open HDF5 file, from the cache when cache_dir is set."""
+    if cache_dir:
+        return GeolocationCache(cache_dir).get(f)
+    return GeolocationGrid.decode(f)
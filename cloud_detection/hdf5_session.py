@@ -0,0 +1,86 @@
+"""
+One open HDF5 input per processing job.
+
+HDF5Session opens an L1B file once, checks from metadata alone that the
+datasets the TCC algorithm reads are present with consistent shapes, and
+hands the open file, its datasets and the decoded geolocation to every
+stage of the job, so nothing re-opens the file or decodes Latitude and
+Longitude twice.
+"""
+
+import h5py
+
+from .geolocation import load_geolocation
+
+BT_DATASET = 'TIR1_BT'
+GEOLOCATION_DATASETS = ('Latitude', 'Longitude')
+REQUIRED_DATASETS = (BT_DATASET,) + GEOLOCATION_DATASETS
+
+
+class HDF5SessionError(ValueError):
+    """The file is not readable HDF5 or lacks the datasets the algorithm needs."""
+
+
+class HDF5Session:
+    """An open, validated L1B file; use as a context manager."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self._geolocation = {}
+
+    def open(self):
+        try:
+            self.file = h5py.File(self.path, 'r')
+        except OSError as e:
+            raise HDF5SessionError(f"Cannot read HDF5 file: {e}") from e
+        try:
+            self.validate()
+        except HDF5SessionError:
+            self.close()
+            raise
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self._geolocation.clear()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def validate(self):
+        """Check the required datasets and their shapes without reading any data."""
+        missing = [name for name in REQUIRED_DATASETS if name not in self.file]
+        if missing:
+            raise HDF5SessionError(f"Missing datasets {missing} in {self.path}")
+        bt = self.file[BT_DATASET]
+        if bt.ndim != 3:
+            raise HDF5SessionError(f"{BT_DATASET} must be (time, rows, cols), got shape {bt.shape}")
+        for name in GEOLOCATION_DATASETS:
+            if self.file[name].shape != self.shape:
+                raise HDF5SessionError(
+                    f"{name} shape {self.file[name].shape} does not match {BT_DATASET} {self.shape}")
+
+    @property
+    def bt(self):
+        return self.file[BT_DATASET]
+
+    @property
+    def shape(self):
+        """(rows, cols) of the scene."""
+        return self.bt.shape[1:]
+
+    @property
+    def itemsize(self):
+        return self.bt.dtype.itemsize
+
+    def geolocation(self, cache_dir=None):
+        """Decoded (or cached) geolocation, computed once per session."""
+        if cache_dir not in self._geolocation:
+            self._geolocation[cache_dir] = load_geolocation(self.file, cache_dir)
+        return self._geolocation[cache_dir]
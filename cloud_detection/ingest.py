@@ -0,0 +1,197 @@
+"""
+Watch-folder ingestion of L1B files dropped by the ground-station pipeline.
+
+FolderWatcher polls a directory (used by `manage.py watch_ingest`). A file
+is taken once it has stopped changing: its size and mtime match the last
+poll and it was last written INGEST_STABLE_SECONDS ago or more. It is then
+checked for the HDF5 signature, hard-linked into uploads/ in storage (a
+symlink across filesystems), so nothing is copied, recorded as a
+SatelliteData row and submitted to the job queue. Rows remember the path
+they came from, so a restarted watcher never ingests a file twice.
+
+Backpressure: while INGEST_MAX_BACKLOG or more jobs are queued or
+processing, no new files are admitted; they wait in the directory until the
+workers catch up.
+"""
+
+import errno
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+
+from .batch import INPUT_EXTENSIONS
+from .checkpoints import file_digest
+from .dedup import save_upload
+from .jobs import submit_job
+from .models import SatelliteData
+from .upload_handlers import (
+    SIGNATURE_OFFSETS, SUPERBLOCK_CHECK_BYTES, InvalidUpload, check_hdf5_header, create_in_storage,
+    has_local_paths, upload_name,
+)
+
+logger = logging.getLogger(__name__)
+
+# Enough of the file to find the superblock behind any user block
+HEADER_BYTES = SIGNATURE_OFFSETS[-1] + SUPERBLOCK_CHECK_BYTES
+
+
+def link_into_storage(source, file_name, storage=None):
+    """
+    Make source available under a new uploads/ name in a local storage
+    without copying it: a hard link, or a symlink where source is on another
+    filesystem. Returns the storage name.
+    """
+    storage = storage or default_storage
+    name, placeholder = create_in_storage(storage, upload_name(file_name))
+    placeholder.close()
+    path = storage.path(name)
+    link = f'{path}.link'
+    try:
+        try:
+            os.link(source, link)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM):
+                raise
+            os.symlink(os.path.abspath(source), link)
+        # Replaces the placeholder that reserved the name
+        os.replace(link, path)
+    except BaseException:
+        for leftover in (link, path):
+            if os.path.lexists(leftover):
+                os.remove(leftover)
+        raise
+    return name
+
+
+class FolderWatcher:
+    """Ingests the stable L1B files of one directory, one poll at a time."""
+
+    def __init__(self, directory, user=None, stable_seconds=None, max_backlog=None, clock=time.time):
+        self.directory = os.path.abspath(directory)
+        self.user = user
+        self.stable_seconds = settings.INGEST_STABLE_SECONDS if stable_seconds is None else stable_seconds
+        self.max_backlog = settings.INGEST_MAX_BACKLOG if max_backlog is None else max_backlog
+        self.clock = clock
+        # (size, mtime) of every candidate at the last poll
+        self.seen = {}
+        # Files that are not HDF5, ignored until they change
+        self.rejected = {}
+        self.ingested = set(SatelliteData.objects.filter(
+            ingest_source__startswith=self.directory + os.sep).values_list('ingest_source', flat=True))
+        self.paused = False
+
+    def candidates(self):
+        """{path: (size, mtime)} of the L1B files in the directory not ingested yet."""
+        found = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if (entry.name.startswith('.') or not entry.is_file()
+                        or os.path.splitext(entry.name)[1].lower() not in INPUT_EXTENSIONS):
+                    continue
+                path = entry.path
+                if path in self.ingested:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found[path] = (stat.st_size, stat.st_mtime)
+        return found
+
+    def stable_files(self):
+        """Files that finished being written, oldest first."""
+        now = self.clock()
+        current = self.candidates()
+        stable = [
+            path for path, (size, mtime) in current.items()
+            if size > 0 and now - mtime >= self.stable_seconds
+            and self.seen.get(path, (size, mtime)) == (size, mtime)
+            and self.rejected.get(path) != (size, mtime)
+        ]
+        self.seen = current
+        return sorted(stable, key=lambda path: (current[path][1], path))
+
+    def backlog(self):
+        return SatelliteData.objects.filter(status__in=['queued', 'processing']).count()
+
+    def poll(self):
+        """Ingest the files that are ready, as far as the backlog allows. Returns the new rows."""
+        ready = self.stable_files()
+        if not ready:
+            return []
+        room = self.max_backlog - self.backlog() if self.max_backlog else len(ready)
+        if room <= 0:
+            if not self.paused:
+                logger.warning('Backlog of %s jobs; holding %s file(s) until it drops below %s',
+                               self.max_backlog - room, len(ready), self.max_backlog)
+            self.paused = True
+            return []
+        if self.paused:
+            logger.info('Backlog below %s; admitting files again', self.max_backlog)
+            self.paused = False
+
+        ingested = []
+        for path in ready[:room]:
+            try:
+                satellite_data = self.ingest(path)
+            except InvalidUpload as e:
+                self.rejected[path] = self.seen[path]
+                logger.warning('Skipping %s: %s', path, e)
+                continue
+            except OSError as e:
+                # Retried at the next poll (e.g. removed or unreadable for now)
+                logger.error('Could not ingest %s: %s', path, e)
+                continue
+            if satellite_data is not None:
+                ingested.append(satellite_data)
+        return ingested
+
+    def ingest(self, path):
+        """Register one file and submit it for processing."""
+        with open(path, 'rb') as f:
+            check_hdf5_header(f.read(HEADER_BYTES), complete=True)
+        content_sha256 = file_digest(path)
+        file_name = os.path.basename(path)
+        if has_local_paths(default_storage):
+            file_path = link_into_storage(path, file_name)
+        else:
+            # Remote storage cannot reference the file; it is uploaded instead
+            with open(path, 'rb') as f:
+                file_path, content_sha256 = save_upload(File(f, name=file_name), upload_name(file_name))
+
+        satellite_data = SatelliteData.objects.create(
+            uploaded_by=self.user, file_name=file_name, file_path=file_path, file_size=os.path.getsize(path),
+            upload_source='watch', ingest_source=path, content_sha256=content_sha256,
+        )
+        self.ingested.add(path)
+        reused = submit_job(satellite_data)
+        logger.info('Ingested %s as job %s%s', path, satellite_data.pk,
+                    ' (identical file already processed)' if reused else '')
+        return satellite_data
+
+
+def run_ingest(directory, user=None, poll_interval=None, stop_event=None, once=False, **watcher_options):
+    """
+    Poll directory until stop_event is set, or just once. Returns the number
+    of files ingested.
+    """
+    poll_interval = settings.INGEST_POLL_INTERVAL if poll_interval is None else poll_interval
+    stop_event = stop_event or threading.Event()
+    watcher = FolderWatcher(directory, user=user, **watcher_options)
+    total = 0
+
+    logger.info('Watching %s', watcher.directory)
+    while not stop_event.is_set():
+        close_old_connections()
+        total += len(watcher.poll())
+        if once:
+            break
+        stop_event.wait(poll_interval)
+    logger.info('Stopped watching %s after %s file(s)', watcher.directory, total)
+    return total
@@ -0,0 +1,213 @@
+"""
+Node-local cache of GCS-sourced processing inputs.
+
+Entries are keyed by bucket, object path and object generation, so an
+overwritten object is never served stale, and live as
+<INPUT_CACHE_DIR>/<key>.h5. Retries and reprocessing of an object reuse the
+local copy instead of downloading it again. A download goes to a temporary
+file that is renamed into place, so workers sharing the directory see an
+entry complete or not at all, and a per-entry lock file makes concurrent
+workers wait for one download instead of each doing their own. Jobs hold a
+shared lock on the entry they read; once the cache exceeds
+INPUT_CACHE_MAX_MB, entries nobody holds are evicted least recently used
+first (use refreshes an entry's mtime).
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: workers do not coordinate downloads or eviction
+    fcntl = None
+
+ENTRY_SUFFIX = '.h5'
+LOCK_SUFFIX = '.lock'
+PARTIAL_SUFFIX = '.part'
+
+# Partial downloads older than this were left by a worker that died
+STALE_PARTIAL_SECONDS = 24 * 3600
+
+
+def cache_key(bucket, path, generation):
+    return hashlib.sha256(f'{bucket}/{path}#{generation}'.encode()).hexdigest()
+
+
+class GCSSource:
+    """Objects in Google Cloud Storage; the client is created on first use."""
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import storage
+            self._client = storage.Client()
+        return self._client
+
+    def generation(self, bucket, path):
+        """Current generation of an object."""
+        blob = self.client.bucket(bucket).get_blob(path)
+        if blob is None:
+            raise FileNotFoundError(f"gs://{bucket}/{path} does not exist")
+        return blob.generation
+
+    def download(self, bucket, path, generation, destination):
+        """Download that generation of an object to destination."""
+        self.client.bucket(bucket).blob(path, generation=generation).download_to_filename(destination)
+
+
+class InputCache:
+    """Downloaded objects in a directory, within a byte budget."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def _lock_path(self, key):
+        return os.path.join(self.directory, key + LOCK_SUFFIX)
+
+    @contextmanager
+    def _locked(self, key, exclusive, blocking=True):
+        """Hold the entry's lock; yields False if non-blocking and someone else holds it."""
+        if fcntl is None:
+            yield True
+            return
+        path = self._lock_path(key)
+        operation = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB)
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                try:
+                    fcntl.flock(fd, operation)
+                except BlockingIOError:
+                    yield False
+                    return
+                # Eviction removes the lock file; start over on a fresh one
+                try:
+                    current = os.stat(path).st_ino == os.fstat(fd).st_ino
+                except FileNotFoundError:
+                    current = False
+                if current:
+                    yield True
+                    return
+            finally:
+                os.close(fd)
+
+    @contextmanager
+    def open(self, bucket, path, generation, fetch):
+        """
+        Yields (local path, whether it was cached) for an object, calling
+        fetch(destination) to download it on a miss. The entry is not
+        evicted before the block ends.
+        """
+        key = cache_key(bucket, path, generation)
+        entry = self.entry_path(key)
+        os.makedirs(self.directory, exist_ok=True)
+        cached = True
+        while True:
+            with self._locked(key, exclusive=False):
+                if os.path.exists(entry):
+                    os.utime(entry)
+                    yield entry, cached
+                    return
+            cached = False
+            with self._locked(key, exclusive=True):
+                if not os.path.exists(entry):
+                    self._download(entry, fetch)
+            self.evict(keep=key)
+
+    def _download(self, entry, fetch):
+        fd, partial = tempfile.mkstemp(dir=self.directory, suffix=PARTIAL_SUFFIX)
+        os.close(fd)
+        try:
+            fetch(partial)
+            with open(partial, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(partial, entry)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+    def size_bytes(self):
+        return sum(size for _mtime, size, _key in self._entries())
+
+    def _entries(self):
+        """(mtime, size, key) of every entry."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-len(ENTRY_SUFFIX)]))
+        return entries
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits its budget,
+        skipping keep and entries in use. Returns the bytes left.
+        """
+        self._remove_stale_partials()
+        entries = sorted(self._entries())
+        total = sum(size for _mtime, size, _key in entries)
+        for _mtime, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            with self._locked(key, exclusive=True, blocking=False) as locked:
+                if not locked:
+                    continue
+                try:
+                    os.remove(self.entry_path(key))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue  # open elsewhere (Windows)
+                total -= size
+                if fcntl is not None:
+                    os.remove(self._lock_path(key))
+        return total
+
+    def _remove_stale_partials(self):
+        cutoff = time.time() - STALE_PARTIAL_SECONDS
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(PARTIAL_SUFFIX) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def input_cache():
+    """The cache configured by INPUT_CACHE_DIR and INPUT_CACHE_MAX_MB, or None if disabled."""
+    if not settings.INPUT_CACHE_DIR:
+        return None
+    return InputCache(settings.INPUT_CACHE_DIR, settings.INPUT_CACHE_MAX_MB * 1024 * 1024)
+
+
+@contextmanager
+def temporary_download(fetch, suffix=ENTRY_SUFFIX):
+    """Yields the path of a temporary file downloaded with fetch(destination); removed on exit."""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        fetch(path)
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
@@ -3,91 +3,474 @@ Original INSAT-3DR Cloud Detection Algorithm
 CONFIDENTIAL - Do not modify this algorithm
 """
 
+import hashlib
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
 import numpy as np
-import h5py
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend to avoid Tkinter issues
 import matplotlib.pyplot as plt
-from skimage.morphology import remove_small_objects
-from skimage.measure import label, regionprops
+from scipy import ndimage
+
+from .geolocation import band_masks, decode_geolocation, open_npy, scan_geolocation
+from .hdf5_session import HDF5Session
+from .profiling import StageTimer
+from .rendering import (
+    PANEL_MAX_PX, PUBLICATION_PANEL_MAX_PX, decimate_for_display, render_fast, render_thumbnails,
+)
+
+# Working-set estimate for one tile row: BT, decoded lat/lon, their raw
+# copies, threshold masks, int32 labels and comparison temporaries.
+TILE_BYTES_PER_PIXEL = 48
+
+# How the BT/mask arrays are written to .npy files
+PERSIST_MODES = ('sync', 'async', 'none')
+
+# Bump when a change alters the mask or statistics computed for the same
+# input and parameters; results of other versions are never reused
+ALGORITHM_VERSION = 1
+
+# 'publication' is the matplotlib figure, 'fast' the LUT/PIL renderer
+RENDER_MODES = ('publication', 'fast')
 
-def extract_tcc_mask(filename, output_dir, min_radius_km=111, pixel_resolution_km=4.0, min_size_pixels=100):
+# Single background writer shared by all jobs of a process
+_persist_executor = None
+
+
+def extract_tcc_mask(filename, output_dir, min_radius_km=111, pixel_resolution_km=4.0, min_size_pixels=100,
+                     max_memory_mb=None, make_plot=True, tropical_window=True, geo_cache_dir=None,
+                     persist='sync', render_mode='publication', make_thumbnails=False, stage_timer=None,
+                     session=None, cancel=None):
     """
     Extracts Brightness Temperature (BT) and TCC mask from INSAT-3DR file.
     Saves .npy data and a visualization plot.
-    Returns paths to saved files and key arrays for further processing.
-    """
-    base_name = os.path.basename(filename).split('_L1B')[0]
+    Returns paths to saved files and key arrays for further processing:
+    "bt" and "mask" hold the full grids and "cluster_areas" the pixel count
+    of every kept cluster, so callers never need to reload the .npy files.
+    "lat"/"lon" are the decoded geolocation grids (None in tiled mode
+    without a geolocation cache).
 
-    with h5py.File(filename, 'r') as f:
-        bt = f['TIR1_BT'][0, :, :]
-        bt = np.where(bt == -999, np.nan, bt)
+    persist controls the .npy files: 'sync' writes them before returning,
+    'async' hands them to a background writer ("persist_future" is the
+    Future to wait on) and 'none' skips them (bt_file/mask_file are None).
+    render_mode picks the plot renderer (see save_plot). With make_thumbnails
+    (and make_plot), "thumbnails" maps each rendering.THUMBNAIL_SIZES name to
+    encoded image bytes, rendered from the same decimated grids as the plot.
 
-        lat_raw = f['Latitude'][:].astype(np.float32)
-        lon_raw = f['Longitude'][:].astype(np.float32)
-        lat = lat_raw * f['Latitude'].attrs['scale_factor']
-        lon = lon_raw * f['Longitude'].attrs['scale_factor']
-        lat[lat_raw == f['Latitude'].attrs['_FillValue']] = np.nan
-        lon[lon_raw == f['Longitude'].attrs['_FillValue']] = np.nan
+    With max_memory_mb set, the grids are processed in row tiles sized to
+    that budget and components crossing tile borders are stitched together,
+    giving the same outputs as whole-grid processing. The tiled engine
+    streams into the .npy files whatever persist says, and "bt"/"mask" are
+    read-only memory maps of them.
 
-    valid_bt_mask = ~np.isnan(bt)
-    mask_nio = (lat >= 0) & (lat <= 30) & (bt < 218) & valid_bt_mask
-    mask_sio = (lat < 0) & (lat >= -30) & (bt < 221) & valid_bt_mask
-    tcc_raw_mask = np.logical_or(mask_nio, mask_sio)
-
-    # Morphological filtering
-    cleaned_mask = remove_small_objects(tcc_raw_mask, min_size=min_size_pixels)
-
-    label_img = label(cleaned_mask)
-    final_mask = np.zeros_like(cleaned_mask, dtype=np.uint8)
-    for region in regionprops(label_img):
-        area = region.area
-        equiv_radius_km = np.sqrt(area / np.pi) * pixel_resolution_km
-        if equiv_radius_km >= min_radius_km:
-            coords = region.coords
-            final_mask[coords[:, 0], coords[:, 1]] = 1
+    With tropical_window (the default), BT is only read for the row/column
+    bounding box of the +/-30 degree band, the only place TCC pixels can
+    occur. The mask is unchanged; BT outside the window is stored as NaN, so
+    temperature statistics of "bt" cover the window, not the full disk.
+
+    With geo_cache_dir set, the decoded Latitude/Longitude grids, band masks
+    and extent are taken from (or added to) the shared geolocation cache.
+
+    session is the job's open hdf5_session.HDF5Session for filename; without
+    one the file is opened (and validated) for this call.
+
+    stage_timer (a profiling.StageTimer) records the read, threshold, label,
+    persist, plot and thumbnails stages; tiled mode interleaves reading,
+    thresholding and labeling per tile and records them as one 'tiled' stage.
+
+    cancel, if given, is called between stages and between tiles and stops
+    the run by raising (see cancellation.CancelToken.check).
+    """
+    if persist not in PERSIST_MODES:
+        raise ValueError(f"persist must be one of {PERSIST_MODES}, got {persist!r}")
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"render_mode must be one of {RENDER_MODES}, got {render_mode!r}")
+    base_name = os.path.basename(filename).split('_L1B')[0]
+    timer = stage_timer or StageTimer()
+    cancel = cancel or _never_cancelled
 
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
-
-    # Save data
     bt_path = os.path.join(output_dir, f'{base_name}_BT.npy')
     mask_path = os.path.join(output_dir, f'{base_name}_mask.npy')
-    np.save(bt_path, bt.astype(np.float32))
-    np.save(mask_path, final_mask.astype(np.uint8))
-
-    # Save plot
     plot_path = os.path.join(output_dir, f'{base_name}_plot.png')
-    save_plot(bt, final_mask, lat, lon, plot_path)
+
+    persist_future = None
+    thumbnails = None
+    if max_memory_mb is not None:
+        with timer.stage('tiled'):
+            cluster_areas, extent, geo = _extract_tcc_mask_tiled(
+                filename, bt_path, mask_path, min_radius_km, pixel_resolution_km, min_size_pixels, max_memory_mb,
+                tropical_window, geo_cache_dir, session, cancel)
+        bt = np.load(bt_path, mmap_mode='r')
+        final_mask = np.load(mask_path, mmap_mode='r')
+        if make_plot:
+            cancel()
+            with timer.stage('plot'):
+                thumbnails = save_plot(bt, final_mask, None, None, plot_path, extent=extent,
+                                       render_mode=render_mode, make_thumbnails=make_thumbnails,
+                                       stage_timer=timer)
+    else:
+        with timer.stage('read'), _session_for(filename, session) as scene:
+            shape = scene.shape
+            geo = scene.geolocation(geo_cache_dir)
+            window = geo.window if tropical_window else np.s_[:, :]
+            bt_window = scene.bt[(0,) + window]
+            bt_window = np.where(bt_window == -999, np.nan, bt_window)
+
+        cancel()
+        with timer.stage('threshold'):
+            tcc_raw_mask = _tcc_raw_mask(bt_window, geo.nio_band[window], geo.sio_band[window])
+
+        # Morphological filtering
+        cancel()
+        with timer.stage('label'):
+            final_window, cluster_areas = _filter_tcc_components(
+                tcc_raw_mask, min_size_pixels, min_radius_km, pixel_resolution_km)
+        del tcc_raw_mask
+
+        bt = np.full(shape, np.nan, dtype=np.float32)
+        bt[window] = bt_window
+        final_mask = np.zeros(shape, dtype=np.uint8)
+        final_mask[window] = final_window
+        del bt_window, final_window
+        extent = geo.extent
+
+        # Save data
+        if persist == 'sync':
+            with timer.stage('persist'):
+                _save_arrays(bt_path, bt, mask_path, final_mask)
+        elif persist == 'async':
+            persist_future = _persist_executor_instance().submit(_save_arrays, bt_path, bt, mask_path, final_mask)
+        else:
+            bt_path = mask_path = None
+
+        # Save plot
+        if make_plot:
+            cancel()
+            with timer.stage('plot'):
+                thumbnails = save_plot(bt, final_mask, geo.lat, geo.lon, plot_path, extent=extent,
+                                       render_mode=render_mode, make_thumbnails=make_thumbnails,
+                                       stage_timer=timer)
 
     return {
         "bt_file": bt_path,
         "mask_file": mask_path,
-        "plot_file": plot_path,
-        "base_name": base_name
+        "plot_file": plot_path if make_plot else None,
+        "base_name": base_name,
+        "cluster_count": int(cluster_areas.size),
+        "cluster_areas": cluster_areas,
+        "extent": extent,
+        "bt": bt,
+        "mask": final_mask,
+        "lat": geo.lat if geo is not None else None,
+        "lon": geo.lon if geo is not None else None,
+        "persist_future": persist_future,
+        "thumbnails": thumbnails,
+    }
+
+
+def parameters_fingerprint(min_radius_km=111, pixel_resolution_km=4.0, min_size_pixels=100, tropical_window=True):
+    """SHA-256 identifying results of this algorithm version with these parameters."""
+    params = {
+        'version': ALGORITHM_VERSION,
+        'min_radius_km': float(min_radius_km),
+        'pixel_resolution_km': float(pixel_resolution_km),
+        'min_size_pixels': int(min_size_pixels),
+        'tropical_window': bool(tropical_window),
     }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def _session_for(filename, session):
+    """The caller's open session, or one opened for this call only."""
+    return nullcontext(session) if session is not None else HDF5Session(filename)
+
+
+def _save_arrays(bt_path, bt, mask_path, final_mask):
+    np.save(bt_path, bt)
+    np.save(mask_path, final_mask)
+
+
+def _persist_executor_instance():
+    global _persist_executor
+    if _persist_executor is None:
+        _persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tcc-persist')
+    return _persist_executor
+
+
+def _tcc_raw_mask(bt, nio_band, sio_band):
+    """Threshold BT inside the north (0-30N) and south (0-30S) Indian Ocean bands."""
+    valid_bt_mask = ~np.isnan(bt)
+    mask_nio = nio_band & (bt < 218) & valid_bt_mask
+    mask_sio = sio_band & (bt < 221) & valid_bt_mask
+    return np.logical_or(mask_nio, mask_sio)
+
+
+def _never_cancelled():
+    pass
+
+
+def _tile_rows_for_budget(max_memory_mb, cols):
+    return max(1, int(max_memory_mb * 1024 * 1024) // (cols * TILE_BYTES_PER_PIXEL))
+
+
+def _extract_tcc_mask_tiled(filename, bt_path, mask_path, min_radius_km, pixel_resolution_km,
+                            min_size_pixels, max_memory_mb, tropical_window=True, geo_cache_dir=None,
+                            session=None, cancel=_never_cancelled):
+    """
+    Out-of-core version of the whole-grid pipeline.
+
+    The tropical window and plot extent come from the geolocation cache or,
+    without one, a streaming pass over the geolocation grids. Pass 1 then
+    reads row tiles of that window through h5py hyperslabs, writes BT
+    straight to its .npy file, labels each tile and spills the labels to a
+    scratch file, recording which labels meet across tile borders. Pass 2
+    streams the labels back through the component lookup table into the
+    mask file. Returns (cluster areas, plot extent, cached grid or None).
+    """
+    label_path = mask_path + '.labels'
+    areas = [np.zeros(1, dtype=np.int64)]
+    merge_a, merge_b, diag_a, diag_b = [], [], [], []
+    label_offset = 0
+    prev_row = None
+
+    try:
+        with _session_for(filename, session) as scene:
+            f = scene.file
+            rows, cols = scene.shape
+            tile_rows = _tile_rows_for_budget(max_memory_mb, cols)
+            if geo_cache_dir:
+                geo = scene.geolocation(geo_cache_dir)
+                window, extent = geo.window, geo.extent
+            else:
+                geo = None
+                window, extent = scan_geolocation(f, tile_rows)
+            if not tropical_window:
+                window = np.s_[0:rows, 0:cols]
+            row_window, col_window = window
+
+            with open_npy(bt_path, (rows, cols), np.float32) as bt_out, open(label_path, 'wb') as label_out:
+                _write_fill_rows(bt_out, 0, row_window.start, cols, tile_rows, np.nan, np.float32)
+                for r0 in range(row_window.start, row_window.stop, tile_rows):
+                    cancel()
+                    tile = np.s_[r0:min(r0 + tile_rows, row_window.stop), col_window]
+                    bt = f['TIR1_BT'][(0,) + tile]
+                    bt = np.where(bt == -999, np.nan, bt)
+                    if geo is not None:
+                        nio_band, sio_band = geo.nio_band[tile], geo.sio_band[tile]
+                    else:
+                        nio_band, sio_band = band_masks(decode_geolocation(f['Latitude'], tile))
+
+                    tcc_raw_mask = _tcc_raw_mask(bt, nio_band, sio_band)
+                    labels, n_labels = ndimage.label(tcc_raw_mask)
+                    areas.append(np.bincount(labels[tcc_raw_mask], minlength=n_labels + 1)[1:])
+                    labels[tcc_raw_mask] += label_offset
+                    label_offset += n_labels
+
+                    a, b = _diagonal_pairs(labels)
+                    diag_a.append(a)
+                    diag_b.append(b)
+                    if prev_row is not None:
+                        # Vertical neighbours across the border are the same 4-connected component
+                        touching = (prev_row != 0) & (labels[0] != 0)
+                        merge_a.append(prev_row[touching])
+                        merge_b.append(labels[0][touching])
+                        a, b = _diagonal_pairs(np.vstack([prev_row, labels[:1]]))
+                        diag_a.append(a)
+                        diag_b.append(b)
+                    prev_row = labels[-1].copy()
+
+                    bt_out.write(_pad_columns(bt.astype(np.float32), col_window, cols, np.nan).tobytes())
+                    label_out.write(labels.tobytes())
+                    del bt, nio_band, sio_band, tcc_raw_mask, labels
+                _write_fill_rows(bt_out, row_window.stop, rows, cols, tile_rows, np.nan, np.float32)
+
+        lut, cluster_areas = _component_lut(
+            np.concatenate(areas),
+            (np.concatenate(merge_a or [[]]), np.concatenate(merge_b or [[]])),
+            (np.concatenate(diag_a or [[]]), np.concatenate(diag_b or [[]])),
+            min_size_pixels, min_radius_km, pixel_resolution_km)
+
+        window_cols = col_window.stop - col_window.start
+        with open_npy(mask_path, (rows, cols), np.uint8) as mask_out, open(label_path, 'rb') as label_in:
+            _write_fill_rows(mask_out, 0, row_window.start, cols, tile_rows, 0, np.uint8)
+            for r0 in range(row_window.start, row_window.stop, tile_rows):
+                cancel()
+                r1 = min(r0 + tile_rows, row_window.stop)
+                labels = np.fromfile(label_in, dtype=np.int32, count=(r1 - r0) * window_cols)
+                mask = lut[labels].reshape(r1 - r0, window_cols)
+                mask_out.write(_pad_columns(mask, col_window, cols, 0).tobytes())
+            _write_fill_rows(mask_out, row_window.stop, rows, cols, tile_rows, 0, np.uint8)
+    finally:
+        if os.path.exists(label_path):
+            os.remove(label_path)
+
+    return cluster_areas, extent, geo
+
+
+def _pad_columns(block, col_window, cols, fill):
+    """Place a window-width row block back into full-width rows."""
+    if col_window.start == 0 and col_window.stop == cols:
+        return block
+    padded = np.full((block.shape[0], cols), fill, dtype=block.dtype)
+    padded[:, col_window] = block
+    return padded
+
+
+def _write_fill_rows(fh, r0, r1, cols, tile_rows, fill, dtype):
+    """Write rows r0..r1 of a constant value in tile-sized blocks."""
+    for start in range(r0, r1, tile_rows):
+        fh.write(np.full((min(tile_rows, r1 - start), cols), fill, dtype=dtype).tobytes())
+
+
+def filter_tcc_components(tcc_raw_mask, min_size_pixels, min_radius_km, pixel_resolution_km):
+    """
+    Apply small-object removal and the equivalent-radius filter from a single
+    labelling pass. Returns the final uint8 mask and the number of clusters.
+
+    Small objects are judged on 4-connected components (as remove_small_objects
+    does) and radii on 8-connected regions of what remains (as label does).
+    Only the 4-connected labelling is computed; the 8-connected regions are
+    recovered by merging surviving components that touch diagonally.
+    """
+    final_mask, cluster_areas = _filter_tcc_components(
+        tcc_raw_mask, min_size_pixels, min_radius_km, pixel_resolution_km)
+    return final_mask, int(cluster_areas.size)
+
+
+def _filter_tcc_components(tcc_raw_mask, min_size_pixels, min_radius_km, pixel_resolution_km):
+    """filter_tcc_components returning the pixel area of every kept cluster."""
+    labels, n_labels = ndimage.label(tcc_raw_mask)
+    # Cloud pixels are a small fraction of the grid, so work on those only
+    cloud_labels = labels[tcc_raw_mask]
+    areas = np.bincount(cloud_labels, minlength=n_labels + 1)
+
+    lut, cluster_areas = _component_lut(
+        areas, ([], []), _diagonal_pairs(labels), min_size_pixels, min_radius_km, pixel_resolution_km)
+
+    final_mask = np.zeros(labels.shape, dtype=np.uint8)
+    final_mask[tcc_raw_mask] = lut[cloud_labels]
+    return final_mask, cluster_areas
+
+
+def _diagonal_pairs(labels):
+    """Pairs of different non-zero labels that touch only across a diagonal."""
+    pairs_a, pairs_b = [], []
+    for a, b in ((labels[:-1, :-1], labels[1:, 1:]), (labels[:-1, 1:], labels[1:, :-1])):
+        touching = (a != b) & (a != 0) & (b != 0)
+        pairs_a.append(a[touching])
+        pairs_b.append(b[touching])
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
 
+def _component_lut(areas, merge_pairs, diagonal_pairs, min_size_pixels, min_radius_km, pixel_resolution_km):
+    """
+    Build the label -> {0, 1} lookup table from per-label pixel counts.
+
+    merge_pairs join labels that belong to the same 4-connected component
+    (labels split by tile borders); diagonal_pairs join components into
+    8-connected regions once small components have been dropped.
+    Returns (lut, pixel area of each kept cluster).
+    """
+    n_labels = areas.size - 1
+    component = resolve_equivalences(n_labels, *merge_pairs)
+    component_areas = np.zeros(n_labels + 1, dtype=np.int64)
+    np.add.at(component_areas, component, areas)
+
+    kept = component_areas[component] >= min_size_pixels
+    kept[0] = False
+
+    diag_a, diag_b = (np.asarray(pairs, dtype=np.int64) for pairs in diagonal_pairs)
+    both_kept = kept[diag_a] & kept[diag_b]
+    region = resolve_equivalences(n_labels, component[diag_a[both_kept]], component[diag_b[both_kept]])[component]
+
+    kept_ids = np.flatnonzero(kept)
+    region_areas = np.zeros(n_labels + 1, dtype=np.int64)
+    np.add.at(region_areas, region[kept_ids], areas[kept_ids])
+
+    equiv_radius_km = np.sqrt(region_areas / np.pi) * pixel_resolution_km
+    keep_region = (equiv_radius_km >= min_radius_km) & (region_areas > 0)
+
+    lut = (kept & keep_region[region]).astype(np.uint8)
+    return lut, region_areas[keep_region]
+
+
+def resolve_equivalences(n_labels, pairs_a, pairs_b):
+    """
+    Union-find over labels 0..n_labels given pairs of equivalent labels.
+    Returns a table mapping every label to the smallest label in its set.
+    """
+    parent = np.arange(n_labels + 1, dtype=np.int64)
+    pairs_a = np.asarray(pairs_a, dtype=np.int64)
+    pairs_b = np.asarray(pairs_b, dtype=np.int64)
 
-def save_plot(bt, final_mask, lat, lon, plot_path):
-    """Save side-by-side plot of BT and TCC mask."""
+    while pairs_a.size:
+        root_a, root_b = parent[pairs_a], parent[pairs_b]
+        unresolved = root_a != root_b
+        pairs_a, pairs_b = pairs_a[unresolved], pairs_b[unresolved]
+        root_a, root_b = root_a[unresolved], root_b[unresolved]
+        if not pairs_a.size:
+            break
+        # Hang the larger root under the smaller one, then compress paths
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    return parent
+
+
+def save_plot(bt, final_mask, lat, lon, plot_path, extent=None, render_mode='publication', make_thumbnails=False,
+              stage_timer=None):
+    """
+    Save side-by-side plot of BT and TCC mask.
+    extent ([lon_min, lon_max, lat_min, lat_max]) may be passed instead of
+    lat/lon when the bounds are already known.
+    render_mode 'fast' draws the same layout with lookup tables and PIL
+    (see rendering.py) in a fraction of the matplotlib time. Either way the
+    grids are decimated to the output resolution before rendering.
+    With make_thumbnails, returns preview thumbnails rendered from the
+    decimated grids (see rendering.render_thumbnails), otherwise None;
+    their rendering is recorded as the 'thumbnails' stage of stage_timer.
+    """
     import gc
     
     # Handle potential data issues with lat/lon arrays
-    try:
-        # Use masked arrays to handle NaN values more efficiently
-        lon_masked = np.ma.masked_invalid(lon)
-        lat_masked = np.ma.masked_invalid(lat)
-        
-        if lon_masked.count() > 0 and lat_masked.count() > 0:
-            extent = [lon_masked.min(), lon_masked.max(), lat_masked.min(), lat_masked.max()]
-        else:
-            raise ValueError("No valid coordinate data")
-            
-    except (ValueError, RuntimeError, AttributeError):
-        # Fallback to default extent if data is problematic
-        extent = [70, 90, 5, 25]  # Default India region
-        print("Warning: Using fallback geographic extent due to coordinate data issues")
+    if extent is None:
+        try:
+            if lat is None or lon is None:
+                raise ValueError("No coordinate data")
+
+            # Use masked arrays to handle NaN values more efficiently
+            lon_masked = np.ma.masked_invalid(lon)
+            lat_masked = np.ma.masked_invalid(lat)
+
+            if lon_masked.count() > 0 and lat_masked.count() > 0:
+                extent = [lon_masked.min(), lon_masked.max(), lat_masked.min(), lat_masked.max()]
+            else:
+                raise ValueError("No valid coordinate data")
+
+        except (ValueError, RuntimeError, AttributeError):
+            # Fallback to default extent if data is problematic
+            extent = [70, 90, 5, 25]  # Default India region
+            print("Warning: Using fallback geographic extent due to coordinate data issues")
+
+    # Render from grids reduced to the output size, not the full grid
+    bt, final_mask = decimate_for_display(
+        bt, final_mask, PANEL_MAX_PX if render_mode == 'fast' else PUBLICATION_PANEL_MAX_PX)
+    thumbnails = None
+    if make_thumbnails:
+        with (stage_timer or StageTimer()).stage('thumbnails'):
+            thumbnails = render_thumbnails(bt, final_mask)
+
+    if render_mode == 'fast':
+        render_fast(bt, final_mask, plot_path, extent)
+        return thumbnails
 
     # Force garbage collection before creating plot
     gc.collect()
@@ -114,4 +497,6 @@ def save_plot(bt, final_mask, lat, lon, plot_path):
     fig.clear()
     plt.clf()
     plt.close('all')
-    gc.collect() 
\ No newline at end of file
+    gc.collect() 
+
+    return thumbnails
@@ -0,0 +1,80 @@
+"""
+Buffered per-job processing logs.
+
+JobLogger collects a job's messages in memory and hands them to a sink in
+batches: at stage boundaries, on failure and at job end (and whenever
+JOB_LOG_BUFFER_SIZE messages are waiting), instead of one INSERT per
+message. DatabaseSink bulk-inserts ProcessingLog rows; JsonLinesSink
+appends one JSON object per message to <JOB_LOG_DIR>/<job id>.jsonl and
+leaves the database alone.
+"""
+
+import json
+import os
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ProcessingLog
+
+SINKS = ('database', 'jsonl')
+
+
+class DatabaseSink:
+    """Writes each batch as ProcessingLog rows with a single bulk INSERT."""
+
+    def write(self, satellite_data, entries):
+        ProcessingLog.objects.bulk_create([
+            ProcessingLog(satellite_data=satellite_data, timestamp=timestamp, level=level, message=message)
+            for timestamp, level, message in entries
+        ])
+
+
+class JsonLinesSink:
+    """Appends each batch to a per-job JSON lines file."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path_for(self, satellite_data):
+        return os.path.join(self.directory, f'{satellite_data.pk}.jsonl')
+
+    def write(self, satellite_data, entries):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path_for(satellite_data), 'a', encoding='utf-8') as f:
+            f.writelines(
+                json.dumps({'timestamp': timestamp.isoformat(), 'level': level, 'message': message}) + '\n'
+                for timestamp, level, message in entries
+            )
+
+
+def make_sink(name=None):
+    """The sink named by JOB_LOG_SINK (or name)."""
+    name = name or settings.JOB_LOG_SINK
+    if name == 'database':
+        return DatabaseSink()
+    if name == 'jsonl':
+        return JsonLinesSink(settings.JOB_LOG_DIR)
+    raise ValueError(f"JOB_LOG_SINK must be one of {SINKS}, got {name!r}")
+
+
+class JobLogger:
+    """In-memory log buffer for one job, flushed to a sink in batches."""
+
+    def __init__(self, satellite_data, sink=None, buffer_size=None):
+        self.satellite_data = satellite_data
+        self.sink = sink or make_sink()
+        self.buffer_size = buffer_size or settings.JOB_LOG_BUFFER_SIZE
+        self.entries = []
+
+    def log(self, level, message):
+        # Timestamped when logged, not when flushed
+        self.entries.append((timezone.now(), level, message))
+        if len(self.entries) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.entries:
+            return
+        entries, self.entries = self.entries, []
+        self.sink.write(self.satellite_data, entries)
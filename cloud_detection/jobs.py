@@ -0,0 +1,407 @@
+"""
+Database-backed job queue for satellite data processing.
+
+SatelliteData rows are the jobs. enqueue_job marks a row 'queued' and the
+worker processes started by `manage.py run_workers` claim rows atomically,
+holding a lease that a heartbeat thread renews while the job runs. A row
+whose lease has expired (its worker died) is claimable again, up to
+JOB_MAX_ATTEMPTS claims, so any number of workers on any number of nodes
+can share one queue.
+
+Claims follow scheduling.claim_order: by priority, then fair shares across
+users and the shortest job of the chosen user (or queue order, with
+JOB_SCHEDULING = 'fifo'). On databases with SELECT ... FOR UPDATE SKIP
+LOCKED (PostgreSQL) a claim locks the first candidate rows in that order and
+skips rows other workers hold locked.
+Elsewhere (SQLite) a claim is a conditional UPDATE that only succeeds while
+the row is still claimable, so two workers never get the same row.
+
+With JOB_MEMORY_BUDGET_MB set, a worker only claims the next job while
+its estimated peak memory fits in what the jobs running on the same host
+leave of the budget (see admission.py).
+
+A watchdog thread stops a running job at its next cancellation point once a
+user cancels it (cancel_job) or it runs past JOB_TIME_BUDGET_SECONDS; a job
+that reaches none within JOB_CANCEL_GRACE_SECONDS is abandoned and its
+worker process exits. Workers periodically reap 'processing' rows no live
+worker holds (reap_stale_jobs), so a dead worker never leaves a zombie job.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .admission import MemoryAdmission, host_lock
+from .cancellation import CancelToken
+from .dedup import find_reusable_result, reuse_result
+from .models import SatelliteData, ProcessingLog
+from .processing import CloudDetectionProcessor, tcc_fingerprint
+from .profiling import PeakRSSSampler
+from .scheduling import claim_order
+
+logger = logging.getLogger(__name__)
+
+# Candidate rows tried per claim when claiming by conditional UPDATE
+CLAIM_CANDIDATES = 5
+
+# Seconds between a worker's sweeps for stale jobs, and rows reaped per sweep
+REAP_INTERVAL = 60
+REAP_BATCH = 100
+
+# Exit code of a worker process that abandoned a stuck job
+ABANDONED_EXIT_CODE = 3
+
+
+def make_worker_id():
+    """Unique, human-readable worker identity: host:pid:random."""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+
+
+def enqueue_job(satellite_data):
+    """Queue a SatelliteData row for processing and return immediately."""
+    satellite_data.status = 'queued'
+    satellite_data.queued_at = timezone.now()
+    satellite_data.lease_owner = None
+    satellite_data.lease_expires_at = None
+    satellite_data.attempts = 0
+    satellite_data.error_message = None
+    satellite_data.cancel_requested = False
+    satellite_data.wait_seconds = None
+    satellite_data.service_seconds = None
+    satellite_data.save(update_fields=[
+        'status', 'queued_at', 'lease_owner', 'lease_expires_at', 'attempts', 'error_message',
+        'cancel_requested', 'wait_seconds', 'service_seconds',
+    ])
+    return satellite_data
+
+
+def submit_job(satellite_data):
+    """
+    Complete an upload from an identical, already processed file when there
+    is one (see dedup.py), otherwise queue it. Returns True if results were reused.
+    """
+    donor = find_reusable_result(satellite_data, tcc_fingerprint())
+    if donor is not None:
+        reuse_result(satellite_data, donor)
+        return True
+    enqueue_job(satellite_data)
+    return False
+
+
+def cancel_job(satellite_data):
+    """
+    Cancel a job. A job still waiting in the queue is cancelled at once; a
+    running one is flagged and stops at its next cancellation point. Returns
+    'cancelled', 'cancelling' or None if the job had already finished.
+    """
+    now = timezone.now()
+    if SatelliteData.objects.filter(pk=satellite_data.pk, status__in=['pending', 'queued']).update(
+            status='cancelled', error_message='Cancelled by user', processing_end_time=now,
+            lease_owner=None, lease_expires_at=None):
+        ProcessingLog.objects.create(satellite_data=satellite_data, level='warning',
+                                     message='Cancelled by user before processing started')
+        return 'cancelled'
+    if SatelliteData.objects.filter(pk=satellite_data.pk, status='processing').update(cancel_requested=True):
+        ProcessingLog.objects.create(satellite_data=satellite_data, level='warning',
+                                     message='Cancellation requested')
+        return 'cancelling'
+    return None
+
+
+def _claimable(now):
+    """Queued rows, plus rows whose worker stopped renewing its lease."""
+    return Q(status='queued') | Q(status='processing', lease_expires_at__lt=now, cancel_requested=False)
+
+
+def _stale(now, lease_seconds):
+    """
+    'processing' rows no live worker holds: the lease expired, or the row
+    was left 'processing' without one (e.g. its final save failed, or it was
+    processed outside the queue by a process that died).
+    """
+    unleased_since = now - timedelta(seconds=lease_seconds)
+    return Q(status='processing') & (
+        Q(lease_expires_at__lt=now)
+        | Q(lease_expires_at__isnull=True, processing_start_time__lt=unleased_since)
+        | Q(lease_expires_at__isnull=True, processing_start_time__isnull=True)
+    )
+
+
+def reap_stale_jobs(lease_seconds=None):
+    """
+    Settle 'processing' rows whose worker is gone: cancelled if a user asked
+    for that, failed after JOB_MAX_ATTEMPTS claims, otherwise re-queued in
+    their old queue position. Returns the number of rows reaped.
+    """
+    lease_seconds = lease_seconds or settings.JOB_LEASE_SECONDS
+    now = timezone.now()
+    reaped = 0
+    for job in SatelliteData.objects.filter(_stale(now, lease_seconds))[:REAP_BATCH]:
+        if job.cancel_requested:
+            update = {'status': 'cancelled', 'error_message': 'Cancelled by user',
+                      'processing_end_time': now}
+            level, message = 'warning', 'Worker lost; job cancelled as requested'
+        elif job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            update = {'status': 'failed', 'processing_end_time': now,
+                      'error_message': f'Gave up after {settings.JOB_MAX_ATTEMPTS} attempts (worker lost)'}
+            level, message = 'error', f'Job abandoned after {settings.JOB_MAX_ATTEMPTS} attempts'
+        else:
+            update = {'status': 'queued', 'queued_at': job.queued_at or now}
+            level, message = 'warning', 'Worker lost; job re-queued'
+        # Conditional on the row still being stale: concurrent reapers reap it once
+        if SatelliteData.objects.filter(_stale(now, lease_seconds), pk=job.pk).update(
+                lease_owner=None, lease_expires_at=None, **update):
+            ProcessingLog.objects.create(satellite_data=job, level=level, message=message)
+            logger.warning('Reaped stale job %s (%s)', job.pk, update['status'])
+            reaped += 1
+    return reaped
+
+
+def _lease_update(worker_id, now, lease_seconds):
+    return {
+        'status': 'processing',
+        'lease_owner': worker_id,
+        'lease_expires_at': now + timedelta(seconds=lease_seconds),
+        'attempts': F('attempts') + 1,
+    }
+
+
+def _claim_one(worker_id, lease_seconds, admission=None):
+    now = timezone.now()
+    claimable = SatelliteData.objects.filter(_claimable(now))
+    candidates = claim_order(claimable, now)[:CLAIM_CANDIDATES]
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            locked = claimable.select_for_update(skip_locked=True).in_bulk(candidates)
+            job = next((locked[pk] for pk in candidates if pk in locked), None)
+            if job is None or (admission and not admission.admits(job)):
+                return None
+            SatelliteData.objects.filter(pk=job.pk).update(**_lease_update(worker_id, now, lease_seconds))
+        return _record_wait(job.pk, now)
+
+    jobs = claimable.in_bulk(candidates)
+    for pk in candidates:
+        job = jobs.get(pk)
+        if job is None:
+            continue
+        # Jobs are admitted in claim order: a job that does not fit holds
+        # back the smaller ones behind it rather than being starved by them
+        if admission and not admission.admits(job):
+            return None
+        # Only one worker's UPDATE can match while the row is claimable
+        if SatelliteData.objects.filter(_claimable(now), pk=job.pk).update(
+                **_lease_update(worker_id, now, lease_seconds)):
+            return _record_wait(job.pk, now)
+    return None
+
+
+def _record_wait(pk, claimed_at):
+    """Record a freshly claimed job's queue wait; returns the job."""
+    job = SatelliteData.objects.get(pk=pk)
+    if job.queued_at is not None:
+        job.wait_seconds = (claimed_at - job.queued_at).total_seconds()
+        SatelliteData.objects.filter(pk=pk).update(wait_seconds=job.wait_seconds)
+    return job
+
+
+def claim_next_job(worker_id, lease_seconds=None, memory_budget_mb=None):
+    """
+    Atomically claim the oldest claimable job for worker_id, or return None.
+    Jobs claimed more than JOB_MAX_ATTEMPTS times are marked failed instead.
+    memory_budget_mb defaults to JOB_MEMORY_BUDGET_MB; 0 disables admission
+    control. None is also returned when the oldest job does not fit.
+    """
+    lease_seconds = lease_seconds or settings.JOB_LEASE_SECONDS
+    memory_budget_mb = settings.JOB_MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb
+    while True:
+        if memory_budget_mb:
+            with host_lock():
+                job = _claim_one(worker_id, lease_seconds, MemoryAdmission(worker_id, memory_budget_mb))
+        else:
+            job = _claim_one(worker_id, lease_seconds)
+        if job is None or job.attempts <= settings.JOB_MAX_ATTEMPTS:
+            return job
+
+        SatelliteData.objects.filter(pk=job.pk, lease_owner=worker_id).update(
+            status='failed',
+            error_message=f'Gave up after {settings.JOB_MAX_ATTEMPTS} attempts (worker lost)',
+            processing_end_time=timezone.now(),
+            lease_owner=None,
+            lease_expires_at=None,
+        )
+        ProcessingLog.objects.create(
+            satellite_data=job, level='error',
+            message=f'Job abandoned after {settings.JOB_MAX_ATTEMPTS} attempts',
+        )
+
+
+def release_job(job, worker_id):
+    """Drop worker_id's lease on a job it has finished with."""
+    SatelliteData.objects.filter(pk=job.pk, lease_owner=worker_id).update(
+        lease_owner=None, lease_expires_at=None)
+
+
+class LeaseHeartbeat(threading.Thread):
+    """Renews a job's lease every third of the lease period until stopped."""
+
+    def __init__(self, job, worker_id, lease_seconds):
+        super().__init__(name=f'lease-{job.pk}', daemon=True)
+        self.job = job
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stopped.wait(self.lease_seconds / 3):
+                expires = timezone.now() + timedelta(seconds=self.lease_seconds)
+                SatelliteData.objects.filter(pk=self.job.pk, lease_owner=self.worker_id).update(
+                    lease_expires_at=expires)
+                # Keep the processor's copy in step (its saves leave the lease alone)
+                self.job.lease_expires_at = expires
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class JobWatchdog(threading.Thread):
+    """
+    Cancels a running job's token when a user cancels the job or it exceeds
+    budget_seconds of wall-clock time (0: no budget). If the job reaches no
+    cancellation point within grace_seconds after that it is stuck, e.g. in
+    a native HDF5 read, and abandon(job, worker_id, token) is called; by
+    default that records the outcome and exits the worker process, which
+    run_workers replaces.
+    """
+
+    def __init__(self, job, worker_id, token, budget_seconds=None, grace_seconds=None, interval=None,
+                 abandon=None):
+        super().__init__(name=f'watchdog-{job.pk}', daemon=True)
+        self.job = job
+        self.worker_id = worker_id
+        self.token = token
+        self.budget_seconds = settings.JOB_TIME_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+        self.grace_seconds = settings.JOB_CANCEL_GRACE_SECONDS if grace_seconds is None else grace_seconds
+        self.interval = settings.JOB_WATCHDOG_INTERVAL if interval is None else interval
+        self.abandon = abandon or abandon_stuck_job
+        self.started = time.monotonic()
+        self.cancelled_at = None
+        self._stopped = threading.Event()
+
+    def poll(self):
+        """One check; returns False once the job has been abandoned."""
+        now = time.monotonic()
+        if self.cancelled_at is None:
+            if SatelliteData.objects.filter(pk=self.job.pk, cancel_requested=True).exists():
+                # Keep the processor's copy in step (its saves leave the flag alone)
+                self.job.cancel_requested = True
+                self.token.cancel('Cancelled by user')
+            elif self.budget_seconds and now - self.started > self.budget_seconds:
+                self.token.cancel(f'Exceeded the {self.budget_seconds}s time budget', timed_out=True)
+            if self.token.cancelled:
+                self.cancelled_at = now
+        elif now - self.cancelled_at > self.grace_seconds:
+            self.abandon(self.job, self.worker_id, self.token)
+            return False
+        return True
+
+    def run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                if not self.poll():
+                    break
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def abandon_stuck_job(job, worker_id, token):
+    """Settle a job that ignores its cancellation, then exit the worker process running it."""
+    status = 'failed' if token.timed_out else 'cancelled'
+    message = f'{token.reason}; stopped without reaching a cancellation point'
+    SatelliteData.objects.filter(pk=job.pk, lease_owner=worker_id).update(
+        status=status, error_message=message, processing_end_time=timezone.now(),
+        lease_owner=None, lease_expires_at=None)
+    ProcessingLog.objects.create(satellite_data=job, level='error', message=f'Job abandoned: {message}')
+    logger.error('Job %s is stuck (%s); exiting worker %s', job.pk, token.reason, worker_id)
+    logging.shutdown()
+    os._exit(ABANDONED_EXIT_CODE)
+
+
+def process_claimed_job(job, worker_id, lease_seconds=None):
+    """Run the processor on a claimed job while keeping its lease alive and watching its time."""
+    lease_seconds = lease_seconds or settings.JOB_LEASE_SECONDS
+    token = CancelToken()
+    heartbeat = LeaseHeartbeat(job, worker_id, lease_seconds)
+    watchdog = JobWatchdog(job, worker_id, token)
+    sampler = PeakRSSSampler()
+    started = time.monotonic()
+    # A job cancelled while it was being claimed stops at once
+    watchdog.poll()
+    heartbeat.start()
+    watchdog.start()
+    sampler.start()
+    try:
+        CloudDetectionProcessor(job, cancel_token=token).process_satellite_data()
+    finally:
+        peak_mb = sampler.stop()
+        watchdog.stop()
+        heartbeat.stop()
+        # Peak memory feeds the admission estimator's calibration, service
+        # time the fair-share scheduler
+        SatelliteData.objects.filter(pk=job.pk).update(
+            peak_memory_mb=peak_mb, service_seconds=time.monotonic() - started)
+        logger.info('Job %s peak memory %.0fMB (estimated %s)', job.pk, peak_mb,
+                    'unknown' if not job.memory_estimate_mb else f'{job.memory_estimate_mb:.0f}MB')
+        release_job(job, worker_id)
+
+
+def run_worker(worker_id=None, poll_interval=None, lease_seconds=None, max_jobs=None,
+               exit_when_idle=False, stop_event=None, memory_budget_mb=None):
+    """
+    Claim and process jobs until stop_event is set, max_jobs have run or,
+    with exit_when_idle, no job can be claimed. Returns the number of jobs run.
+    """
+    worker_id = worker_id or make_worker_id()
+    poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+    stop_event = stop_event or threading.Event()
+    processed = 0
+    last_reap = None
+
+    logger.info('Worker %s started', worker_id)
+    while not stop_event.is_set():
+        close_old_connections()
+        if last_reap is None or time.monotonic() - last_reap > REAP_INTERVAL:
+            reap_stale_jobs(lease_seconds)
+            last_reap = time.monotonic()
+        job = claim_next_job(worker_id, lease_seconds, memory_budget_mb)
+        if job is None:
+            if exit_when_idle:
+                break
+            stop_event.wait(poll_interval)
+            continue
+
+        logger.info('Worker %s claimed job %s (attempt %s)', worker_id, job.pk, job.attempts)
+        process_claimed_job(job, worker_id, lease_seconds)
+        processed += 1
+        if max_jobs and processed >= max_jobs:
+            break
+
+    logger.info('Worker %s stopped after %s jobs', worker_id, processed)
+    return processed
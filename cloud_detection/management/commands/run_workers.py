@@ -0,0 +1,102 @@
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from cloud_detection.jobs import ABANDONED_EXIT_CODE
+
+
+def _install_stop_handlers(stop_event):
+    """Finish the current job, then exit, on SIGTERM/SIGINT."""
+    def stop(signum, frame):
+        stop_event.set()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+
+def _worker_process(options):
+    """Entry point of a spawned worker process."""
+    import django
+    django.setup()
+    from cloud_detection.jobs import run_worker
+
+    stop_event = threading.Event()
+    _install_stop_handlers(stop_event)
+    run_worker(poll_interval=options['poll_interval'], lease_seconds=options['lease_seconds'],
+               max_jobs=options['max_jobs'], exit_when_idle=options['once'], stop_event=stop_event,
+               memory_budget_mb=options['memory_budget_mb'])
+
+
+def should_restart(exitcode, options):
+    """
+    Whether a worker process that exited is replaced: always when it
+    abandoned a stuck job, otherwise unless it was only meant to run until
+    the queue was empty (--once) or for --max-jobs jobs.
+    """
+    if exitcode == ABANDONED_EXIT_CODE:
+        return True
+    return not (options['once'] or options['max_jobs'])
+
+
+class Command(BaseCommand):
+    help = 'Run worker processes that claim and process queued satellite data jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS,
+                            help='Number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds an idle worker waits before polling the queue again')
+        parser.add_argument('--lease-seconds', type=int, default=settings.JOB_LEASE_SECONDS,
+                            help='Job lease length; a job is re-queued if its worker stops renewing it')
+        parser.add_argument('--memory-budget-mb', type=int, default=settings.JOB_MEMORY_BUDGET_MB,
+                            help='Estimated peak memory all jobs on this host may use together (0: no limit)')
+        parser.add_argument('--max-jobs', type=int, default=None,
+                            help='Exit each worker after this many jobs')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit each worker once the queue is empty')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            self.stderr.write(self.style.ERROR('--workers must be at least 1'))
+            return
+
+        self.stdout.write(f'Starting {options["workers"]} worker(s)')
+        # Even a single worker runs in a child process: a worker whose job is
+        # stuck exits (see jobs.abandon_stuck_job) and is replaced
+        self.supervise(options)
+
+    def supervise(self, options):
+        """Run worker processes, restarting any that die until told to stop."""
+        # Children open their own connections
+        connections.close_all()
+        ctx = multiprocessing.get_context('spawn')
+        stop_event = threading.Event()
+        _install_stop_handlers(stop_event)
+
+        def start(index):
+            process = ctx.Process(target=_worker_process, args=(options,), name=f'tcc-worker-{index}')
+            process.start()
+            return process
+
+        workers = [start(index) for index in range(options['workers'])]
+        while not stop_event.is_set():
+            for index, process in enumerate(workers):
+                if process.is_alive() or not should_restart(process.exitcode, options):
+                    continue
+                self.stderr.write(self.style.WARNING(
+                    f'{process.name} exited with code {process.exitcode}, restarting'))
+                workers[index] = start(index)
+            if not any(process.is_alive() for process in workers):
+                break
+            time.sleep(1)
+
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for process in workers:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
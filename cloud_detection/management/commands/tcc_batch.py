@@ -0,0 +1,95 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cloud_detection.admission import model_peak_mb, scene_header
+from cloud_detection.batch import find_inputs, run_batch
+from cloud_detection.insat_algorithm import PERSIST_MODES
+from cloud_detection.processing import TCC_PARAMETERS
+
+
+def default_workers(files, max_memory_mb):
+    """
+    Workers whose jobs fit in JOB_MEMORY_BUDGET_MB together when each runs
+    the largest of files (estimated from its header, as for queued jobs; see
+    admission.py), at most one per CPU.
+    """
+    largest_mb = 0.0
+    for path in files:
+        tiled = max_memory_mb is not None and os.path.getsize(path) > settings.TCC_TILED_THRESHOLD_MB * 1024 * 1024
+        try:
+            shape, itemsize = scene_header(path)
+        except Exception:
+            # Unreadable headers fail in the worker; count them as a tiled budget
+            estimate_mb = settings.TCC_MAX_MEMORY_MB
+        else:
+            estimate_mb = model_peak_mb(shape, itemsize, max_memory_mb if tiled else None)
+        largest_mb = max(largest_mb, estimate_mb)
+    if not settings.JOB_MEMORY_BUDGET_MB or not largest_mb:
+        return os.cpu_count()
+    return max(1, min(os.cpu_count(), int(settings.JOB_MEMORY_BUDGET_MB // largest_mb)))
+
+
+class Command(BaseCommand):
+    help = 'Run TCC detection over a directory or glob of L1B files, without the web app'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory of L1B files, or a glob pattern (quote it)')
+        parser.add_argument('--output-dir', default='tcc_batch',
+                            help='Where BT/mask arrays, plots and the summary are written')
+        parser.add_argument('--summary', default=None,
+                            help='Summary file; .csv for CSV, otherwise JSON lines (default: OUTPUT_DIR/summary.jsonl)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes (default: as many as JOB_MEMORY_BUDGET_MB fits, '
+                                 'at most one per CPU)')
+        parser.add_argument('--persist', choices=PERSIST_MODES, default='sync',
+                            help='Write BT/mask .npy arrays before each file is reported (sync), '
+                                 'in the background (async) or not at all (none)')
+        parser.add_argument('--plots', action='store_true', help='Render a plot per file')
+        parser.add_argument('--max-memory-mb', type=int, default=settings.TCC_MAX_MEMORY_MB,
+                            help='Tiled-mode memory budget for files above TCC_TILED_THRESHOLD_MB (0: never tile)')
+        parser.add_argument('--geo-cache-dir', default=settings.GEOLOCATION_CACHE_DIR,
+                            help='Cache of decoded lat/lon grids shared between files (empty disables)')
+        parser.add_argument('--reprocess', action='store_true',
+                            help='Process files even if the summary already has their results')
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        files = find_inputs(options['source'])
+        if not files:
+            raise CommandError(f'No L1B files found in {options["source"]}')
+        if options['workers'] is None:
+            options['workers'] = default_workers(files, options['max_memory_mb'] or None)
+        self.stdout.write(f'{len(files)} file(s), {options["workers"]} worker(s)')
+
+        report = run_batch(
+            options['source'], options['output_dir'], summary_path=options['summary'],
+            workers=options['workers'], parameters=TCC_PARAMETERS,
+            max_memory_mb=options['max_memory_mb'] or None, tiled_threshold_mb=settings.TCC_TILED_THRESHOLD_MB,
+            geo_cache_dir=options['geo_cache_dir'] or None, persist=options['persist'], make_plot=options['plots'],
+            reprocess=options['reprocess'], progress=self.report_file)
+
+        self.stdout.write(
+            f'Processed {report["processed"]}, skipped {report["skipped"]}, failed {report["failed"]} '
+            f'of {report["files"]} file(s) in {report["seconds"]:.1f}s '
+            f'({report["files_per_minute"]:.2f} files/minute)')
+        self.stdout.write(f'Summary: {report["summary"]}')
+        if report['failed']:
+            self.stdout.write(self.style.WARNING(f'{report["failed"]} file(s) failed; see the summary'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Batch complete'))
+
+    def report_file(self, record, skipped):
+        name = os.path.basename(record['file'])
+        if skipped:
+            self.stdout.write(f'  {name}: already processed, skipped')
+        elif record['status'] == 'ok':
+            coverage = record['cloud_coverage_percentage']
+            # None for a scene without a single valid pixel
+            coverage = 'n/a' if coverage is None else f'{coverage:.2f}%'
+            self.stdout.write(
+                f'  {name}: {coverage} TCC, {record["cloud_cluster_count"]} cluster(s), {record["seconds"]:.1f}s')
+        else:
+            self.stdout.write(self.style.ERROR(f'  {name}: {record["error"]}'))
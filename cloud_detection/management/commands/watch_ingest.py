@@ -0,0 +1,45 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from .run_workers import _install_stop_handlers
+
+
+class Command(BaseCommand):
+    help = 'Watch a directory and queue the L1B files dropped into it once they are fully written'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory the ground-station pipeline writes L1B files to')
+        parser.add_argument('--user', default=None,
+                            help='Username the ingested files are recorded as uploaded by')
+        parser.add_argument('--poll-interval', type=float, default=settings.INGEST_POLL_INTERVAL,
+                            help='Seconds between scans of the directory')
+        parser.add_argument('--stable-seconds', type=int, default=settings.INGEST_STABLE_SECONDS,
+                            help='Seconds a file must go unmodified before it is ingested')
+        parser.add_argument('--max-backlog', type=int, default=settings.INGEST_MAX_BACKLOG,
+                            help='Hold new files while this many jobs are queued or processing (0: no limit)')
+        parser.add_argument('--once', action='store_true',
+                            help='Scan the directory once and exit')
+
+    def handle(self, *args, **options):
+        from cloud_detection.ingest import run_ingest
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']!r}")
+
+        stop_event = threading.Event()
+        _install_stop_handlers(stop_event)
+        try:
+            ingested = run_ingest(
+                options['directory'], user=user, poll_interval=options['poll_interval'], stop_event=stop_event,
+                once=options['once'], stable_seconds=options['stable_seconds'],
+                max_backlog=options['max_backlog'])
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Ingested {ingested} file(s)'))
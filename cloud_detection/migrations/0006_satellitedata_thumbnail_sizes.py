@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_detection', '0005_satellitedata_gcs_bucket_satellitedata_gcs_path_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satellitedata',
+            name='thumbnail_retina',
+            field=models.FileField(blank=True, null=True, upload_to='thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='satellitedata',
+            name='thumbnail_small',
+            field=models.FileField(blank=True, null=True, upload_to='thumbnails/'),
+        ),
+    ]
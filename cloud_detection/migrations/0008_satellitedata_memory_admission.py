@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_detection', '0007_satellitedata_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satellitedata',
+            name='memory_estimate_mb',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='satellitedata',
+            name='peak_memory_mb',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_detection', '0008_satellitedata_memory_admission'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processinglog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
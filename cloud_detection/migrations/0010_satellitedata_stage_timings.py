@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_detection', '0009_processinglog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satellitedata',
+            name='stage_timings',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
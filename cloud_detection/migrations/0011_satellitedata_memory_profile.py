@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_detection', '0010_satellitedata_stage_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satellitedata',
+            name='memory_profile',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_detection', '0011_satellitedata_memory_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satellitedata',
+            name='content_sha256',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='satellitedata',
+            name='params_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='satellitedata',
+            name='reused_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reuses', to='cloud_detection.satellitedata'),
+        ),
+        migrations.AddIndex(
+            model_name='satellitedata',
+            index=models.Index(fields=['content_sha256', 'params_fingerprint'], name='satellitedata_dedup_idx'),
+        ),
+    ]
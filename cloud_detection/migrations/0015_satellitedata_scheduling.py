@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_detection', '0014_satellitedata_cancellation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satellitedata',
+            name='priority',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='satellitedata',
+            name='service_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='satellitedata',
+            name='wait_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_detection', '0015_satellitedata_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satellitedata',
+            name='ingest_source',
+            field=models.CharField(blank=True, db_index=True, max_length=500, null=True),
+        ),
+        migrations.AlterField(
+            model_name='satellitedata',
+            name='upload_source',
+            field=models.CharField(choices=[('direct', 'Direct Upload'), ('gcs', 'Google Cloud Storage'), ('watch', 'Watch Folder')], default='direct', max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_detection', '0016_satellitedata_ingest_source'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='satellitedata',
+            name='avg_temperature',
+            field=models.FloatField(blank=True, help_text='Kelvin, over the bounding box of the +/-30 degree band, not the full disk', null=True),
+        ),
+        migrations.AlterField(
+            model_name='satellitedata',
+            name='max_temperature',
+            field=models.FloatField(blank=True, help_text='Kelvin, over the bounding box of the +/-30 degree band, not the full disk', null=True),
+        ),
+        migrations.AlterField(
+            model_name='satellitedata',
+            name='min_temperature',
+            field=models.FloatField(blank=True, help_text='Kelvin, over the bounding box of the +/-30 degree band, not the full disk', null=True),
+        ),
+    ]
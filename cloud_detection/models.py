@@ -1,6 +1,8 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 import os
+import uuid
 
 
 class SatelliteData(models.Model):
@@ -8,9 +10,11 @@ class SatelliteData(models.Model):
     
     STATUS_CHOICES = [
         ('pending', 'Pending'),
+        ('queued', 'Queued'),
         ('processing', 'Processing'),
         ('completed', 'Completed'),
         ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
     ]
     
     # File information
@@ -23,9 +27,19 @@ class SatelliteData(models.Model):
     upload_source = models.CharField(max_length=20, default='direct', choices=[
         ('direct', 'Direct Upload'),
         ('gcs', 'Google Cloud Storage'),
+        ('watch', 'Watch Folder'),
     ])
     gcs_bucket = models.CharField(max_length=255, null=True, blank=True)
     gcs_path = models.CharField(max_length=500, null=True, blank=True)
+    # Watch-folder ingestion (see ingest.py): the file this row links to
+    ingest_source = models.CharField(max_length=500, null=True, blank=True, db_index=True)
+    
+    # Deduplication (see dedup.py): SHA-256 of the uploaded file, the
+    # parameters fingerprint of its result and the job whose result it shares
+    content_sha256 = models.CharField(max_length=64, null=True, blank=True)
+    params_fingerprint = models.CharField(max_length=64, null=True, blank=True)
+    reused_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='reuses')
     
     # Processing information
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -33,6 +47,30 @@ class SatelliteData(models.Model):
     processing_start_time = models.DateTimeField(null=True, blank=True)
     processing_end_time = models.DateTimeField(null=True, blank=True)
     
+    # Job queue (see jobs.py): a worker holds a row while its lease is live
+    queued_at = models.DateTimeField(null=True, blank=True)
+    lease_owner = models.CharField(max_length=100, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Set to stop a running job at its next cancellation point (see cancellation.py)
+    cancel_requested = models.BooleanField(default=False)
+    # Scheduling (see scheduling.py): higher priorities are claimed first;
+    # queue wait and service time of the claim that ran the job, in seconds
+    priority = models.SmallIntegerField(default=0)
+    wait_seconds = models.FloatField(null=True, blank=True)
+    service_seconds = models.FloatField(null=True, blank=True)
+    # Memory admission (see admission.py): header-based estimate (0 if the
+    # header was unreadable) and the observed peak RSS increase of the last
+    # run, in MB
+    memory_estimate_mb = models.FloatField(null=True, blank=True)
+    peak_memory_mb = models.FloatField(null=True, blank=True)
+    # Per-stage cost of the last run: {stage: [wall_s, cpu_s, read_bytes,
+    # write_bytes]} (see profiling.StageTimer)
+    stage_timings = models.JSONField(null=True, blank=True)
+    # Per-stage memory of the last run with TCC_MEMORY_PROFILE on
+    # (see profiling.MemoryProfiler)
+    memory_profile = models.JSONField(null=True, blank=True)
+    
     # Satellite data metadata
     satellite_name = models.CharField(max_length=100, default='INSAT')
     data_type = models.CharField(max_length=50, default='HDF5')
@@ -54,45 +92,49 @@ class SatelliteData(models.Model):
     min_longitude = models.FloatField(null=True, blank=True)
     max_longitude = models.FloatField(null=True, blank=True)
     
-    # Temperature statistics
-    min_temperature = models.FloatField(null=True, blank=True)
-    max_temperature = models.FloatField(null=True, blank=True)
-    avg_temperature = models.FloatField(null=True, blank=True)
+    # Temperature statistics, over the tropical window only (see
+    # insat_algorithm.extract_tcc_mask): BT outside it is not read
+    TEMPERATURE_HELP = 'Kelvin, over the bounding box of the +/-30 degree band, not the full disk'
+    min_temperature = models.FloatField(null=True, blank=True, help_text=TEMPERATURE_HELP)
+    max_temperature = models.FloatField(null=True, blank=True, help_text=TEMPERATURE_HELP)
+    avg_temperature = models.FloatField(null=True, blank=True, help_text=TEMPERATURE_HELP)
     
     # Additional metadata for display
     location_name = models.CharField(max_length=200, null=True, blank=True)
     weather_conditions = models.CharField(max_length=100, null=True, blank=True)
     cloud_cluster_count = models.IntegerField(null=True, blank=True)
+    # Preview thumbnails: card (300x200), list (120x80) and 2x card for retina
     thumbnail_image = models.FileField(upload_to='thumbnails/', null=True, blank=True)
+    thumbnail_small = models.FileField(upload_to='thumbnails/', null=True, blank=True)
+    thumbnail_retina = models.FileField(upload_to='thumbnails/', null=True, blank=True)
     
     # Error handling
     error_message = models.TextField(null=True, blank=True)
     
     class Meta:
         ordering = ['-upload_datetime']
+        indexes = [
+            models.Index(fields=['status', 'queued_at'], name='satellitedata_queue_idx'),
+            models.Index(fields=['content_sha256', 'params_fingerprint'], name='satellitedata_dedup_idx'),
+        ]
         verbose_name = 'Satellite Data'
         verbose_name_plural = 'Satellite Data'
     
     def __str__(self):
         return f"{self.file_name} - {self.status}"
     
+    def _shares_file(self, field_name):
+        """Whether another record references this record's file in field_name (deduplicated uploads)"""
+        name = getattr(self, field_name).name
+        return SatelliteData.objects.filter(**{field_name: name}).exclude(pk=self.pk).exists()
+    
     def delete(self, *args, **kwargs):
-        """Override delete to remove associated files"""
-        if self.file_path:
-            if os.path.isfile(self.file_path.path):
-                os.remove(self.file_path.path)
-        
-        if self.brightness_temperature_plot:
-            if os.path.isfile(self.brightness_temperature_plot.path):
-                os.remove(self.brightness_temperature_plot.path)
-        
-        if self.cloud_mask_plot:
-            if os.path.isfile(self.cloud_mask_plot.path):
-                os.remove(self.cloud_mask_plot.path)
-        
-        if self.processed_data_file:
-            if os.path.isfile(self.processed_data_file.path):
-                os.remove(self.processed_data_file.path)
+        """Override delete to remove associated files no other record shares"""
+        for field_name in ('file_path', 'brightness_temperature_plot', 'cloud_mask_plot', 'processed_data_file',
+                           'thumbnail_image', 'thumbnail_small', 'thumbnail_retina'):
+            field_file = getattr(self, field_name)
+            if field_file and os.path.isfile(field_file.path) and not self._shares_file(field_name):
+                os.remove(field_file.path)
         
         super().delete(*args, **kwargs)
 
@@ -101,7 +143,8 @@ class ProcessingLog(models.Model):
     """Model to store processing logs and debug information"""
     
     satellite_data = models.ForeignKey(SatelliteData, on_delete=models.CASCADE, related_name='logs')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the message is logged; logs are bulk-inserted later
+    timestamp = models.DateTimeField(default=timezone.now)
     level = models.CharField(max_length=20, choices=[
         ('info', 'Info'),
         ('warning', 'Warning'),
@@ -115,3 +158,38 @@ class ProcessingLog(models.Model):
     
     def __str__(self):
         return f"{self.satellite_data.file_name} - {self.level}: {self.message[:50]}..."
+
+
+class UploadSession(models.Model):
+    """A resumable chunked upload (see chunked_upload.py)"""
+    
+    STATE_CHOICES = [
+        ('open', 'Open'),
+        ('finalizing', 'Finalizing'),
+        ('complete', 'Complete'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    file_name = models.CharField(max_length=255)
+    file_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    satellite_name = models.CharField(max_length=100, default='INSAT')
+    data_type = models.CharField(max_length=50, default='HDF5')
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='open')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last state change; queryset updates of state set it explicitly
+    updated_at = models.DateTimeField(auto_now=True)
+    # The record created on finalize, so a retried finalize returns it again
+    satellite_data = models.ForeignKey(SatelliteData, on_delete=models.SET_NULL, null=True, blank=True,
+                                       related_name='+')
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.file_name} ({self.state})"
+    
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.file_size // self.chunk_size))
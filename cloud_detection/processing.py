@@ -6,9 +6,22 @@ import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 from matplotlib.colors import LinearSegmentedColormap
 import os
+from contextlib import ExitStack
+from functools import partial
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.utils import timezone
-from .models import SatelliteData, ProcessingLog
+from .cancellation import CancelToken, JobCancelled
+from .checkpoints import StageManifest
+from .dedup import ARTIFACT_FIELDS, RESULT_FIELDS, find_reusable_result, reuse_result
+from .hdf5_session import HDF5Session, REQUIRED_DATASETS
+from .input_cache import GCSSource, input_cache, temporary_download
+from .job_logging import JobLogger
+from .models import SatelliteData
+from .profiling import MemoryProfiler, StageTimer
+from .scene_stats import (
+    BandCloudCounts, BTStats, CloudBTStats, GeoBounds, PixelCounts, scene_statistics,
+)
 import io
 import base64
 from datetime import datetime
@@ -18,7 +31,7 @@ import gc
 
 # Import the original confidential algorithm (DO NOT MODIFY)
 try:
-    from .insat_algorithm import extract_tcc_mask, save_plot
+    from .insat_algorithm import extract_tcc_mask, parameters_fingerprint, save_plot
     ALGORITHM_AVAILABLE = True
     print("✅ Original INSAT algorithm imported successfully")
 except ImportError as e:
@@ -35,19 +48,62 @@ except ImportError as e:
     print(f"❌ h5py import failed at module level: {e}")
 
 
+# Science parameters of every processing run
+TCC_PARAMETERS = {
+    'min_radius_km': 111,
+    'pixel_resolution_km': 4.0,
+    'min_size_pixels': 100,
+}
+
+
+def tcc_fingerprint():
+    """Fingerprint of the results the processor currently produces (see dedup.py)."""
+    return parameters_fingerprint(**TCC_PARAMETERS)
+
+
+def tile_budget_mb(file_size):
+    """Memory budget for tiled processing of a file this size, or None for whole-grid."""
+    if file_size > settings.TCC_TILED_THRESHOLD_MB * 1024 * 1024:
+        return settings.TCC_MAX_MEMORY_MB
+    return None
+
+
 class CloudDetectionProcessor:
     """Django wrapper for the original INSAT-3DR cloud detection algorithm"""
     
-    def __init__(self, satellite_data_instance):
+    # Columns the processor writes. Saves are limited to these: the lease and
+    # cancel_requested are updated concurrently by the worker and cancel_job.
+    PROFILE_FIELDS = ['stage_timings', 'memory_profile']
+    OUTCOME_FIELDS = ['status', 'error_message', 'processing_end_time'] + PROFILE_FIELDS
+    
+    def __init__(self, satellite_data_instance, job_logger=None, input_source=None, cancel_token=None):
         self.satellite_data = satellite_data_instance
+        self.job_logger = job_logger or JobLogger(satellite_data_instance)
+        # Where GCS-sourced inputs come from (see input_cache.py)
+        self.input_source = input_source or GCSSource()
+        # Cache entries or temporary downloads held until the job ends
+        self.inputs = ExitStack()
+        # Completed stages of this and earlier attempts (see checkpoints.py)
+        self.manifest = None
+        # Generation of the job's GCS object, looked up once (see gcs_generation)
+        self._gcs_generation = None
+        # Checked between stages, tiles and chunks (see cancellation.py)
+        self.cancel_token = cancel_token or CancelToken()
+        # Opt-in: tracemalloc slows every allocation down
+        self.memory_profiler = MemoryProfiler() if settings.TCC_MEMORY_PROFILE else None
+        self.stage_timer = StageTimer(self.memory_profiler)
+    
+    @property
+    def output_dir(self):
+        return os.path.join('media', 'results', str(self.satellite_data.id))
         
     def log_message(self, level, message):
-        """Log processing messages"""
-        ProcessingLog.objects.create(
-            satellite_data=self.satellite_data,
-            level=level,
-            message=message
-        )
+        """Log processing messages (buffered; see flush_logs)"""
+        self.job_logger.log(level, message)
+    
+    def flush_logs(self):
+        """Write buffered log messages; called at stage boundaries and job end"""
+        self.job_logger.flush()
     
     def log_memory_usage(self):
         """Log current memory usage"""
@@ -63,90 +119,213 @@ class CloudDetectionProcessor:
         """
         Process satellite data using the original algorithm
         """
+        if self.memory_profiler:
+            self.memory_profiler.start()
         try:
             self.satellite_data.status = 'processing'
             self.satellite_data.processing_start_time = timezone.now()
-            self.satellite_data.save()
+            self.satellite_data.save(update_fields=['status', 'processing_start_time'])
             
             self.log_message('info', f'Starting processing for: {self.satellite_data.file_name}')
-            self.log_memory_usage()
             
-            # Check if this is a GCS file or local file
-            if self.satellite_data.upload_source == 'gcs':
-                self.log_message('info', 'Processing GCS file - downloading to temporary location')
-                # Download file from GCS to temporary location
-                temp_file_path = self.download_gcs_file()
-                self.log_message('info', f'GCS file downloaded to: {temp_file_path}')
-            else:
-                # Local file - use existing path
-                temp_file_path = self.satellite_data.file_path.path
-                self.log_message('info', f'Processing local file: {temp_file_path}')
-            
-            # Test file access
-            if not os.path.exists(temp_file_path):
-                raise Exception(f"File not found: {temp_file_path}")
+            # An identical file may have been processed since this job was queued
+            donor = find_reusable_result(self.satellite_data, tcc_fingerprint())
+            if donor is not None:
+                reuse_result(self.satellite_data, donor)
+                return
+            self.log_memory_usage()
+            self.cancel_token.check()
             
-            self.log_message('info', f'Processing file: {self.satellite_data.file_name}')
-            self.log_message('info', f'File path: {temp_file_path}')
+            # Stages completed by an earlier attempt are not run again
+            self.manifest = self.load_checkpoints()
             
-            # Call the original algorithm with the correct file path
-            result = self.call_original_algorithm(temp_file_path)
+            # The BT/mask arrays are only needed while statistics or plot are missing
+            result = None
+            if self.manifest.completed('stats') is None or self.manifest.completed('plot') is None:
+                result = self.compute_arrays()
             
             # Adapt results to Django models
             try:
-                self.adapt_results_to_django(result, temp_file_path)
+                with self.stage_timer.stage('save'):
+                    self.adapt_results_to_django(result)
                 self.log_message('info', 'Results adapted to Django models successfully')
+            except JobCancelled:
+                raise
             except Exception as e:
                 self.log_message('error', f'Failed to adapt results to Django: {str(e)}')
                 raise
-            
-            # Clean up temporary file if it was downloaded from GCS
-            if self.satellite_data.upload_source == 'gcs' and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-                self.log_message('info', 'Temporary GCS file cleaned up')
+            finally:
+                if result is not None:
+                    with self.stage_timer.stage('persist'):
+                        self.wait_for_persisted_arrays(result)
             
             # Mark as completed
             self.satellite_data.status = 'completed'
+            self.satellite_data.params_fingerprint = tcc_fingerprint()
             self.satellite_data.processing_end_time = timezone.now()
-            self.satellite_data.save()
+            self.record_profiles()
+            self.satellite_data.save(update_fields=self.OUTCOME_FIELDS + ['params_fingerprint'])
+            self.manifest.record('commit')
+            self.log_stage_timings()
             
             self.log_message('info', 'INSAT-3DR processing completed successfully')
             self.log_memory_usage()
             
+        except JobCancelled as e:
+            # A timed-out job would time out again: it fails rather than being retried
+            self.satellite_data.status = 'failed' if e.timed_out else 'cancelled'
+            self.satellite_data.error_message = e.reason
+            self.satellite_data.processing_end_time = timezone.now()
+            self.record_profiles()
+            self.satellite_data.save(update_fields=self.OUTCOME_FIELDS)
+            
+            self.log_message('warning', f'Processing stopped: {e.reason}')
         except Exception as e:
             self.satellite_data.status = 'failed'
             self.satellite_data.error_message = str(e)
             self.satellite_data.processing_end_time = timezone.now()
-            self.satellite_data.save()
+            self.record_profiles()
+            self.satellite_data.save(update_fields=self.OUTCOME_FIELDS)
             
             self.log_message('error', f'Processing failed: {str(e)}')
             self.log_message('debug', f'Traceback: {traceback.format_exc()}')
+        finally:
+            # Release the input's cache entry, or remove its temporary download
+            self.inputs.close()
+            if self.memory_profiler:
+                self.memory_profiler.stop()
+            self.flush_logs()
     
-    def download_gcs_file(self):
+    def record_profiles(self):
+        """Attach the stage timings (and memory profile, if enabled) to the job"""
+        self.satellite_data.stage_timings = self.stage_timer.as_dict()
+        self.satellite_data.memory_profile = self.memory_profiler.as_dict() if self.memory_profiler else None
+
+    def log_stage_timings(self):
+        """Log where the job's time went, slowest stage first"""
+        stages = sorted(self.stage_timer.stages.items(), key=lambda item: -item[1][0])
+        summary = ', '.join(f'{name} {wall:.2f}s' for name, (wall, *_rest) in stages)
+        self.log_message('info', f'Stage timings: {summary}')
+
+    def wait_for_persisted_arrays(self, result):
+        """Wait for the background .npy writer; the artifacts are not needed for the results"""
+        future = result.get("persist_future")
+        if future is None:
+            return
+        try:
+            future.result()
+            self.log_message('info', f'Saved arrays: {result["bt_file"]}, {result["mask_file"]}')
+            self.checkpoint_arrays(result)
+        except Exception as e:
+            self.log_message('warning', f'Failed to save BT/mask arrays: {str(e)}')
+
+    def gcs_generation(self):
+        """Generation of the job's GCS object, shared by the checkpoint key and the input cache"""
+        if self._gcs_generation is None:
+            data = self.satellite_data
+            self._gcs_generation = self.input_source.generation(data.gcs_bucket, data.gcs_path)
+        return self._gcs_generation
+
+    def checkpoint_key(self):
+        """What checkpoints must have been computed from to be reused"""
+        data = self.satellite_data
+        if data.upload_source == 'gcs':
+            source = {'gcs': f'{data.gcs_bucket}/{data.gcs_path}',
+                      'generation': self.gcs_generation()}
+        else:
+            source = {'file': data.file_path.name, 'size': data.file_size, 'sha256': data.content_sha256}
+        return {'input': source, 'parameters': tcc_fingerprint(), 'render_mode': settings.TCC_RENDER_MODE}
+
+    def load_checkpoints(self):
+        manifest = StageManifest.load(self.output_dir, self.checkpoint_key())
+        if 'commit' in manifest.stages:
+            # The last attempt completed: this is a reprocess, not a retry
+            manifest.stages = {}
+        elif manifest.stages:
+            self.log_message('info', f'Stages checkpointed by an earlier attempt: {", ".join(manifest.stages)}')
+        return manifest
+
+    def checkpoint_arrays(self, result):
+        self.manifest.record(
+            'arrays', {'bt': result['bt_file'], 'mask': result['mask_file']},
+            base_name=result['base_name'], cluster_count=result['cluster_count'], extent=result['extent'])
+
+    def compute_arrays(self):
         """
-        Download file from Google Cloud Storage to temporary location
+        BT grid, TCC mask and cluster results: from the checkpoint of an
+        earlier attempt (memory-mapped; no geolocation grids, as in tiled
+        mode) or by fetching the input and running the algorithm
         """
+        checkpoint = self.manifest.completed('arrays')
+        if checkpoint is not None:
+            self.log_message('info', 'Using the BT/mask arrays of an earlier attempt')
+            artifacts, data = checkpoint['artifacts'], checkpoint['data']
+            return {
+                "bt_file": artifacts['bt'],
+                "mask_file": artifacts['mask'],
+                "base_name": data['base_name'],
+                "cluster_count": data['cluster_count'],
+                "extent": data['extent'],
+                "bt": np.load(artifacts['bt'], mmap_mode='r'),
+                "mask": np.load(artifacts['mask'], mmap_mode='r'),
+                "lat": None,
+                "lon": None,
+                "persist_future": None,
+            }
+        
+        input_path = self.fetch_input()
+        self.cancel_token.check()
+        
+        # Call the original algorithm with the correct file path
+        with self.stage_timer.stage('algorithm'):
+            result = self.call_original_algorithm(input_path)
+        self.flush_logs()
+        # Arrays written in the background are checkpointed once on disk
+        if result['bt_file'] is not None and result['persist_future'] is None:
+            self.checkpoint_arrays(result)
+        return result
+
+    def fetch_input(self):
+        """Local path of the job's input file"""
+        # Check if this is a GCS file or local file
+        if self.satellite_data.upload_source == 'gcs':
+            # Local copy from the input cache (or a temporary download)
+            with self.stage_timer.stage('download'):
+                input_path = self.fetch_gcs_file()
+        else:
+            # Local file - use existing path
+            input_path = self.satellite_data.file_path.path
+            self.log_message('info', f'Processing local file: {input_path}')
+        self.flush_logs()
+        
+        # Test file access
+        if not os.path.exists(input_path):
+            raise Exception(f"File not found: {input_path}")
+        
+        self.log_message('info', f'Processing file: {self.satellite_data.file_name}')
+        self.log_message('info', f'File path: {input_path}')
+        return input_path
+
+    def fetch_gcs_file(self):
+        """
+        Local path of the job's GCS object, held until the job ends: an
+        entry of the node-local input cache, or a temporary download when
+        the cache is disabled
+        """
+        bucket, path = self.satellite_data.gcs_bucket, self.satellite_data.gcs_path
         try:
-            from google.cloud import storage
-            import tempfile
-            
-            # Initialize GCS client
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(self.satellite_data.gcs_bucket)
-            blob = bucket.blob(self.satellite_data.gcs_path)
-            
-            # Create temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.h5')
-            temp_file_path = temp_file.name
-            temp_file.close()
-            
-            # Download file from GCS
-            self.log_message('info', f'Downloading from GCS: gs://{self.satellite_data.gcs_bucket}/{self.satellite_data.gcs_path}')
-            blob.download_to_filename(temp_file_path)
-            
-            self.log_message('info', f'File downloaded successfully to: {temp_file_path}')
-            return temp_file_path
-            
+            generation = self.gcs_generation()
+            fetch = partial(self.input_source.download, bucket, path, generation)
+            cache = input_cache()
+            if cache is None:
+                self.log_message('info', f'Downloading gs://{bucket}/{path} to a temporary file')
+                return self.inputs.enter_context(temporary_download(fetch))
+            local_path, cached = self.inputs.enter_context(cache.open(bucket, path, generation, fetch))
+            if cached:
+                self.log_message('info', f'Using cached copy of gs://{bucket}/{path} (generation {generation})')
+            else:
+                self.log_message('info', f'Downloaded gs://{bucket}/{path} (generation {generation}) into the input cache')
+            return local_path
         except Exception as e:
             self.log_message('error', f'Failed to download GCS file: {str(e)}')
             raise Exception(f"GCS download failed: {str(e)}")
@@ -161,7 +340,7 @@ class CloudDetectionProcessor:
             base_name = os.path.basename(filename).split('_L1B')[0] if '_L1B' in filename else os.path.splitext(os.path.basename(filename))[0]
             
             # Create output directory 
-            output_dir = os.path.join('media', 'results', str(self.satellite_data.id))
+            output_dir = self.output_dir
             
             self.log_message('info', f'Processing file: {base_name}')
             self.log_message('info', f'Output directory: {output_dir}')
@@ -169,20 +348,6 @@ class CloudDetectionProcessor:
             # Additional pre-flight checks
             self.log_message('info', 'Performing pre-flight checks...')
             
-            # Test h5py import right before algorithm call
-            try:
-                import h5py
-                self.log_message('info', f'h5py import verified: {h5py.__version__}')
-            except ImportError as e:
-                raise Exception(f"h5py import failed before algorithm call: {e}")
-            
-            # Test file readability
-            try:
-                with h5py.File(filename, 'r') as test_file:
-                    self.log_message('info', f'File readable, contains keys: {list(test_file.keys())}')
-            except Exception as e:
-                raise Exception(f"Cannot read HDF5 file: {e}")
-            
             # Ensure output directory exists
             os.makedirs(output_dir, exist_ok=True)
             self.log_message('info', f'Output directory ready: {output_dir}')
@@ -194,97 +359,83 @@ class CloudDetectionProcessor:
             import gc
             gc.collect()
             
-            # Memory optimization: Process in chunks for large files
+            # Open the input once for the whole job: the datasets are checked
+            # from metadata here and the algorithm reads from this session
+            session = HDF5Session(filename).open()
+            rows, cols = session.shape
+            self.log_message('info', f'File readable: {", ".join(REQUIRED_DATASETS)} present, scene {rows}x{cols}')
+            
+            # Memory optimization: Process in row tiles for large files.
+            # Tiling bounds peak memory without changing the science parameters.
             try:
-                # For files > 50MB, use memory-optimized processing
-                file_size = os.path.getsize(filename)
-                if file_size > 50 * 1024 * 1024:  # 50MB
-                    self.log_message('info', f'Large file detected ({file_size / 1024 / 1024:.1f}MB), using memory optimization')
-                    
-                    # Use smaller processing parameters for memory efficiency
-                    result = extract_tcc_mask(
-                        filename=filename,
-                        output_dir=output_dir,
-                        min_radius_km=50,  # Reduced from 111
-                        pixel_resolution_km=4.0,
-                        min_size_pixels=200  # Increased from 100
-                    )
-                else:
-                    # Standard processing for smaller files
-                    result = extract_tcc_mask(
-                        filename=filename,
-                        output_dir=output_dir,
-                        min_radius_km=111,
-                        pixel_resolution_km=4.0,
-                        min_size_pixels=100
-                    )
+                max_memory_mb = tile_budget_mb(os.path.getsize(filename))
+                if max_memory_mb is not None:
+                    self.log_message('info', f'Large file detected ({os.path.getsize(filename) / 1024 / 1024:.1f}MB), using tiled processing with a {max_memory_mb}MB budget')
+                
+                result = extract_tcc_mask(
+                    filename=filename,
+                    output_dir=output_dir,
+                    **TCC_PARAMETERS,
+                    max_memory_mb=max_memory_mb,
+                    geo_cache_dir=settings.GEOLOCATION_CACHE_DIR,
+                    persist=settings.TCC_PERSIST_ARRAYS,
+                    # Plot and thumbnails are their own checkpointed stage
+                    make_plot=False,
+                    stage_timer=self.stage_timer,
+                    session=session,
+                    cancel=self.cancel_token.check
+                )
                 
                 self.log_message('info', f'Algorithm completed for: {result["base_name"]}')
-                self.log_message('info', f'Generated files: BT, mask, and plot')
+                self.log_message('info', f'Generated BT and mask arrays')
                 
                 return result
                 
             finally:
+                session.close()
                 # Force cleanup after processing
                 gc.collect()
             
+        except JobCancelled:
+            raise
         except Exception as e:
             self.log_message('error', f'Failed to call original algorithm: {str(e)}')
             self.log_message('debug', f'Full traceback: {traceback.format_exc()}')
             raise
     
-    def adapt_results_to_django(self, result, filename):
+    def adapt_results_to_django(self, result):
         """
         Adapt the results from the original algorithm to Django models
-        WITHOUT modifying the algorithm itself
+        WITHOUT modifying the algorithm itself. result is None when the
+        statistics and plot stages are both checkpointed.
         """
         try:
-            # Load the data files created by the original algorithm with memory optimization
-            bt_data = np.load(result["bt_file"])
-            mask_data = np.load(result["mask_file"])
+            checkpoint = self.manifest.completed('stats')
+            if checkpoint is not None:
+                stats, extent, cluster_count = (
+                    checkpoint['data']['stats'], checkpoint['data']['extent'], checkpoint['data']['cluster_count'])
+                self.log_message('info', 'Using the statistics of an earlier attempt')
+            else:
+                stats, extent, cluster_count = self.compute_statistics(result)
             
-            # Calculate statistics from the results
-            total_pixels = mask_data.size
-            cloud_pixels = np.sum(mask_data)
+            total_pixels = stats["pixels"]["total"]
+            cloud_pixels = stats["pixels"]["cloud"]
             cloud_coverage = (cloud_pixels / total_pixels) * 100
             
-            # Count cloud clusters with memory optimization
-            from skimage.measure import label
-            labeled_mask = label(mask_data)
-            cluster_count = np.max(labeled_mask)
-            
-            # Clear memory after cluster counting
-            del labeled_mask
-            import gc
-            gc.collect()
-            
-            # Extract geographic and temperature data from original file with memory optimization
-            with h5py.File(filename, 'r') as f:
-                # Load data in chunks to reduce memory usage
-                lat_raw = f['Latitude'][:].astype(np.float32)
-                lon_raw = f['Longitude'][:].astype(np.float32)
-                lat = lat_raw * f['Latitude'].attrs['scale_factor']
-                lon = lon_raw * f['Longitude'].attrs['scale_factor']
-                lat[lat_raw == f['Latitude'].attrs['_FillValue']] = np.nan
-                lon[lon_raw == f['Longitude'].attrs['_FillValue']] = np.nan
-                
-                # Clear raw data to free memory
-                del lat_raw, lon_raw
-                gc.collect()
-            
             # Update Django model with statistics
             self.satellite_data.total_pixels = total_pixels
             self.satellite_data.cloud_pixels = cloud_pixels
             self.satellite_data.cloud_coverage_percentage = cloud_coverage
             self.satellite_data.cloud_cluster_count = cluster_count
             
-            # Store geographic bounds with error handling
-            try:
-                self.satellite_data.min_latitude = float(np.nanmin(lat))
-                self.satellite_data.max_latitude = float(np.nanmax(lat))
-                self.satellite_data.min_longitude = float(np.nanmin(lon))
-                self.satellite_data.max_longitude = float(np.nanmax(lon))
-            except (ValueError, RuntimeError):
+            # Store geographic bounds (extent comes from the algorithm's geolocation pass)
+            if extent is not None:
+                lon_min, lon_max, lat_min, lat_max = extent
+                self.satellite_data.min_latitude = float(lat_min)
+                self.satellite_data.max_latitude = float(lat_max)
+                self.satellite_data.min_longitude = float(lon_min)
+                self.satellite_data.max_longitude = float(lon_max)
+            else:
                 # Fallback values if coordinate data is problematic
                 self.satellite_data.min_latitude = 5.0
                 self.satellite_data.max_latitude = 25.0
@@ -292,16 +443,12 @@ class CloudDetectionProcessor:
                 self.satellite_data.max_longitude = 90.0
                 self.log_message('warning', 'Using fallback geographic bounds due to data issues')
             
-            # Store temperature statistics with memory optimization
-            valid_bt = bt_data[~np.isnan(bt_data)]
-            if len(valid_bt) > 0:
-                self.satellite_data.min_temperature = float(np.min(valid_bt))
-                self.satellite_data.max_temperature = float(np.max(valid_bt))
-                self.satellite_data.avg_temperature = float(np.mean(valid_bt))
-            
-            # Clear large arrays to free memory
-            del bt_data, mask_data, lat, lon, valid_bt
-            gc.collect()
+            # Store temperature statistics
+            bt_stats = stats["bt"]
+            if bt_stats["count"] > 0:
+                self.satellite_data.min_temperature = bt_stats["min"]
+                self.satellite_data.max_temperature = bt_stats["max"]
+                self.satellite_data.avg_temperature = bt_stats["mean"]
             
             # Generate location name from coordinates
             center_lat = (self.satellite_data.min_latitude + self.satellite_data.max_latitude) / 2
@@ -323,24 +470,85 @@ class CloudDetectionProcessor:
             else:
                 self.satellite_data.weather_conditions = "Overcast"
             
-            # Copy the plot file to Django media field
-            self.copy_plot_to_django_media(result["plot_file"])
+            # Render the plot and thumbnails, and copy the plot to Django media
+            self.cancel_token.check()
+            thumbnail_files = self.render_plot(result, extent)
             
-            # Generate thumbnail
-            self.generate_thumbnail(result["plot_file"])
+            # Save thumbnails rendered alongside the plot
+            self.cancel_token.check()
+            self.save_thumbnails(thumbnail_files)
             
-            self.satellite_data.save()
+            self.satellite_data.save(update_fields=[
+                field for field in RESULT_FIELDS + ARTIFACT_FIELDS if field != 'params_fingerprint'])
             
             self.log_message('info', f'Total pixels: {total_pixels:,}')
             self.log_message('info', f'Cloud pixels: {cloud_pixels:,}')
             self.log_message('info', f'Cloud coverage: {cloud_coverage:.2f}%')
             self.log_message('info', f'Geographic bounds: {self.satellite_data.min_latitude:.2f}°-{self.satellite_data.max_latitude:.2f}°N, {self.satellite_data.min_longitude:.2f}°-{self.satellite_data.max_longitude:.2f}°E')
             self.log_message('info', f'Temperature range: {self.satellite_data.min_temperature:.1f}K - {self.satellite_data.max_temperature:.1f}K')
+            cloud_bt = stats["cloud_bt"]
+            if cloud_bt["count"] > 0:
+                self.log_message('info', f'Cloud-top temperature: {cloud_bt["min"]:.1f}K - {cloud_bt["max"]:.1f}K (mean {cloud_bt["mean"]:.1f}K)')
+            if "band_cloud" in stats:
+                self.log_message('info', f'TCC pixels by band: NIO {stats["band_cloud"]["nio"]:,}, SIO {stats["band_cloud"]["sio"]:,}')
             
+        except JobCancelled:
+            raise
         except Exception as e:
             self.log_message('error', f'Failed to adapt results: {str(e)}')
             raise
     
+    def compute_statistics(self, result):
+        """Statistics stage: (stats, extent, cluster count), checkpointed"""
+        # All statistics in one chunked pass over the in-memory arrays
+        extent = result.get("extent")
+        lat, lon = result.get("lat"), result.get("lon")
+        accumulators = [PixelCounts(), BTStats(), CloudBTStats()]
+        if lat is not None and lon is not None:
+            accumulators.append(BandCloudCounts())
+            if extent is None:
+                accumulators.append(GeoBounds())
+        with self.stage_timer.stage('stats'):
+            stats = scene_statistics(result["bt"], result["mask"], lat, lon, accumulators,
+                                     cancel=self.cancel_token.check)
+        extent = stats.get("extent", extent)
+        
+        # Cluster count comes from the algorithm's own labelling pass
+        cluster_count = result["cluster_count"]
+        self.manifest.record('stats', stats=stats, extent=extent, cluster_count=cluster_count)
+        return stats, extent, cluster_count
+    
+    def render_plot(self, result, extent):
+        """
+        Plot stage: render the plot and thumbnails from the arrays and copy
+        the plot to Django media, checkpointed. Returns the thumbnail files
+        ({thumbnail name: path}).
+        """
+        checkpoint = self.manifest.completed('plot')
+        if checkpoint is not None:
+            self.satellite_data.brightness_temperature_plot.name = checkpoint['data']['media_name']
+            self.log_message('info', 'Using the plot and thumbnails of an earlier attempt')
+            return {name[len('thumb_'):]: path for name, path in checkpoint['artifacts'].items()
+                    if name.startswith('thumb_')}
+        
+        plot_path = os.path.join(self.output_dir, f'{result["base_name"]}_plot.png')
+        with self.stage_timer.stage('plot'):
+            thumbnails = save_plot(result["bt"], result["mask"], result["lat"], result["lon"], plot_path,
+                                   extent=extent, render_mode=settings.TCC_RENDER_MODE, make_thumbnails=True,
+                                   stage_timer=self.stage_timer)
+        thumbnail_files = {}
+        for name, data in (thumbnails or {}).items():
+            thumbnail_files[name] = os.path.join(self.output_dir, f'{result["base_name"]}_thumb_{name}.webp')
+            with open(thumbnail_files[name], 'wb') as f:
+                f.write(data)
+        
+        self.copy_plot_to_django_media(plot_path)
+        artifacts = {'plot': plot_path, **{f'thumb_{name}': path for name, path in thumbnail_files.items()}}
+        if self.satellite_data.brightness_temperature_plot:
+            artifacts['media'] = self.satellite_data.brightness_temperature_plot.path
+        self.manifest.record('plot', artifacts, media_name=self.satellite_data.brightness_temperature_plot.name)
+        return thumbnail_files
+    
     def copy_plot_to_django_media(self, plot_path):
         """Copy the plot file generated by original algorithm to Django media field"""
         try:
@@ -351,8 +559,9 @@ class CloudDetectionProcessor:
                 # Save to Django FileField
                 filename = f'insat3dr_results_{self.satellite_data.id}.png'
                 self.satellite_data.brightness_temperature_plot.save(
-                    filename, ContentFile(plot_content), save=True
+                    filename, ContentFile(plot_content), save=False
                 )
+                self.satellite_data.save(update_fields=['brightness_temperature_plot'])
                 
                 self.log_message('info', f'Plot saved to Django media: {filename}')
             else:
@@ -362,35 +571,48 @@ class CloudDetectionProcessor:
             self.log_message('error', f'Failed to copy plot: {str(e)}')
             raise
     
-    def generate_thumbnail(self, plot_path):
-        """Generate thumbnail image for card display"""
+    # Thumbnail name (rendering.THUMBNAIL_SIZES) -> model field
+    THUMBNAIL_FIELDS = {
+        'card': 'thumbnail_image',
+        'list': 'thumbnail_small',
+        'retina': 'thumbnail_retina',
+    }
+
+    def save_thumbnails(self, thumbnail_files):
+        """Thumbnail stage: save the rendered thumbnails to their fields, checkpointed"""
         try:
-            if os.path.exists(plot_path):
-                from PIL import Image
-                
-                # Create thumbnail
-                with Image.open(plot_path) as img:
-                    # Create thumbnail (300x200 pixels)
-                    img.thumbnail((300, 200), Image.Resampling.LANCZOS)
-                    
-                    # Save to BytesIO
-                    thumb_io = io.BytesIO()
-                    img.save(thumb_io, format='PNG', quality=85)
-                    thumb_io.seek(0)
-                    
-                    # Save to Django FileField
-                    filename = f'thumb_{self.satellite_data.id}.png'
-                    self.satellite_data.thumbnail_image.save(
-                        filename, ContentFile(thumb_io.read()), save=True
-                    )
-                    
-                    self.log_message('info', f'Thumbnail saved: {filename}')
-                    
-            else:
-                self.log_message('warning', f'Plot file not found for thumbnail: {plot_path}')
+            checkpoint = self.manifest.completed('thumbnails')
+            if checkpoint is not None:
+                for field_name, name in checkpoint['data']['names'].items():
+                    getattr(self.satellite_data, field_name).name = name
+                self.log_message('info', 'Using the thumbnails saved by an earlier attempt')
+                return
+            
+            if not thumbnail_files:
+                self.log_message('warning', 'No thumbnails were rendered')
+                return
+            
+            sizes = []
+            for name, field_name in self.THUMBNAIL_FIELDS.items():
+                if name not in thumbnail_files:
+                    continue
+                with open(thumbnail_files[name], 'rb') as f:
+                    data = f.read()
+                filename = f'thumb_{name}_{self.satellite_data.id}.webp'
+                getattr(self.satellite_data, field_name).save(
+                    filename, ContentFile(data), save=False
+                )
+                sizes.append(f'{name} {len(data) / 1024:.1f}KB')
+            self.satellite_data.save(update_fields=list(self.THUMBNAIL_FIELDS.values()))
+            
+            fields = [field_name for name, field_name in self.THUMBNAIL_FIELDS.items() if name in thumbnail_files]
+            self.manifest.record(
+                'thumbnails', {field_name: getattr(self.satellite_data, field_name).path for field_name in fields},
+                names={field_name: getattr(self.satellite_data, field_name).name for field_name in fields})
+            self.log_message('info', f'Thumbnails saved: {", ".join(sizes)}')
                 
         except Exception as e:
-            self.log_message('error', f'Failed to generate thumbnail: {str(e)}')
+            self.log_message('error', f'Failed to save thumbnails: {str(e)}')
             # Don't raise - thumbnail generation is not critical
 
 
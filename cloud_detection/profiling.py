@@ -0,0 +1,299 @@
+"""
+Runtime resource measurement for processing jobs.
+"""
+
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import psutil
+
+# Per-stage measurements, in the order StageTimer.as_dict() stores them
+STAGE_FIELDS = ('wall_s', 'cpu_s', 'read_bytes', 'write_bytes')
+
+# Allocation sites kept per stage, and the traceback depth recorded: deep
+# enough to get from numpy/scipy/h5py internals back to the calling line
+MEMORY_TOP_SITES = 5
+TRACEMALLOC_FRAMES = 12
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds between RSS samples; short enough to catch the peak of the
+# whole-grid stages, which hold their arrays for well over a second
+RSS_SAMPLE_INTERVAL = 0.1
+
+
+def current_rss_mb():
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+
+def rss_high_water_mb():
+    """This process's peak RSS (VmHWM) since start or the last reset, or None."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_rss_high_water():
+    """Restart VmHWM from the current RSS (Linux); returns whether it worked."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class PeakRSSSampler(threading.Thread):
+    """
+    Samples this process's RSS until stopped. stop() returns the peak
+    increase over the RSS at start, i.e. what the measured work added.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        super().__init__(name='rss-sampler', daemon=True)
+        self.interval = interval
+        self.baseline_mb = current_rss_mb()
+        self.peak_mb = self.baseline_mb
+        self._stopped = threading.Event()
+
+    def _sample(self):
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self._sample()
+        return self.peak_mb - self.baseline_mb
+
+
+def _io_bytes(process):
+    """(read, written) bytes of this process so far; (0, 0) where unsupported."""
+    try:
+        io = process.io_counters()
+    except (AttributeError, psutil.Error, NotImplementedError):
+        return 0, 0
+    # rchar/wchar include page-cache hits, i.e. what the stage asked for
+    return getattr(io, 'read_chars', io.read_bytes), getattr(io, 'write_chars', io.write_bytes)
+
+
+class StageTimer:
+    """
+    Wall time, CPU time and I/O bytes of named pipeline stages. Stages may
+    nest; a stage is charged only for the time not spent in its sub-stages,
+    so the stages of a job add up to its total. A stage entered more than
+    once accumulates. I/O is per process, so bytes moved by background
+    threads during a stage are counted in it.
+    """
+
+    def __init__(self, memory_profiler=None):
+        self.stages = {}
+        self.memory_profiler = memory_profiler
+        self._process = psutil.Process()
+        # Totals of the sub-stages of each open stage
+        self._children = []
+
+    def _sample(self):
+        return (time.perf_counter(), time.process_time()) + _io_bytes(self._process)
+
+    @contextmanager
+    def stage(self, name):
+        memory = self.memory_profiler.stage(name) if self.memory_profiler else nullcontext()
+        with memory:
+            with self._timed(name):
+                yield
+
+    @contextmanager
+    def _timed(self, name):
+        start = self._sample()
+        self._children.append([0.0, 0.0, 0, 0])
+        try:
+            yield
+        finally:
+            children = self._children.pop()
+            spent = [end - begin for end, begin in zip(self._sample(), start)]
+            if self._children:
+                parent = self._children[-1]
+                for i, value in enumerate(spent):
+                    parent[i] += value
+            totals = self.stages.setdefault(name, [0.0, 0.0, 0, 0])
+            for i, value in enumerate(spent):
+                totals[i] += value - children[i]
+
+    def as_dict(self):
+        """Compact form for storage: {stage: [wall_s, cpu_s, read_bytes, write_bytes]}."""
+        return {
+            name: [round(wall, 4), round(cpu, 4), int(read), int(written)]
+            for name, (wall, cpu, read, written) in self.stages.items()
+        }
+
+
+def expand_stage_timings(timings):
+    """{stage: {field: value}} from the compact as_dict() form."""
+    return {name: dict(zip(STAGE_FIELDS, values)) for name, values in (timings or {}).items()}
+
+
+def stage_percentiles(job_timings, percentiles=(50, 90, 99)):
+    """
+    Percentiles of every stage field across jobs, from their compact stage
+    timings. A 'total' pseudo-stage sums each job's stages (stages never
+    overlap). Returns {stage: {'jobs': n, field: {'p50': value, ...}}}.
+    """
+    samples = {}
+    for timings in job_timings:
+        if not timings:
+            continue
+        for name, values in list(timings.items()) + [('total', np.sum(list(timings.values()), axis=0))]:
+            samples.setdefault(name, []).append(values)
+
+    summary = {}
+    for name, rows in samples.items():
+        rows = np.asarray(rows, dtype=np.float64)
+        values = np.percentile(rows, percentiles, axis=0)
+        summary[name] = {'jobs': len(rows)}
+        for i, field in enumerate(STAGE_FIELDS):
+            summary[name][field] = {f'p{p:g}': round(float(values[j, i]), 4) for j, p in enumerate(percentiles)}
+    return summary
+
+
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+def _site(traceback):
+    """
+    'package/module.py:line' of the innermost frame in this project's code
+    (the innermost frame if there is none), short enough to store per job.
+    """
+    # Tracebacks iterate from the oldest frame
+    frames = list(traceback)[::-1]
+    frame = next((frame for frame in frames
+                  if frame.filename.startswith(_PROJECT_DIR) and 'site-packages' not in frame.filename),
+                 frames[0])
+    return f'{os.path.join(*frame.filename.split(os.sep)[-2:])}:{frame.lineno}'
+
+
+def _merge_stage_memory(previous, current):
+    """Combine two visits to the same stage: summed change, highest peaks."""
+    peaks = [m['rss_peak_mb'] for m in (previous, current) if m['rss_peak_mb'] is not None]
+    return {
+        'rss_delta_mb': round(previous['rss_delta_mb'] + current['rss_delta_mb'], 2),
+        'rss_peak_mb': max(peaks) if peaks else None,
+        'traced_peak_mb': max(previous['traced_peak_mb'], current['traced_peak_mb']),
+        'top': max(previous, current, key=lambda m: m['traced_peak_mb'])['top'],
+    }
+
+
+class _MemoryFrame:
+    def __init__(self):
+        self.rss_mb = current_rss_mb()
+        self.traced_mb = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+        self.snapshot = _snapshot()
+        # Peaks reached so far, including those of finished sub-stages
+        self.traced_peak_mb = self.traced_mb
+        self.rss_hwm_mb = None
+
+
+class MemoryProfiler:
+    """
+    Opt-in per-stage memory measurements, driven by StageTimer stages.
+
+    For each stage: the RSS change, the RSS high-water mark reached (VmHWM,
+    Linux; None elsewhere), the tracemalloc peak above the traced memory at
+    stage start, and the MEMORY_TOP_SITES source lines whose live
+    allocations grew most over the stage. Peaks include sub-stages. Taking
+    tracemalloc snapshots is slow, so timings recorded alongside are
+    inflated.
+    """
+
+    def __init__(self, top_sites=MEMORY_TOP_SITES):
+        self.top_sites = top_sites
+        self.stages = {}
+        self._frames = []
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _fold_peaks(self, frame):
+        """Record the peaks reached since the last reset into frame, then reset them."""
+        frame.traced_peak_mb = max(frame.traced_peak_mb, tracemalloc.get_traced_memory()[1] / 1024 / 1024)
+        hwm = rss_high_water_mb()
+        if hwm is not None:
+            frame.rss_hwm_mb = max(frame.rss_hwm_mb or 0.0, hwm)
+        tracemalloc.reset_peak()
+        reset_rss_high_water()
+
+    @contextmanager
+    def stage(self, name):
+        if not tracemalloc.is_tracing():
+            yield
+            return
+        if self._frames:
+            self._fold_peaks(self._frames[-1])
+        else:
+            tracemalloc.reset_peak()
+            reset_rss_high_water()
+        frame = _MemoryFrame()
+        self._frames.append(frame)
+        try:
+            yield
+        finally:
+            self._frames.pop()
+            self._fold_peaks(frame)
+            if self._frames:
+                parent = self._frames[-1]
+                parent.traced_peak_mb = max(parent.traced_peak_mb, frame.traced_peak_mb)
+                if frame.rss_hwm_mb is not None:
+                    parent.rss_hwm_mb = max(parent.rss_hwm_mb or 0.0, frame.rss_hwm_mb)
+            measured = self._measure(frame)
+            if name in self.stages:
+                measured = _merge_stage_memory(self.stages[name], measured)
+            self.stages[name] = measured
+
+    def _measure(self, frame):
+        sites = {}
+        for stat in _snapshot().compare_to(frame.snapshot, 'traceback'):
+            size, count = sites.get(_site(stat.traceback), (0, 0))
+            sites[_site(stat.traceback)] = (size + stat.size_diff, count + stat.count_diff)
+        top = [
+            [site, round(size / 1024 / 1024, 3), count]
+            for site, (size, count) in sorted(sites.items(), key=lambda item: -item[1][0]) if size > 0
+        ][:self.top_sites]
+        return {
+            'rss_delta_mb': round(current_rss_mb() - frame.rss_mb, 2),
+            'rss_peak_mb': None if frame.rss_hwm_mb is None else round(frame.rss_hwm_mb, 2),
+            'traced_peak_mb': round(frame.traced_peak_mb - frame.traced_mb, 2),
+            'top': top,
+        }
+
+    def as_dict(self):
+        return self.stages
@@ -0,0 +1,322 @@
+"""
+Fast renderer for the BT / TCC mask plot.
+
+Produces the same two-panel layout as save_plot's matplotlib figure, but maps
+BT through a 256-entry inferno lookup table and the mask through a 2-colour
+palette straight into uint8 RGB with NumPy, then composes panels, axes,
+labels and colorbar strips with PIL. Used by save_plot in 'fast' mode; the
+matplotlib figure remains the 'publication' mode.
+
+Both modes first decimate the grids to the output size (block mean of BT,
+block max of the mask) so their cost follows the image size, not the grid.
+"""
+
+import io
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Longest side of each image panel in pixels (the grids are decimated to fit)
+PANEL_MAX_PX = 720
+
+# Longest side of the grids handed to imshow by the publication figure
+# (each panel is well under half of its 2100 px width)
+PUBLICATION_PANEL_MAX_PX = 1050
+
+# Input rows decimated per chunk, bounding the temporaries
+DECIMATE_CHUNK_ROWS = 256
+
+# Thumbnail name -> bounding box (width, height); the aspect ratio is kept
+THUMBNAIL_SIZES = {
+    'list': (120, 80),
+    'card': (300, 200),
+    'retina': (600, 400),
+}
+THUMBNAIL_FORMAT = 'WEBP'
+THUMBNAIL_QUALITY = 80
+
+# TCC pixels are tinted towards this colour in thumbnails
+THUMBNAIL_TCC_RGB = np.array([0, 229, 255], dtype=np.float32)
+THUMBNAIL_TCC_ALPHA = 0.6
+
+FONT_SIZE = 14
+TITLE_FONT_SIZE = 22
+
+# Greys colormap with vmin=0, vmax=1, as in the publication figure
+MASK_PALETTE = np.array([[255, 255, 255], [0, 0, 0]], dtype=np.uint8)
+
+# Colour of NaN BT pixels (matplotlib leaves them transparent over white)
+BACKGROUND_RGB = (255, 255, 255)
+TEXT_RGB = (0, 0, 0)
+
+# Layout, in pixels
+OUTER_MARGIN = 16
+SUPTITLE_HEIGHT = 44
+PANEL_TITLE_HEIGHT = 28
+Y_AXIS_WIDTH = 72
+X_AXIS_HEIGHT = 56
+COLORBAR_GAP = 14
+COLORBAR_WIDTH = 18
+COLORBAR_LABEL_WIDTH = 72
+PANEL_GAP = 24
+TICK_LENGTH = 5
+TICK_COUNT = 5
+
+
+@lru_cache(maxsize=None)
+def inferno_lut():
+    """256x3 uint8 lookup table of matplotlib's inferno colormap."""
+    from matplotlib import colormaps
+
+    # Truncated like Colormap(..., bytes=True)
+    return colormaps['inferno'](np.arange(256), bytes=True)[:, :3]
+
+
+@lru_cache(maxsize=None)
+def _font(size):
+    return ImageFont.load_default(size=size)
+
+
+def bt_to_rgb(bt, vmin=None, vmax=None):
+    """
+    Colour a BT grid through the inferno LUT. vmin/vmax default to the
+    grid's NaN-ignoring range, as imshow does. Returns (rgb, vmin, vmax).
+    """
+    valid = ~np.isnan(bt)
+    if vmin is None or vmax is None:
+        if not valid.any():
+            return np.full(bt.shape + (3,), BACKGROUND_RGB, dtype=np.uint8), 0.0, 1.0
+        vmin = float(np.fmin.reduce(bt, axis=None))
+        vmax = float(np.fmax.reduce(bt, axis=None))
+
+    # Same binning as matplotlib's Colormap: floor(x * N), clipped to N - 1
+    scale = 256.0 / (vmax - vmin) if vmax > vmin else 0.0
+    index = np.clip((np.where(valid, bt, vmin) - vmin) * scale, 0, 255).astype(np.uint8)
+    rgb = inferno_lut()[index]
+    rgb[~valid] = BACKGROUND_RGB
+    return rgb, vmin, vmax
+
+
+def mask_to_rgb(mask):
+    """Colour a 0/1 mask through the 2-colour palette."""
+    return MASK_PALETTE[(np.asarray(mask) != 0).view(np.uint8)]
+
+
+def decimation_factor(shape, max_px):
+    """Smallest integer block size that brings the longest side down to max_px."""
+    return max(1, -(-max(shape) // max_px))
+
+
+def _decimate(array, factor, fill, dtype, reduce_blocks):
+    """Reduce factor x factor blocks in row chunks; edge blocks are padded with fill."""
+    rows, cols = array.shape
+    out_rows, out_cols = -(-rows // factor), -(-cols // factor)
+    out = np.empty((out_rows, out_cols), dtype=dtype)
+    chunk_blocks = max(1, DECIMATE_CHUNK_ROWS // factor)
+
+    for b0 in range(0, out_rows, chunk_blocks):
+        r0 = b0 * factor
+        r1 = min(rows, (b0 + chunk_blocks) * factor)
+        n_blocks = -(-(r1 - r0) // factor)
+        padded = np.full((n_blocks * factor, out_cols * factor), fill, dtype=dtype)
+        # Chunked reads keep memory-mapped grids from being loaded in full
+        padded[:r1 - r0, :cols] = array[r0:r1]
+        out[b0:b0 + n_blocks] = reduce_blocks(padded, factor)
+    return out
+
+
+def _fold_blocks(values, factor, ufunc, dtype=None):
+    """
+    Fold each factor x factor block with a binary ufunc: columns first, then
+    rows, as 2 * factor strided element-wise ops (much faster than reducing
+    a 4-d reshaped view over two non-contiguous axes).
+    """
+    cols = values[:, 0::factor].astype(dtype or values.dtype)
+    for j in range(1, factor):
+        ufunc(cols, values[:, j::factor], out=cols)
+    out = cols[0::factor].copy()
+    for i in range(1, factor):
+        ufunc(out, cols[i::factor], out=out)
+    return out
+
+
+def _nan_mean_blocks(padded, factor):
+    missing = np.isnan(padded)
+    padded[missing] = 0
+    sums = _fold_blocks(padded, factor, np.add)
+    counts = factor * factor - _fold_blocks(missing.view(np.uint8), factor, np.add, np.uint16)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def block_mean(bt, factor):
+    """NaN-aware block mean of a BT grid; all-NaN blocks stay NaN."""
+    if factor == 1:
+        return np.asarray(bt)
+    return _decimate(bt, factor, np.nan, np.float32, _nan_mean_blocks)
+
+
+def block_max(mask, factor):
+    """Block max of a 0/1 mask, so every cluster stays visible when decimated."""
+    if factor == 1:
+        return np.asarray(mask)
+    return _decimate(mask, factor, 0, np.uint8,
+                     lambda padded, factor: _fold_blocks(padded, factor, np.maximum))
+
+
+def decimate_for_display(bt, final_mask, max_px):
+    """Block-mean BT and block-max mask so the longest side is at most max_px."""
+    factor = decimation_factor(bt.shape, max_px)
+    return block_mean(bt, factor), block_max(final_mask, factor)
+
+
+def _ticks(low, high):
+    return np.linspace(low, high, TICK_COUNT)
+
+
+def _text_size(draw, text, font):
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    return right - left, bottom - top
+
+
+def _draw_centered(draw, center_x, top, text, font):
+    width, _ = _text_size(draw, text, font)
+    draw.text((center_x - width / 2, top), text, fill=TEXT_RGB, font=font)
+
+
+def _draw_rotated(canvas, center_x, center_y, text, font):
+    """Draw text rotated 90 degrees counter-clockwise, centred on a point."""
+    probe = ImageDraw.Draw(canvas)
+    width, height = _text_size(probe, text, font)
+    label = Image.new('RGB', (width + 4, height + 8), BACKGROUND_RGB)
+    ImageDraw.Draw(label).text((2, 0), text, fill=TEXT_RGB, font=font)
+    label = label.rotate(90, expand=True)
+    canvas.paste(label, (int(center_x - label.width / 2), int(center_y - label.height / 2)))
+
+
+def _draw_panel(canvas, left, top, image_rgb, title, extent):
+    """Paste one image panel with its frame, title, ticks and axis labels."""
+    draw = ImageDraw.Draw(canvas)
+    font = _font(FONT_SIZE)
+    height, width = image_rgb.shape[:2]
+    image_left = left + Y_AXIS_WIDTH
+    image_top = top + PANEL_TITLE_HEIGHT
+
+    _draw_centered(draw, image_left + width / 2, top + 4, title, font)
+    canvas.paste(Image.fromarray(image_rgb), (image_left, image_top))
+    draw.rectangle([image_left - 1, image_top - 1, image_left + width, image_top + height], outline=TEXT_RGB)
+
+    lon_min, lon_max, lat_min, lat_max = extent
+    image_bottom = image_top + height
+    for fraction, value in zip(np.linspace(0, 1, TICK_COUNT), _ticks(lon_min, lon_max)):
+        x = image_left + fraction * (width - 1)
+        draw.line([x, image_bottom, x, image_bottom + TICK_LENGTH], fill=TEXT_RGB)
+        _draw_centered(draw, x, image_bottom + TICK_LENGTH + 2, f'{value:.0f}', font)
+    # origin='upper': the first row is the maximum latitude
+    for fraction, value in zip(np.linspace(0, 1, TICK_COUNT), _ticks(lat_max, lat_min)):
+        y = image_top + fraction * (height - 1)
+        draw.line([image_left - TICK_LENGTH, y, image_left, y], fill=TEXT_RGB)
+        label = f'{value:.0f}'
+        label_width, label_height = _text_size(draw, label, font)
+        draw.text((image_left - TICK_LENGTH - 4 - label_width, y - label_height / 2 - 2), label,
+                  fill=TEXT_RGB, font=font)
+
+    _draw_centered(draw, image_left + width / 2, image_bottom + X_AXIS_HEIGHT - FONT_SIZE - 10,
+                   'Longitude (°E)', font)
+    _draw_rotated(canvas, left + FONT_SIZE / 2 + 4, image_top + height / 2, 'Latitude (°N)', font)
+    return image_left + width
+
+
+def _draw_colorbar(canvas, left, top, strip_rgb, labels, caption):
+    """Paste a vertical colorbar strip with (fraction-from-top, text) labels."""
+    draw = ImageDraw.Draw(canvas)
+    font = _font(FONT_SIZE)
+    height = strip_rgb.shape[0]
+    canvas.paste(Image.fromarray(strip_rgb), (left, top))
+    draw.rectangle([left - 1, top - 1, left + COLORBAR_WIDTH, top + height], outline=TEXT_RGB)
+    for fraction, text in labels:
+        y = top + fraction * (height - 1)
+        draw.line([left + COLORBAR_WIDTH, y, left + COLORBAR_WIDTH + TICK_LENGTH, y], fill=TEXT_RGB)
+        _, text_height = _text_size(draw, text, font)
+        draw.text((left + COLORBAR_WIDTH + TICK_LENGTH + 3, y - text_height / 2 - 2), text,
+                  fill=TEXT_RGB, font=font)
+    _draw_rotated(canvas, left + COLORBAR_WIDTH + COLORBAR_LABEL_WIDTH - FONT_SIZE / 2 - 2,
+                  top + height / 2, caption, font)
+
+
+def render_fast(bt, final_mask, plot_path, extent):
+    """
+    Render the two-panel BT / TCC mask PNG without matplotlib.
+    bt and final_mask should already be decimated to PANEL_MAX_PX.
+    """
+    bt_rgb, vmin, vmax = bt_to_rgb(bt)
+    mask_rgb = mask_to_rgb(final_mask)
+    height, width = bt_rgb.shape[:2]
+
+    panel_width = Y_AXIS_WIDTH + width + COLORBAR_GAP + COLORBAR_WIDTH + COLORBAR_LABEL_WIDTH
+    canvas = Image.new('RGB', (
+        2 * OUTER_MARGIN + 2 * panel_width + PANEL_GAP,
+        2 * OUTER_MARGIN + SUPTITLE_HEIGHT + PANEL_TITLE_HEIGHT + height + X_AXIS_HEIGHT,
+    ), BACKGROUND_RGB)
+    draw = ImageDraw.Draw(canvas)
+    _draw_centered(draw, canvas.width / 2, OUTER_MARGIN, 'INSAT-3DR: BT and Final TCC Mask',
+                   _font(TITLE_FONT_SIZE))
+
+    panel_top = OUTER_MARGIN + SUPTITLE_HEIGHT
+    colorbar_top = panel_top + PANEL_TITLE_HEIGHT
+
+    left = OUTER_MARGIN
+    image_right = _draw_panel(canvas, left, panel_top, bt_rgb, 'Brightness Temperature (K)', extent)
+    # Hottest at the top, like matplotlib's vertical colorbar
+    ramp = inferno_lut()[np.linspace(255, 0, height).round().astype(np.intp)]
+    _draw_colorbar(canvas, image_right + COLORBAR_GAP, colorbar_top,
+                   np.repeat(ramp[:, None, :], COLORBAR_WIDTH, axis=1),
+                   [(fraction, f'{value:.0f}') for fraction, value in
+                    zip(np.linspace(0, 1, TICK_COUNT), np.linspace(vmax, vmin, TICK_COUNT))],
+                   'K')
+
+    left += panel_width + PANEL_GAP
+    image_right = _draw_panel(canvas, left, panel_top, mask_rgb, 'TCC Binary Mask', extent)
+    halves = np.repeat(MASK_PALETTE[[1, 0]], [height // 2, height - height // 2], axis=0)
+    _draw_colorbar(canvas, image_right + COLORBAR_GAP, colorbar_top,
+                   np.repeat(halves[:, None, :], COLORBAR_WIDTH, axis=1),
+                   [(0.0, '1'), (1.0, '0')],
+                   'TCC (1=True, 0=False)')
+
+    canvas.save(plot_path, format='PNG', compress_level=3)
+
+
+def thumbnail_rgb(bt, final_mask):
+    """
+    Single-panel preview: BT through the inferno LUT with TCC pixels tinted,
+    cropped to the rows/columns that have valid BT.
+    """
+    valid = ~np.isnan(bt)
+    rows = np.flatnonzero(valid.any(axis=1))
+    cols = np.flatnonzero(valid.any(axis=0))
+    if rows.size:
+        crop = np.s_[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        bt, final_mask = bt[crop], final_mask[crop]
+
+    rgb, _, _ = bt_to_rgb(bt)
+    cloud = np.asarray(final_mask) != 0
+    tinted = rgb[cloud] * (1 - THUMBNAIL_TCC_ALPHA) + THUMBNAIL_TCC_RGB * THUMBNAIL_TCC_ALPHA
+    rgb[cloud] = tinted.astype(np.uint8)
+    return rgb
+
+
+def render_thumbnails(bt, final_mask, sizes=THUMBNAIL_SIZES):
+    """
+    Encode preview thumbnails from (already decimated) BT/mask grids.
+    Returns {name: encoded image bytes} in THUMBNAIL_FORMAT.
+    """
+    preview = Image.fromarray(thumbnail_rgb(bt, final_mask))
+    thumbnails = {}
+    for name, size in sizes.items():
+        image = preview.copy()
+        image.thumbnail(size, Image.Resampling.BOX)
+        buffer = io.BytesIO()
+        image.save(buffer, format=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY, method=4)
+        thumbnails[name] = buffer.getvalue()
+    return thumbnails
@@ -0,0 +1,212 @@
+"""
+Single-pass statistics over TCC results.
+
+scene_statistics streams the BT grid, the mask and (optionally) the lat/lon
+grids in row chunks and feeds each chunk to a set of accumulators. Values
+shared by several accumulators (valid-BT mask, boolean cloud mask) are
+computed once per chunk, so adding accumulators adds no passes over the
+full grids and nothing grid-sized is ever materialized.
+"""
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from .geolocation import TROPICAL_BAND_DEG, ExtentAccumulator
+
+# Rows per chunk: ~700 KB of float32 BT for a full-disk row width, so the
+# chunk stays in cache while every accumulator reads it
+STATS_CHUNK_ROWS = 64
+
+
+class SceneChunk:
+    """A row block of the scene with lazily computed, shared derived masks."""
+
+    def __init__(self, bt, mask, lat=None, lon=None):
+        self.bt = bt
+        self.mask = mask
+        self.lat = lat
+        self.lon = lon
+        self._valid = None
+        self._cloud = None
+
+    @property
+    def valid(self):
+        """Pixels with a valid (non-NaN) BT."""
+        if self._valid is None:
+            self._valid = ~np.isnan(self.bt)
+        return self._valid
+
+    @property
+    def cloud(self):
+        """TCC pixels as a boolean mask."""
+        if self._cloud is None:
+            self._cloud = self.mask != 0
+        return self._cloud
+
+
+class Accumulator(ABC):
+    """Base class for statistics folded over SceneChunks."""
+
+    name = None
+    needs_geolocation = False
+
+    @abstractmethod
+    def update(self, chunk):
+        """Fold one SceneChunk into the running statistic."""
+
+    @abstractmethod
+    def result(self):
+        """The statistic over every chunk folded so far."""
+
+
+class _Moments:
+    """Running count/min/max/sum, folded from per-chunk partials."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.low = np.inf
+        self.high = -np.inf
+
+    def add(self, count, total, low, high):
+        if not count:
+            return
+        self.count += count
+        # Per-chunk float32 partial sums, accumulated in double precision
+        self.total += float(total)
+        self.low = min(self.low, float(low))
+        self.high = max(self.high, float(high))
+
+    def update_dense(self, values, valid):
+        """Fold a chunk where most values are valid (NaN marks the rest)."""
+        self.add(int(np.count_nonzero(valid)), np.sum(values, where=valid),
+                 np.fmin.reduce(values, axis=None), np.fmax.reduce(values, axis=None))
+
+    def update_sparse(self, values, selection):
+        """Fold the few selected values of a chunk via a compact copy."""
+        selected = values[selection]
+        if selected.size:
+            self.add(selected.size, selected.sum(), selected.min(), selected.max())
+
+    def result(self):
+        if not self.count:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None}
+        return {'count': self.count, 'min': self.low, 'max': self.high, 'mean': self.total / self.count}
+
+
+class PixelCounts(Accumulator):
+    """Total and cloud pixel counts."""
+
+    name = 'pixels'
+
+    def __init__(self):
+        self.total = 0
+        self.cloud = 0
+
+    def update(self, chunk):
+        self.total += chunk.mask.size
+        self.cloud += int(np.count_nonzero(chunk.cloud))
+
+    def result(self):
+        return {'total': self.total, 'cloud': self.cloud}
+
+
+class BTStats(Accumulator):
+    """Count/min/max/mean of all valid BT pixels."""
+
+    name = 'bt'
+
+    def __init__(self):
+        self.moments = _Moments()
+
+    def update(self, chunk):
+        self.moments.update_dense(chunk.bt, chunk.valid)
+
+    def result(self):
+        return self.moments.result()
+
+
+class CloudBTStats(Accumulator):
+    """Count/min/max/mean of BT over TCC pixels only (cloud-top temperatures)."""
+
+    name = 'cloud_bt'
+
+    def __init__(self):
+        self.moments = _Moments()
+
+    def update(self, chunk):
+        # TCC pixels always have a valid BT (the threshold excludes NaN)
+        self.moments.update_sparse(chunk.bt, chunk.cloud)
+
+    def result(self):
+        return self.moments.result()
+
+
+class BandCloudCounts(Accumulator):
+    """TCC pixels in the north (0-30N) and south (0-30S) Indian Ocean bands."""
+
+    name = 'band_cloud'
+    needs_geolocation = True
+
+    def __init__(self):
+        self.nio = 0
+        self.sio = 0
+
+    def update(self, chunk):
+        north = chunk.lat >= 0
+        in_band = np.abs(chunk.lat) <= TROPICAL_BAND_DEG
+        self.nio += int(np.count_nonzero(chunk.cloud & in_band & north))
+        self.sio += int(np.count_nonzero(chunk.cloud & in_band & ~north))
+
+    def result(self):
+        return {'nio': self.nio, 'sio': self.sio}
+
+
+class GeoBounds(Accumulator):
+    """Lat/lon bounds as [lon_min, lon_max, lat_min, lat_max], or None."""
+
+    name = 'extent'
+    needs_geolocation = True
+
+    def __init__(self):
+        self.extent = ExtentAccumulator()
+
+    def update(self, chunk):
+        self.extent.update(chunk.lat, chunk.lon)
+
+    def result(self):
+        return self.extent.extent()
+
+
+def default_accumulators():
+    return [PixelCounts(), BTStats()]
+
+
+def scene_statistics(bt, mask, lat=None, lon=None, accumulators=None, chunk_rows=STATS_CHUNK_ROWS, cancel=None):
+    """
+    Fold the scene through the accumulators in one chunked pass.
+
+    accumulators defaults to pixel counts and valid-BT statistics. Returns
+    {accumulator.name: accumulator.result()}. Accumulators that need
+    geolocation are rejected when lat/lon are not given. cancel, if given,
+    is called before each chunk and stops the pass by raising.
+    """
+    accumulators = default_accumulators() if accumulators is None else list(accumulators)
+    if lat is None or lon is None:
+        missing = [acc.name for acc in accumulators if acc.needs_geolocation]
+        if missing:
+            raise ValueError(f"Accumulators {missing} need lat/lon grids")
+
+    for r0 in range(0, bt.shape[0], chunk_rows):
+        if cancel is not None:
+            cancel()
+        rows = slice(r0, r0 + chunk_rows)
+        chunk = SceneChunk(
+            np.asarray(bt[rows]), np.asarray(mask[rows]),
+            None if lat is None else np.asarray(lat[rows]),
+            None if lon is None else np.asarray(lon[rows]))
+        for acc in accumulators:
+            acc.update(chunk)
+
+    return {acc.name: acc.result() for acc in accumulators}
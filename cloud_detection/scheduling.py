@@ -0,0 +1,78 @@
+"""
+The order in which workers claim queued jobs.
+
+With JOB_SCHEDULING = 'fair' (the default), jobs of a higher priority go
+first. Within a priority the next job belongs to the user with the fewest
+jobs running, ties going to the user who received the least processing
+time over the last JOB_FAIR_SHARE_WINDOW_SECONDS, so users take turns
+however many files each has queued: a single upload waits for at most one
+job of a user who queued a day of scans. Within a user the shortest
+estimated job (the smallest input) goes first, then the oldest. Anonymous
+uploads share one turn. 'fifo' claims in queue order.
+
+Each job records its queue wait (queueing to the claim that ran it) and
+service time (that claim's processing wall-clock time); latency_percentiles
+summarizes them.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from .models import SatelliteData
+
+SCHEDULING_POLICIES = ('fair', 'fifo')
+
+# Oldest claimable rows considered per claim
+SCHEDULING_WINDOW = 1000
+
+LATENCY_FIELDS = ('wait_seconds', 'service_seconds', 'turnaround_seconds')
+
+
+def claim_order(claimable, now, policy=None):
+    """Primary keys of the claimable rows (a queryset), next to claim first."""
+    policy = policy or settings.JOB_SCHEDULING
+    if policy not in SCHEDULING_POLICIES:
+        raise ValueError(f"JOB_SCHEDULING must be one of {SCHEDULING_POLICIES}, got {policy!r}")
+    oldest = claimable.order_by('queued_at', 'id')
+    if policy == 'fifo':
+        return list(oldest.values_list('pk', flat=True)[:SCHEDULING_WINDOW])
+
+    candidates = list(oldest.values_list(
+        'pk', 'uploaded_by_id', 'priority', 'file_size', 'queued_at')[:SCHEDULING_WINDOW])
+    running = dict(SatelliteData.objects
+                   .filter(status='processing', lease_expires_at__gte=now)
+                   .values_list('uploaded_by_id')
+                   .annotate(jobs=Count('id'))
+                   .order_by())
+    window_start = now - timedelta(seconds=settings.JOB_FAIR_SHARE_WINDOW_SECONDS)
+    served = dict(SatelliteData.objects
+                  .filter(processing_end_time__gte=window_start, service_seconds__isnull=False)
+                  .values_list('uploaded_by_id')
+                  .annotate(seconds=Sum('service_seconds'))
+                  .order_by())
+
+    def key(candidate):
+        pk, user, priority, file_size, queued_at = candidate
+        return (-priority, running.get(user, 0), served.get(user, 0.0), file_size, queued_at or now, pk)
+
+    return [candidate[0] for candidate in sorted(candidates, key=key)]
+
+
+def latency_percentiles(jobs, percentiles=(50, 90, 99)):
+    """
+    Percentiles of queue wait, service and turnaround (their sum) time across
+    jobs, from (wait_seconds, service_seconds) pairs; pairs with an unknown
+    value are skipped. Returns {field: {'p50': seconds, ...}} and the job count.
+    """
+    rows = np.asarray([(wait, service, wait + service) for wait, service in jobs
+                       if wait is not None and service is not None], dtype=np.float64)
+    summary = {'jobs': len(rows)}
+    if not len(rows):
+        return summary
+    values = np.percentile(rows, percentiles, axis=0)
+    for i, field in enumerate(LATENCY_FIELDS):
+        summary[field] = {f'p{p:g}': round(float(values[j, i]), 3) for j, p in enumerate(percentiles)}
+    return summary
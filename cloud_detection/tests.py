@@ -1,3 +1,1674 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from unittest import mock
 
-# Create your tests here.
+import h5py
+import numpy as np
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from skimage.measure import label
+from skimage.morphology import remove_small_objects
+
+from .admin import SatelliteDataAdmin
+from .admission import MemoryAdmission, calibration_factor, ensure_estimate, model_peak_mb, scene_header
+from .cancellation import CancelToken, JobCancelled
+from .dedup import find_reusable_result, reuse_result, save_upload
+from .batch import read_summary, run_batch
+from .benchmarks import (
+    make_synthetic_scene, write_synthetic_h5, filter_regions_by_radius, filter_regions_loop, legacy_filter_pipeline,
+)
+from .checkpoints import file_digest
+from .chunked_upload import MIN_CHUNK_SIZE, session_dir
+from .geolocation import GeolocationCache, GeolocationGrid, geolocation_fingerprint
+from .hdf5_session import HDF5Session, HDF5SessionError
+from .ingest import FolderWatcher, run_ingest
+from .input_cache import InputCache, cache_key
+from .insat_algorithm import (
+    extract_tcc_mask, filter_tcc_components, resolve_equivalences,
+)
+from .job_logging import DatabaseSink, JobLogger, JsonLinesSink
+from .jobs import (
+    ABANDONED_EXIT_CODE, JobWatchdog, cancel_job, claim_next_job, enqueue_job, reap_stale_jobs, release_job, run_worker,
+)
+from .models import ProcessingLog, SatelliteData, UploadSession
+from .processing import CloudDetectionProcessor, tcc_fingerprint
+from .profiling import MemoryProfiler, PeakRSSSampler, StageTimer, expand_stage_timings, stage_percentiles
+from .rendering import (
+    THUMBNAIL_SIZES, block_max, block_mean, bt_to_rgb, decimate_for_display, decimation_factor,
+    mask_to_rgb, render_fast, render_thumbnails,
+)
+from .scene_stats import (
+    BandCloudCounts, BTStats, CloudBTStats, GeoBounds, PixelCounts, scene_statistics,
+)
+from .upload_handlers import InvalidUpload, check_hdf5_header
+
+
+def hdf5_bytes(directory, values=64):
+    """Contents of a small HDF5 file with random data."""
+    path = os.path.join(directory, 'source.h5')
+    with h5py.File(path, 'w') as f:
+        f['data'] = np.random.default_rng().random(values)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class RegionFilterTests(TestCase):
+    """The vectorized radius filter must match the per-region loop exactly"""
+
+    def setUp(self):
+        warnings.simplefilter('ignore', FutureWarning)
+
+    def test_matches_loop_on_synthetic_scene(self):
+        bt, _, _ = make_synthetic_scene(shape=(600, 600), n_small=400, n_large=6, seed=3)
+        label_img = label(remove_small_objects(bt < 218, min_size=100))
+
+        for min_radius_km in (0, 20, 50, 111):
+            expected = filter_regions_loop(label_img, min_radius_km, 4.0)
+            actual = filter_regions_by_radius(label_img, min_radius_km, 4.0)
+            self.assertEqual(actual.dtype, np.uint8)
+            np.testing.assert_array_equal(actual, expected)
+
+    def test_empty_label_image(self):
+        label_img = np.zeros((8, 8), dtype=np.int32)
+        np.testing.assert_array_equal(filter_regions_by_radius(label_img, 111, 4.0), 0)
+
+
+class FusedComponentFilterTests(TestCase):
+    """The single-labelling pipeline must match remove_small_objects + label + loop"""
+
+    def setUp(self):
+        warnings.simplefilter('ignore', FutureWarning)
+
+    def assert_matches_legacy(self, raw_mask, min_size, min_radius_km):
+        expected_mask, _ = legacy_filter_pipeline(raw_mask, min_size, min_radius_km, 4.0)
+        expected_clusters = label(expected_mask).max()
+        mask, clusters = filter_tcc_components(raw_mask, min_size, min_radius_km, 4.0)
+        np.testing.assert_array_equal(mask, expected_mask)
+        self.assertEqual(clusters, expected_clusters)
+
+    def test_matches_legacy_on_synthetic_scene(self):
+        bt, _, _ = make_synthetic_scene(shape=(600, 600), n_small=400, n_large=6, seed=3)
+        for min_size, min_radius_km in ((100, 111), (100, 20), (10, 0), (200, 50)):
+            self.assert_matches_legacy(bt < 218, min_size, min_radius_km)
+
+    def test_diagonal_chain_of_small_objects_is_removed(self):
+        # Each pixel is its own 4-connected object, so all are below min_size
+        raw_mask = np.eye(50, dtype=bool)
+        self.assert_matches_legacy(raw_mask, 5, 0)
+        self.assertEqual(filter_tcc_components(raw_mask, 5, 0, 4.0)[0].sum(), 0)
+
+    def test_diagonal_neighbours_merge_into_one_region(self):
+        raw_mask = np.zeros((40, 40), dtype=bool)
+        raw_mask[0:10, 0:10] = True
+        raw_mask[10:20, 10:20] = True
+        # 100 px each is too small for a 24 km radius, 200 px together is not
+        self.assert_matches_legacy(raw_mask, 50, 24)
+        mask, clusters = filter_tcc_components(raw_mask, 50, 24, 4.0)
+        self.assertEqual(mask.sum(), 200)
+        self.assertEqual(clusters, 1)
+
+    def test_resolve_equivalences(self):
+        roots = resolve_equivalences(6, [5, 3, 2], [4, 5, 1])
+        np.testing.assert_array_equal(roots, [0, 1, 1, 3, 3, 3, 6])
+
+
+class ExtractTCCMaskTests(TestCase):
+    """End-to-end checks of extract_tcc_mask on a synthetic HDF5 file"""
+
+    def setUp(self):
+        warnings.simplefilter('ignore', FutureWarning)
+        self.tmpdir = tempfile.mkdtemp()
+        self.h5_path = write_synthetic_h5(
+            os.path.join(self.tmpdir, 'scene_L1B_test.h5'), shape=(400, 400),
+            n_small=300, n_large=4, seed=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_outputs_written(self):
+        result = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, 'out'), min_radius_km=40)
+
+        self.assertEqual(result['base_name'], 'scene')
+        for key in ('bt_file', 'mask_file', 'plot_file'):
+            self.assertTrue(os.path.exists(result[key]))
+        mask = np.load(result['mask_file'])
+        self.assertEqual(mask.shape, (400, 400))
+        self.assertGreater(mask.sum(), 0)
+        self.assertEqual(result['cluster_count'], label(mask).max())
+
+    def test_tiled_matches_whole_grid(self):
+        reference = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, 'full'),
+                                     min_radius_km=40, make_plot=False)
+        ref_bt = np.load(reference['bt_file'])
+        ref_mask = np.load(reference['mask_file'])
+
+        # 0.02MB with 400 columns gives one-row tiles; the others split mid-cluster
+        for budget in (0.02, 0.5, 2):
+            tiled = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, f'tiled_{budget}'),
+                                     min_radius_km=40, make_plot=False, max_memory_mb=budget)
+            np.testing.assert_array_equal(np.load(tiled['mask_file']), ref_mask)
+            np.testing.assert_array_equal(np.load(tiled['bt_file']), ref_bt)
+            self.assertEqual(tiled['cluster_count'], reference['cluster_count'])
+            self.assertFalse(os.path.exists(tiled['mask_file'] + '.labels'))
+
+    def test_tiled_plot(self):
+        for render_mode in ('publication', 'fast'):
+            result = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, render_mode),
+                                      max_memory_mb=1, render_mode=render_mode)
+            self.assertTrue(os.path.exists(result['plot_file']))
+
+    def test_in_memory_result_and_persist_modes(self):
+        reference = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, 'sync'),
+                                     min_radius_km=40, make_plot=False)
+        np.testing.assert_array_equal(reference['bt'], np.load(reference['bt_file']))
+        np.testing.assert_array_equal(reference['mask'], np.load(reference['mask_file']))
+        self.assertEqual(reference['cluster_areas'].size, reference['cluster_count'])
+        self.assertEqual(reference['cluster_areas'].sum(), reference['mask'].sum())
+        self.assertIsNone(reference['persist_future'])
+
+        skipped = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, 'none'),
+                                   min_radius_km=40, make_plot=False, persist='none')
+        self.assertIsNone(skipped['bt_file'])
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'none')), [])
+        np.testing.assert_array_equal(skipped['mask'], reference['mask'])
+
+        deferred = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, 'async'),
+                                    min_radius_km=40, make_plot=False, persist='async')
+        deferred['persist_future'].result()
+        np.testing.assert_array_equal(np.load(deferred['bt_file']), reference['bt'])
+        np.testing.assert_array_equal(np.load(deferred['mask_file']), reference['mask'])
+
+        tiled = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, 'tiled'),
+                                 min_radius_km=40, make_plot=False, max_memory_mb=0.5, persist='none')
+        np.testing.assert_array_equal(tiled['mask'], reference['mask'])
+        np.testing.assert_array_equal(np.sort(tiled['cluster_areas']), np.sort(reference['cluster_areas']))
+
+        with self.assertRaises(ValueError):
+            extract_tcc_mask(self.h5_path, self.tmpdir, persist='later')
+        with self.assertRaises(ValueError):
+            extract_tcc_mask(self.h5_path, self.tmpdir, render_mode='draft')
+
+    def test_tropical_window_only_changes_bt_outside_band(self):
+        full = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, 'full'),
+                                min_radius_km=40, make_plot=False, tropical_window=False)
+        full_bt = np.load(full['bt_file'])
+
+        for budget in (None, 0.5):
+            windowed = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, f'win_{budget}'),
+                                        min_radius_km=40, make_plot=False, max_memory_mb=budget)
+            np.testing.assert_array_equal(np.load(windowed['mask_file']), np.load(full['mask_file']))
+            self.assertEqual(windowed['cluster_count'], full['cluster_count'])
+
+            bt = np.load(windowed['bt_file'])
+            read = ~np.isnan(bt)
+            self.assertLess(read.sum(), (~np.isnan(full_bt)).sum())
+            np.testing.assert_array_equal(bt[read], full_bt[read])
+
+
+class HDF5SessionTests(TestCase):
+    """Single open, metadata-validated HDF5 inputs"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = write_synthetic_h5(os.path.join(self.tmpdir, 'scene_L1B.h5'), shape=(200, 240),
+                                       n_small=20, n_large=2, seed=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_validates_datasets(self):
+        with HDF5Session(self.path) as session:
+            self.assertEqual(session.shape, (200, 240))
+            self.assertEqual(session.itemsize, 4)
+            self.assertIs(session.geolocation(), session.geolocation())
+        self.assertIsNone(session.file)
+
+        with h5py.File(self.path, 'a') as f:
+            del f['Longitude']
+            f.create_dataset('Longitude', data=np.zeros((10, 10), dtype=np.int16))
+        with self.assertRaisesRegex(HDF5SessionError, 'Longitude shape'):
+            HDF5Session(self.path).open()
+        with h5py.File(self.path, 'a') as f:
+            del f['Latitude']
+        with self.assertRaisesRegex(HDF5SessionError, 'Missing datasets'):
+            HDF5Session(self.path).open()
+
+        with open(self.path, 'wb') as f:
+            f.write(b'not hdf5')
+        with self.assertRaisesRegex(HDF5SessionError, 'Cannot read HDF5 file'):
+            HDF5Session(self.path).open()
+
+    def test_extract_reads_from_open_session(self):
+        expected = extract_tcc_mask(self.path, self.tmpdir, min_radius_km=30, make_plot=False, persist='none')
+        for budget in (None, 0.5):
+            with HDF5Session(self.path) as session, \
+                    mock.patch('cloud_detection.hdf5_session.h5py.File', side_effect=AssertionError('reopened')):
+                result = extract_tcc_mask(self.path, self.tmpdir, min_radius_km=30, make_plot=False,
+                                          persist='none', max_memory_mb=budget, session=session)
+            np.testing.assert_array_equal(np.asarray(result['mask']), expected['mask'])
+
+
+class GeolocationCacheTests(TestCase):
+    """Cached grids must match a fresh decode and be reused across jobs"""
+
+    def setUp(self):
+        warnings.simplefilter('ignore', FutureWarning)
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'geo')
+        self.h5_path = write_synthetic_h5(
+            os.path.join(self.tmpdir, 'scene_L1B_test.h5'), shape=(300, 280),
+            n_small=200, n_large=3, seed=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cached_grid_matches_decode(self):
+        import h5py
+
+        with h5py.File(self.h5_path, 'r') as f:
+            decoded = GeolocationGrid.decode(f)
+            cached = GeolocationCache(self.cache_dir).get(f)
+
+        self.assertIsInstance(cached.lat, np.memmap)
+        np.testing.assert_array_equal(cached.lat, decoded.lat)
+        np.testing.assert_array_equal(cached.lon, decoded.lon)
+        np.testing.assert_array_equal(cached.nio_band, decoded.nio_band)
+        np.testing.assert_array_equal(cached.sio_band, decoded.sio_band)
+        self.assertEqual(cached.window, decoded.window)
+        self.assertEqual(cached.extent, decoded.extent)
+
+    def test_entry_reused_and_keyed_by_attributes(self):
+        import h5py
+
+        with h5py.File(self.h5_path, 'r') as f:
+            first = GeolocationCache(self.cache_dir).get(f)
+            second = GeolocationCache(self.cache_dir).get(f)
+        self.assertEqual(first.fingerprint, second.fingerprint)
+        self.assertEqual(os.listdir(self.cache_dir), [first.fingerprint])
+
+        with h5py.File(self.h5_path, 'r+') as f:
+            f['Latitude'].attrs['scale_factor'] = np.float32(0.02)
+            self.assertNotEqual(geolocation_fingerprint(f), first.fingerprint)
+
+    def test_extract_with_cache_matches_without(self):
+        plain = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, 'plain'),
+                                 min_radius_km=30, make_plot=False)
+        for budget in (None, None, 0.5):
+            cached = extract_tcc_mask(self.h5_path, os.path.join(self.tmpdir, f'cached_{budget}'),
+                                      min_radius_km=30, make_plot=False, max_memory_mb=budget,
+                                      geo_cache_dir=self.cache_dir)
+            np.testing.assert_array_equal(np.load(cached['mask_file']), np.load(plain['mask_file']))
+            np.testing.assert_array_equal(np.load(cached['bt_file']), np.load(plain['bt_file']))
+            self.assertEqual(cached['extent'], plain['extent'])
+            self.assertEqual(cached['cluster_count'], plain['cluster_count'])
+
+
+class SceneStatisticsTests(TestCase):
+    """The chunked statistics kernel must match plain numpy reductions"""
+
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        self.bt = rng.normal(280, 15, size=(150, 90)).astype(np.float32)
+        self.bt[rng.random(self.bt.shape) < 0.2] = np.nan
+        self.bt[:20] = np.nan
+        self.mask = ((self.bt < 260) & ~np.isnan(self.bt)).astype(np.uint8)
+        self.lat = np.broadcast_to(np.linspace(40, -40, 150, dtype=np.float32)[:, None], (150, 90)).copy()
+        self.lon = np.broadcast_to(np.linspace(50, 100, 90, dtype=np.float32)[None, :], (150, 90)).copy()
+        self.lat[:, :5] = np.nan
+
+    def test_matches_numpy(self):
+        valid = self.bt[~np.isnan(self.bt)]
+        cloud = self.bt[self.mask == 1]
+        # Chunks of 7 rows leave a ragged last chunk and several all-NaN chunks
+        for chunk_rows in (7, 64, 1000):
+            stats = scene_statistics(
+                self.bt, self.mask, self.lat, self.lon,
+                [PixelCounts(), BTStats(), CloudBTStats(), BandCloudCounts(), GeoBounds()], chunk_rows)
+
+            self.assertEqual(stats['pixels'], {'total': self.mask.size, 'cloud': int(self.mask.sum())})
+            self.assertEqual(stats['bt']['count'], valid.size)
+            self.assertEqual(stats['bt']['min'], float(valid.min()))
+            self.assertEqual(stats['bt']['max'], float(valid.max()))
+            self.assertAlmostEqual(stats['bt']['mean'], float(valid.mean(dtype=np.float64)), places=3)
+            self.assertEqual(stats['cloud_bt']['count'], cloud.size)
+            self.assertEqual(stats['cloud_bt']['max'], float(cloud.max()))
+            self.assertAlmostEqual(stats['cloud_bt']['mean'], float(cloud.mean(dtype=np.float64)), places=3)
+            north = self.mask.astype(bool) & (self.lat >= 0) & (self.lat <= 30)
+            self.assertEqual(stats['band_cloud']['nio'], int(north.sum()))
+            self.assertEqual(stats['extent'], [50.0, 100.0, -40.0, 40.0])
+
+    def test_defaults_and_empty_selections(self):
+        stats = scene_statistics(np.full((10, 10), np.nan, dtype=np.float32), np.zeros((10, 10), np.uint8))
+        self.assertEqual(set(stats), {'pixels', 'bt'})
+        self.assertEqual(stats['bt'], {'count': 0, 'min': None, 'max': None, 'mean': None})
+
+    def test_geolocation_accumulators_need_grids(self):
+        with self.assertRaises(ValueError):
+            scene_statistics(self.bt, self.mask, accumulators=[GeoBounds()])
+
+
+class FastRendererTests(TestCase):
+    """The LUT renderer must colour pixels like matplotlib's imshow"""
+
+    def test_bt_colours_match_matplotlib(self):
+        from matplotlib import colormaps
+        from matplotlib.colors import Normalize
+
+        rng = np.random.default_rng(5)
+        bt = rng.uniform(190, 310, size=(64, 64)).astype(np.float32)
+        bt[:4] = np.nan
+        rgb, vmin, vmax = bt_to_rgb(bt)
+
+        expected = colormaps['inferno'](Normalize(vmin, vmax)(bt), bytes=True)[..., :3]
+        valid = ~np.isnan(bt)
+        np.testing.assert_array_equal(rgb[valid], expected[valid])
+        self.assertTrue((rgb[~valid] == 255).all())
+
+    def test_mask_palette(self):
+        rgb = mask_to_rgb(np.array([[0, 1]], dtype=np.uint8))
+        np.testing.assert_array_equal(rgb, [[[255, 255, 255], [0, 0, 0]]])
+
+    def test_block_mean_ignores_nan(self):
+        rng = np.random.default_rng(7)
+        bt = rng.uniform(190, 310, size=(23, 17)).astype(np.float32)
+        bt[rng.random(bt.shape) < 0.3] = np.nan
+        bt[:4, :4] = np.nan
+
+        for factor in (1, 2, 4, 5):
+            reduced = block_mean(bt, factor)
+            self.assertEqual(reduced.shape, (-(-23 // factor), -(-17 // factor)))
+            for i, j in np.ndindex(reduced.shape):
+                block = bt[i * factor:(i + 1) * factor, j * factor:(j + 1) * factor]
+                if np.isnan(block).all():
+                    self.assertTrue(np.isnan(reduced[i, j]))
+                else:
+                    self.assertAlmostEqual(float(reduced[i, j]), float(np.nanmean(block)), places=3)
+
+    def test_block_max_keeps_isolated_pixels(self):
+        mask = np.zeros((50, 61), dtype=np.uint8)
+        mask[7, 60] = 1
+        mask[49, 3] = 1
+        reduced = block_max(mask, 8)
+        self.assertEqual(reduced.shape, (7, 8))
+        self.assertEqual(reduced.sum(), 2)
+        self.assertEqual(reduced[0, 7], 1)
+        self.assertEqual(reduced[6, 0], 1)
+
+    def test_decimation_factor(self):
+        self.assertEqual(decimation_factor((2816, 2805), 720), 4)
+        self.assertEqual(decimation_factor((400, 400), 720), 1)
+
+    def test_render_writes_png(self):
+        from PIL import Image
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            bt, _, _ = make_synthetic_scene(shape=(1500, 1400), n_small=50, n_large=2, seed=6)
+            path = os.path.join(tmpdir, 'plot.png')
+            bt_small, mask_small = decimate_for_display(np.where(bt == -999, np.nan, bt), bt < 218, 720)
+            render_fast(bt_small, mask_small, path, [0.0, 150.0, -80.0, 80.0])
+            with Image.open(path) as img:
+                self.assertEqual(img.format, 'PNG')
+                # Panels are decimated to at most 720 pixels a side
+                self.assertLess(img.width, 2 * 720 + 600)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class ThumbnailTests(TestCase):
+    """Thumbnails are encoded from the arrays at every configured size"""
+
+    def test_sizes_and_format(self):
+        from PIL import Image
+        import io
+
+        bt, _, _ = make_synthetic_scene(shape=(700, 720), n_small=50, n_large=2, seed=8)
+        bt = np.where(bt == -999, np.nan, bt)
+        thumbnails = render_thumbnails(bt, bt < 218)
+
+        self.assertEqual(set(thumbnails), set(THUMBNAIL_SIZES))
+        for name, (width, height) in THUMBNAIL_SIZES.items():
+            with Image.open(io.BytesIO(thumbnails[name])) as img:
+                self.assertEqual(img.format, 'WEBP')
+                self.assertLessEqual(img.width, width)
+                self.assertLessEqual(img.height, height)
+                self.assertTrue(img.width == width or img.height == height)
+        self.assertLess(len(thumbnails['list']), len(thumbnails['retina']))
+
+    def test_extract_returns_thumbnails_with_plot(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            h5_path = write_synthetic_h5(os.path.join(tmpdir, 'scene_L1B_test.h5'), shape=(300, 280),
+                                         n_small=100, n_large=3, seed=2)
+            for render_mode in ('publication', 'fast'):
+                result = extract_tcc_mask(h5_path, os.path.join(tmpdir, render_mode), min_radius_km=30,
+                                          render_mode=render_mode, make_thumbnails=True)
+                self.assertEqual(set(result['thumbnails']), set(THUMBNAIL_SIZES))
+            self.assertIsNone(extract_tcc_mask(h5_path, os.path.join(tmpdir, 'plain'))['thumbnails'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class JobQueueTests(TestCase):
+    """Claiming, leases and retries of the database-backed job queue"""
+
+    def make_job(self, name):
+        return enqueue_job(SatelliteData.objects.create(
+            file_name=name, file_path=f'satellite_data/{name}', file_size=1))
+
+    def test_claims_oldest_first_and_exclusively(self):
+        first, second = self.make_job('a.h5'), self.make_job('b.h5')
+
+        claimed = claim_next_job('worker-1', lease_seconds=60)
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual((claimed.status, claimed.lease_owner, claimed.attempts), ('processing', 'worker-1', 1))
+        self.assertEqual(claim_next_job('worker-2', lease_seconds=60).pk, second.pk)
+        self.assertIsNone(claim_next_job('worker-3', lease_seconds=60))
+
+    def test_expired_lease_is_reclaimed(self):
+        job = self.make_job('a.h5')
+        claim_next_job('worker-1', lease_seconds=60)
+        self.assertIsNone(claim_next_job('worker-2', lease_seconds=60))
+
+        SatelliteData.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        reclaimed = claim_next_job('worker-2', lease_seconds=60)
+        self.assertEqual((reclaimed.pk, reclaimed.lease_owner, reclaimed.attempts), (job.pk, 'worker-2', 2))
+
+        # The lost worker can no longer release the job
+        release_job(job, 'worker-1')
+        self.assertEqual(SatelliteData.objects.get(pk=job.pk).lease_owner, 'worker-2')
+
+    @override_settings(JOB_MAX_ATTEMPTS=1)
+    def test_gives_up_after_max_attempts(self):
+        job = self.make_job('a.h5')
+        claim_next_job('worker-1', lease_seconds=60)
+        SatelliteData.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertIsNone(claim_next_job('worker-2', lease_seconds=60))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(job.lease_owner)
+
+    def test_cancel_queued_and_running_jobs(self):
+        queued, running = self.make_job('a.h5'), self.make_job('b.h5')
+        claim_next_job('worker-1', lease_seconds=60)  # claims a.h5
+        queued, running = running, queued
+
+        self.assertEqual(cancel_job(queued), 'cancelled')
+        self.assertEqual(SatelliteData.objects.get(pk=queued.pk).status, 'cancelled')
+        self.assertIsNone(claim_next_job('worker-2', lease_seconds=60))
+
+        self.assertEqual(cancel_job(running), 'cancelling')
+        running.refresh_from_db()
+        self.assertEqual((running.status, running.cancel_requested), ('processing', True))
+        self.assertIsNone(cancel_job(queued))
+
+        # Re-queueing clears the request
+        self.assertFalse(enqueue_job(running).cancel_requested)
+
+    def test_cancel_view_only_for_owner(self):
+        owner = User.objects.create_user('owner', password='secret')
+        job = self.make_job('a.h5')
+        SatelliteData.objects.filter(pk=job.pk).update(uploaded_by=owner)
+        url = reverse('cloud_detection:cancel_processing', args=[job.pk])
+
+        # Anonymous clients are sent to log in, other users get a 404
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('other', password='secret'))
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertEqual(SatelliteData.objects.get(pk=job.pk).status, 'queued')
+
+        self.client.force_login(owner)
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertEqual(SatelliteData.objects.get(pk=job.pk).status, 'cancelled')
+
+    def test_single_worker_is_supervised(self):
+        from .management.commands.run_workers import Command, should_restart
+
+        with mock.patch.object(Command, 'supervise') as supervise:
+            call_command('run_workers', workers=1, stdout=io.StringIO())
+        supervise.assert_called_once()
+
+        # An abandoned worker is replaced even when the others run to completion
+        for exitcode, once, restarted in ((ABANDONED_EXIT_CODE, True, True), (0, True, False), (1, False, True)):
+            self.assertEqual(should_restart(exitcode, {'once': once, 'max_jobs': None}), restarted)
+
+    def test_reaps_jobs_whose_worker_died(self):
+        requeued, cancelled, exhausted, running = (self.make_job(name) for name in ('a.h5', 'b.h5', 'c.h5', 'd.h5'))
+        for _job in range(4):
+            claim_next_job('worker-1', lease_seconds=60)
+        SatelliteData.objects.exclude(pk=running.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        SatelliteData.objects.filter(pk=cancelled.pk).update(cancel_requested=True)
+        SatelliteData.objects.filter(pk=exhausted.pk).update(attempts=settings.JOB_MAX_ATTEMPTS)
+        # Left 'processing' without a lease, e.g. by a process killed mid-save
+        unleased = SatelliteData.objects.create(
+            file_name='e.h5', file_path='satellite_data/e.h5', file_size=1, status='processing',
+            processing_start_time=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(reap_stale_jobs(lease_seconds=60), 4)
+        self.assertEqual(reap_stale_jobs(lease_seconds=60), 0)
+        statuses = dict(SatelliteData.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {requeued.pk: 'queued', cancelled.pk: 'cancelled', exhausted.pk: 'failed',
+                                    unleased.pk: 'queued', running.pk: 'processing'})
+        # A re-queued job keeps its place in the queue
+        self.assertEqual(claim_next_job('worker-2', lease_seconds=60).pk, requeued.pk)
+
+    def test_watchdog_enforces_cancellation_and_budget(self):
+        job = self.make_job('a.h5')
+        claim_next_job('worker-1', lease_seconds=60)
+        abandon = mock.Mock()
+
+        token = CancelToken()
+        watchdog = JobWatchdog(job, 'worker-1', token, budget_seconds=0, grace_seconds=60, abandon=abandon)
+        self.assertTrue(watchdog.poll())
+        self.assertFalse(token.cancelled)
+        cancel_job(job)
+        self.assertTrue(watchdog.poll())
+        self.assertEqual((token.reason, token.timed_out, job.cancel_requested), ('Cancelled by user', False, True))
+        with self.assertRaises(JobCancelled):
+            token.check()
+
+        SatelliteData.objects.filter(pk=job.pk).update(cancel_requested=False)
+        token = CancelToken()
+        watchdog = JobWatchdog(job, 'worker-1', token, budget_seconds=10, grace_seconds=30, abandon=abandon)
+        with mock.patch('cloud_detection.jobs.time.monotonic', return_value=watchdog.started + 11):
+            self.assertTrue(watchdog.poll())
+        self.assertTrue(token.timed_out)
+        abandon.assert_not_called()
+        # Still running once the grace period is over: stuck
+        with mock.patch('cloud_detection.jobs.time.monotonic', return_value=watchdog.started + 42):
+            self.assertFalse(watchdog.poll())
+        abandon.assert_called_once_with(job, 'worker-1', token)
+
+    def test_fair_share_between_users(self):
+        alice, bob = User.objects.create_user('alice'), User.objects.create_user('bob')
+
+        def job(user, size, **fields):
+            return enqueue_job(SatelliteData.objects.create(
+                file_name='scan.h5', file_path='satellite_data/scan.h5', file_size=size, uploaded_by=user,
+                **fields))
+
+        large, small, medium = job(alice, 30), job(alice, 10), job(alice, 20)
+        single = job(bob, 50)
+        claimed = [claim_next_job(f'worker-{i}', lease_seconds=60).pk for i in range(4)]
+        # Smallest first within a user; the user with fewer jobs running goes next
+        self.assertEqual(claimed, [small.pk, single.pk, medium.pk, large.pk])
+        self.assertIsNotNone(SatelliteData.objects.get(pk=small.pk).wait_seconds)
+
+        # One worker: whoever was served less recently goes first
+        SatelliteData.objects.update(status='completed', lease_expires_at=None, processing_end_time=timezone.now())
+        SatelliteData.objects.filter(uploaded_by=alice).update(service_seconds=100)
+        SatelliteData.objects.filter(uploaded_by=bob).update(service_seconds=10)
+        alice_next, bob_next = job(alice, 1), job(bob, 99)
+        self.assertEqual(claim_next_job('worker-1', lease_seconds=60).pk, bob_next.pk)
+        release_job(bob_next, 'worker-1')
+        SatelliteData.objects.filter(pk=bob_next.pk).update(status='completed')
+
+        # Priority beats fairness, and fifo ignores both users and sizes
+        urgent = job(alice, 500, priority=1)
+        self.assertEqual(claim_next_job('worker-1', lease_seconds=60).pk, urgent.pk)
+        later = job(bob, 1)
+        with override_settings(JOB_SCHEDULING='fifo'):
+            self.assertEqual(claim_next_job('worker-2', lease_seconds=60).pk, alice_next.pk)
+        self.assertEqual(claim_next_job('worker-3', lease_seconds=60).pk, later.pk)
+
+    def test_queue_latency_endpoint(self):
+        now = timezone.now()
+        user = User.objects.create_user('alice')
+        for wait, service in ((1, 10), (3, 20), (100, 30)):
+            SatelliteData.objects.create(
+                file_name='a.h5', file_path='satellite_data/a.h5', file_size=1, uploaded_by=user,
+                status='completed', processing_end_time=now, wait_seconds=wait, service_seconds=service)
+        url = reverse('cloud_detection:api_queue_latency')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(user)
+        self.assertEqual(self.client.post(url).status_code, 405)
+        self.assertEqual(self.client.get(url, {'percentiles': '50,101'}).status_code, 400)
+        data = self.client.get(url, {'percentiles': '50,100'}).json()
+        self.assertEqual(data['overall']['jobs'], 3)
+        self.assertEqual(data['overall']['wait_seconds'], {'p50': 3.0, 'p100': 100.0})
+        self.assertEqual(data['overall']['turnaround_seconds']['p100'], 130.0)
+        # The per-user breakdown is for staff only
+        self.assertNotIn('users', data)
+
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        data = self.client.get(url).json()
+        self.assertEqual(list(data['users']), ['alice'])
+
+    def test_upload_is_queued_not_processed(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            user = User.objects.create_user('uploader', password='secret')
+            self.client.force_login(user)
+            with override_settings(MEDIA_ROOT=tmpdir):
+                response = self.client.post(reverse('cloud_detection:upload_file'), {
+                    'file_path': SimpleUploadedFile('scene_L1B.h5', hdf5_bytes(tmpdir)),
+                    'satellite_name': 'INSAT', 'data_type': 'HDF5',
+                })
+            self.assertEqual(response.status_code, 302)
+            job = SatelliteData.objects.get(uploaded_by=user)
+            self.assertEqual((job.status, job.attempts), ('queued', 0))
+            self.assertFalse(job.logs.exists())
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class MemoryAdmissionTests(TestCase):
+    """Header-based memory estimates and per-host admission"""
+
+    def make_job(self, name, estimate_mb, **fields):
+        return SatelliteData.objects.create(
+            file_name=name, file_path=f'satellite_data/{name}', file_size=1,
+            memory_estimate_mb=estimate_mb, **fields)
+
+    def run_job(self, name, estimate_mb, worker_id):
+        return self.make_job(name, estimate_mb, status='processing', lease_owner=worker_id,
+                             lease_expires_at=timezone.now() + timedelta(minutes=5))
+
+    def test_estimate_from_header(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = write_synthetic_h5(os.path.join(tmpdir, 'scene_L1B.h5'), shape=(200, 240), n_small=5, n_large=0)
+            self.assertEqual(scene_header(path), ((200, 240), 4))
+        finally:
+            shutil.rmtree(tmpdir)
+
+        whole = model_peak_mb((2816, 2805), 4)
+        self.assertGreater(whole, 100)
+        self.assertLess(model_peak_mb((2816, 2805), 4, max_memory_mb=16), whole)
+        self.assertEqual(model_peak_mb((2816, 2805), 4, max_memory_mb=10000), whole)
+
+    def test_unknown_estimate_tried_once(self):
+        missing = self.make_job('missing.h5', None)
+        remote = self.make_job('remote.h5', None, upload_source='gcs', gcs_bucket='b', gcs_path='remote.h5')
+        with self.assertLogs('cloud_detection.admission', level='WARNING') as logs:
+            self.assertIsNone(ensure_estimate(missing))
+        self.assertEqual(len(logs.records), 1)
+
+        missing.refresh_from_db()
+        with self.assertNoLogs('cloud_detection.admission', level='WARNING'):
+            self.assertIsNone(ensure_estimate(missing))
+            self.assertIsNone(ensure_estimate(remote))
+        admission = MemoryAdmission('node-a:1:x', 1000)
+        self.assertEqual(admission.cost_mb(missing.memory_estimate_mb), settings.TCC_MAX_MEMORY_MB)
+
+    def test_waits_while_host_budget_is_used(self):
+        running = self.run_job('running.h5', 600, 'node-a:1:x')
+        queued = enqueue_job(self.make_job('queued.h5', 500))
+
+        self.assertIsNone(claim_next_job('node-a:2:y', lease_seconds=60, memory_budget_mb=1000))
+        self.assertEqual(SatelliteData.objects.get(pk=queued.pk).status, 'queued')
+        # Other hosts have their own budget, and the check can be disabled
+        self.assertEqual(claim_next_job('node-b:1:z', lease_seconds=60, memory_budget_mb=1000).pk, queued.pk)
+
+        enqueue_job(queued)
+        self.assertEqual(claim_next_job('node-a:2:y', lease_seconds=60, memory_budget_mb=0).pk, queued.pk)
+
+        # Once the running job is done the host is free again
+        enqueue_job(queued)
+        SatelliteData.objects.filter(pk=running.pk).update(status='completed', lease_owner=None)
+        self.assertEqual(claim_next_job('node-a:2:y', lease_seconds=60, memory_budget_mb=1000).pk, queued.pk)
+
+    def test_idle_host_admits_oversized_job(self):
+        job = enqueue_job(self.make_job('huge.h5', 5000))
+        self.assertEqual(claim_next_job('node-a:1:x', lease_seconds=60, memory_budget_mb=1000).pk, job.pk)
+
+    def test_calibration_from_observed_peaks(self):
+        self.assertEqual(calibration_factor(), 1.0)
+        self.make_job('a.h5', 100, peak_memory_mb=150, processing_end_time=timezone.now())
+        self.make_job('b.h5', 100, peak_memory_mb=80, processing_end_time=timezone.now())
+        self.assertEqual(calibration_factor(), 1.5)
+
+        self.run_job('running.h5', 400, 'node-a:1:x')
+        admission = MemoryAdmission('node-a:2:y', budget_mb=1000)
+        self.assertEqual(admission.reserved_mb, 600)
+        self.assertFalse(admission.admits(self.make_job('queued.h5', 300)))
+        self.assertTrue(admission.admits(self.make_job('small.h5', 200)))
+
+    def test_peak_rss_sampler(self):
+        sampler = PeakRSSSampler(interval=0.01)
+        sampler.start()
+        block = np.ones(64 * 1024 * 1024 // 8)
+        del block
+        self.assertGreater(sampler.stop(), 32)
+
+
+class JobLoggerTests(TestCase):
+    """Buffered job logs and their sinks"""
+
+    def setUp(self):
+        self.job = SatelliteData.objects.create(file_name='a.h5', file_path='satellite_data/a.h5', file_size=1)
+
+    def test_buffered_until_flush(self):
+        logger = JobLogger(self.job, sink=DatabaseSink(), buffer_size=100)
+        logger.log('info', 'first')
+        logger.log('warning', 'second')
+        self.assertFalse(self.job.logs.exists())
+
+        with self.assertNumQueries(1):
+            logger.flush()
+        logs = list(self.job.logs.order_by('timestamp'))
+        self.assertEqual([(log.level, log.message) for log in logs], [('info', 'first'), ('warning', 'second')])
+        self.assertLess(logs[0].timestamp, logs[1].timestamp)
+        with self.assertNumQueries(0):
+            logger.flush()
+
+    def test_flushes_when_buffer_fills(self):
+        logger = JobLogger(self.job, sink=DatabaseSink(), buffer_size=3)
+        for i in range(7):
+            logger.log('info', f'message {i}')
+        self.assertEqual(self.job.logs.count(), 6)
+
+    def test_jsonl_sink(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            sink = JsonLinesSink(tmpdir)
+            logger = JobLogger(self.job, sink=sink)
+            logger.log('info', 'started')
+            logger.flush()
+            logger.log('error', 'failed')
+            logger.flush()
+
+            with open(sink.path_for(self.job)) as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual([(r['level'], r['message']) for r in records], [('info', 'started'), ('error', 'failed')])
+            self.assertFalse(ProcessingLog.objects.exists())
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class StageTimingTests(TestCase):
+    """Stage timers, their aggregation and the timings endpoint"""
+
+    def test_nested_stages_are_exclusive(self):
+        timer = StageTimer()
+        with timer.stage('outer'):
+            time.sleep(0.02)
+            with timer.stage('inner'):
+                time.sleep(0.05)
+        with timer.stage('inner'):
+            time.sleep(0.01)
+
+        stages = expand_stage_timings(timer.as_dict())
+        self.assertEqual(set(stages), {'outer', 'inner'})
+        self.assertGreaterEqual(stages['inner']['wall_s'], 0.06)
+        self.assertGreaterEqual(stages['outer']['wall_s'], 0.02)
+        self.assertLess(stages['outer']['wall_s'], 0.05)
+
+    def test_memory_profile(self):
+        profiler = MemoryProfiler()
+        profiler.start()
+        try:
+            timer = StageTimer(profiler)
+            with timer.stage('outer'):
+                kept = np.ones(2 * 1024 * 1024 // 8)
+                with timer.stage('inner'):
+                    scratch = np.ones(8 * 1024 * 1024 // 8)
+                    del scratch
+        finally:
+            profiler.stop()
+
+        memory = profiler.as_dict()
+        self.assertGreaterEqual(memory['inner']['traced_peak_mb'], 8)
+        # Peaks include sub-stages
+        self.assertGreaterEqual(memory['outer']['traced_peak_mb'], 10)
+        site, size_mb, _count = memory['outer']['top'][0]
+        self.assertIn('tests.py', site)
+        self.assertAlmostEqual(size_mb, 2, places=1)
+        self.assertIn('outer', timer.as_dict())
+        self.assertEqual(kept.size, 2 * 1024 * 1024 // 8)
+
+    def test_percentiles(self):
+        jobs = [{'read': [float(i), 0.5, 100 * i, 0], 'plot': [1.0, 1.0, 0, 10]} for i in range(1, 101)]
+        summary = stage_percentiles(jobs + [None], percentiles=(50, 90))
+        self.assertEqual(summary['read']['jobs'], 100)
+        self.assertAlmostEqual(summary['read']['wall_s']['p50'], 50.5)
+        self.assertAlmostEqual(summary['read']['wall_s']['p90'], 90.1)
+        self.assertEqual(summary['plot']['write_bytes']['p90'], 10)
+        self.assertAlmostEqual(summary['total']['wall_s']['p50'], 51.5)
+
+    def test_endpoint(self):
+        for i in range(3):
+            SatelliteData.objects.create(
+                file_name=f'{i}.h5', file_path=f'satellite_data/{i}.h5', file_size=1, status='completed',
+                processing_end_time=timezone.now(), stage_timings={'label': [i + 1.0, i + 1.0, 0, 0]})
+        url = reverse('cloud_detection:api_stage_timings')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(User.objects.create_user('ops', password='secret'))
+        data = self.client.get(url, {'percentiles': '50'}).json()
+        self.assertEqual(data['jobs'], 3)
+        self.assertEqual(data['stages']['label']['wall_s'], {'p50': 2.0})
+        self.assertEqual(self.client.get(url, {'percentiles': '150'}).status_code, 400)
+
+
+class DeduplicationTests(TestCase):
+    """Content hashing of uploads and reuse of completed results"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.tmpdir)
+        self.settings_override.enable()
+        self.content = hdf5_bytes(self.tmpdir)
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def upload(self, name='scene_L1B.h5'):
+        saved, sha256 = save_upload(SimpleUploadedFile(name, self.content), f'uploads/{name}',
+                                    storage=FileSystemStorage(self.tmpdir))
+        return SatelliteData.objects.create(file_name=name, file_path=saved, file_size=len(self.content),
+                                            content_sha256=sha256)
+
+    def make_donor(self):
+        donor = self.upload()
+        plot = FileSystemStorage(self.tmpdir).save('results/brightness_temp/plot.png', SimpleUploadedFile('p', b'png'))
+        SatelliteData.objects.filter(pk=donor.pk).update(
+            status='completed', params_fingerprint=tcc_fingerprint(), processing_end_time=timezone.now(),
+            total_pixels=100, cloud_pixels=7, cloud_coverage_percentage=7.0, brightness_temperature_plot=plot)
+        donor.refresh_from_db()
+        return donor
+
+    def test_upload_hashed_while_saved(self):
+        data = self.upload()
+        self.assertEqual(data.content_sha256, self.sha256)
+        with open(data.file_path.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_reuse_links_results_and_drops_copy(self):
+        donor = self.make_donor()
+        duplicate = self.upload()
+        self.assertNotEqual(duplicate.file_path.name, donor.file_path.name)
+        own_copy = duplicate.file_path.path
+
+        self.assertIsNone(find_reusable_result(duplicate, 'other-parameters'))
+        self.assertEqual(find_reusable_result(duplicate, tcc_fingerprint()), donor)
+        reuse_result(duplicate, donor)
+
+        duplicate.refresh_from_db()
+        self.assertEqual((duplicate.status, duplicate.reused_from, duplicate.cloud_pixels), ('completed', donor, 7))
+        self.assertEqual(duplicate.file_path.name, donor.file_path.name)
+        self.assertEqual(duplicate.brightness_temperature_plot.name, donor.brightness_temperature_plot.name)
+        self.assertFalse(os.path.exists(own_copy))
+        # Links are never donors while the original is there
+        self.assertEqual(find_reusable_result(self.upload(), tcc_fingerprint()), donor)
+
+    def test_shared_files_survive_until_last_reference(self):
+        donor = self.make_donor()
+        duplicate = reuse_result(self.upload(), donor)
+        paths = [donor.file_path.path, donor.brightness_temperature_plot.path]
+
+        donor.delete()
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+        SatelliteData.objects.get(pk=duplicate.pk).delete()
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+    def test_upload_view_reuses_result(self):
+        donor = self.make_donor()
+        self.client.force_login(User.objects.create_user('uploader', password='secret'))
+        response = self.client.post(reverse('cloud_detection:upload_file'), {
+            'file_path': SimpleUploadedFile('scene_L1B.h5', self.content),
+            'satellite_name': 'INSAT', 'data_type': 'HDF5',
+        })
+        self.assertEqual(response.status_code, 302)
+        data = SatelliteData.objects.exclude(pk=donor.pk).get()
+        self.assertEqual((data.status, data.reused_from_id, data.content_sha256), ('completed', donor.pk, self.sha256))
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'uploads')), [os.path.basename(donor.file_path.name)])
+
+
+class StreamingUploadTests(TestCase):
+    """Uploads streamed into storage, hashed and validated by the upload handler"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.tmpdir)
+        self.settings_override.enable()
+        self.content = hdf5_bytes(self.tmpdir)
+        self.user = User.objects.create_user('uploader', password='secret')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def post(self, name, content):
+        return self.client.post(reverse('cloud_detection:upload_file'), {
+            'file_path': SimpleUploadedFile(name, content), 'satellite_name': 'INSAT', 'data_type': 'HDF5',
+        })
+
+    def stored_uploads(self):
+        directory = os.path.join(self.tmpdir, 'uploads')
+        return os.listdir(directory) if os.path.isdir(directory) else []
+
+    def test_header_check(self):
+        self.assertTrue(check_hdf5_header(self.content))
+        # Behind a 512 byte user block
+        self.assertTrue(check_hdf5_header(bytes(512) + self.content))
+        # Undecided until the superblock fields have arrived
+        self.assertFalse(check_hdf5_header(self.content[:10]))
+        for bad in (b'CDF\x01' + bytes(64), self.content[:8] + b'\x07' + self.content[9:]):
+            with self.assertRaises(InvalidUpload):
+                check_hdf5_header(bad, complete=True)
+
+    def test_upload_streamed_into_place(self):
+        closed = []
+
+        def recording_save_upload(uploaded_file, name):
+            saved = save_upload(uploaded_file, name)
+            closed.append(uploaded_file.closed)
+            return saved
+
+        with mock.patch('cloud_detection.views.save_upload', side_effect=recording_save_upload):
+            self.assertEqual(self.post('scene_L1B.h5', self.content).status_code, 302)
+        # The handle on the stored file is closed as soon as the record takes it
+        self.assertEqual(closed, [True])
+
+        data = SatelliteData.objects.get(uploaded_by=self.user)
+        self.assertEqual(data.content_sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual((data.status, data.file_size), ('queued', len(self.content)))
+        # Written once, where the record points
+        self.assertEqual(self.stored_uploads(), [os.path.basename(data.file_path.name)])
+        with open(data.file_path.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_non_hdf5_rejected(self):
+        response = self.post('scene_L1B.h5', b'not an HDF5 file' * 4096)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(SatelliteData.objects.exists())
+        self.assertEqual(self.stored_uploads(), [])
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_invalid_form_discards_stored_file(self):
+        response = self.post('scene_L1B.txt', self.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(SatelliteData.objects.exists())
+        self.assertEqual(self.stored_uploads(), [])
+
+
+class ChunkedUploadTests(TestCase):
+    """The resumable chunked upload API"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.tmpdir)
+        self.settings_override.enable()
+        # Three chunks, the last one short
+        self.content = hdf5_bytes(self.tmpdir, values=80000)
+        self.user = User.objects.create_user('uploader', password='secret')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def create(self, name='scene_L1B.h5', size=None):
+        return self.client.post(
+            reverse('cloud_detection:api_create_upload'),
+            json.dumps({'file_name': name, 'file_size': size or len(self.content), 'chunk_size': MIN_CHUNK_SIZE}),
+            content_type='application/json')
+
+    def put(self, upload_id, index, data=None):
+        if data is None:
+            data = self.content[index * MIN_CHUNK_SIZE:(index + 1) * MIN_CHUNK_SIZE]
+        return self.client.put(reverse('cloud_detection:api_upload_chunk', args=[upload_id, index]),
+                               data, content_type='application/octet-stream')
+
+    def status(self, upload_id):
+        return self.client.get(reverse('cloud_detection:api_upload_session', args=[upload_id])).json()
+
+    def finalize(self, upload_id):
+        return self.client.post(reverse('cloud_detection:api_finalize_upload', args=[upload_id]))
+
+    def test_out_of_order_chunks_resumed_and_finalized(self):
+        session = self.create().json()
+        upload_id = session['upload_id']
+        self.assertEqual(session['chunk_count'], 3)
+
+        self.assertEqual(self.put(upload_id, 2).status_code, 200)
+        self.assertEqual(self.put(upload_id, 0).status_code, 200)
+        status = self.status(upload_id)
+        self.assertEqual(status['received_ranges'], [[0, MIN_CHUNK_SIZE], [2 * MIN_CHUNK_SIZE, len(self.content)]])
+        self.assertEqual(status['missing_chunks'], [1])
+        self.assertEqual(self.finalize(upload_id).status_code, 400)
+
+        self.put(upload_id, 1)
+        result = self.finalize(upload_id).json()
+        data = SatelliteData.objects.get(pk=result['data_id'])
+        self.assertEqual((data.status, data.uploaded_by, data.file_size), ('queued', self.user, len(self.content)))
+        self.assertEqual(data.content_sha256, hashlib.sha256(self.content).hexdigest())
+        with open(data.file_path.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(os.path.exists(session_dir(UploadSession.objects.get(pk=upload_id))))
+        # A retried finalize returns the same record
+        self.assertEqual(self.finalize(upload_id).json()['data_id'], data.pk)
+
+    def test_chunk_length_checked(self):
+        upload_id = self.create().json()['upload_id']
+        self.assertEqual(self.put(upload_id, 1, b'short').status_code, 400)
+        self.assertEqual(self.put(upload_id, 3).status_code, 400)
+        self.assertEqual(self.status(upload_id)['received_chunks'], [])
+
+    def test_non_hdf5_rejected_at_first_chunk(self):
+        upload_id = self.create().json()['upload_id']
+        response = self.put(upload_id, 0, bytes(MIN_CHUNK_SIZE))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('HDF5', response.json()['error'])
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'upload_sessions')), [])
+
+    def test_session_validation(self):
+        self.assertEqual(self.create(name='scene.txt').status_code, 400)
+        self.assertEqual(self.create(size=600 * 1024 * 1024).status_code, 400)
+        other = User.objects.create_user('other', password='secret')
+        upload = UploadSession.objects.create(user=other, file_name='a.h5', file_size=10, chunk_size=MIN_CHUNK_SIZE)
+        response = self.client.get(reverse('cloud_detection:api_upload_session', args=[upload.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_expired_sessions_discarded(self):
+        ids = [self.create().json()['upload_id'] for _session in range(3)]
+        expired = timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS + 1)
+        UploadSession.objects.filter(pk__in=ids).update(created_at=expired)
+        # A finalize that started long ago died; a recent one is still running
+        UploadSession.objects.filter(pk=ids[1]).update(state='finalizing', updated_at=expired)
+        UploadSession.objects.filter(pk=ids[2]).update(state='finalizing', updated_at=timezone.now())
+
+        self.create()
+        self.assertFalse(UploadSession.objects.filter(pk__in=ids[:2]).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'upload_sessions', ids[1])))
+        self.assertEqual(UploadSession.objects.get(pk=ids[2]).state, 'finalizing')
+
+
+class FakeObjectSource:
+    """GCSSource stand-in serving objects from a local directory"""
+
+    def __init__(self, root):
+        self.root = root
+        self.generations = {}
+        self.lookups = 0
+        self.downloads = []
+
+    def put(self, bucket, path, content):
+        target = os.path.join(self.root, bucket, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+        self.generations[bucket, path] = self.generations.get((bucket, path), 0) + 1
+
+    def generation(self, bucket, path):
+        self.lookups += 1
+        return self.generations[bucket, path]
+
+    def download(self, bucket, path, generation, destination):
+        assert generation == self.generations[bucket, path]
+        self.downloads.append((bucket, path, generation))
+        shutil.copyfile(os.path.join(self.root, bucket, path), destination)
+
+
+class InputCacheTests(TestCase):
+    """Node-local cache of GCS-sourced inputs"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = FakeObjectSource(os.path.join(self.tmpdir, 'gcs'))
+        self.cache = InputCache(os.path.join(self.tmpdir, 'cache'), max_bytes=2500)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def fetch(self, path, bucket='scenes'):
+        generation = self.source.generation(bucket, path)
+        fetch = lambda destination: self.source.download(bucket, path, generation, destination)
+        return self.cache.open(bucket, path, generation, fetch)
+
+    def cached_files(self):
+        return sorted(name for name in os.listdir(self.cache.directory) if not name.endswith('.lock'))
+
+    def test_hits_until_object_changes(self):
+        self.source.put('scenes', 'a.h5', b'first')
+        with self.fetch('a.h5') as (path, cached):
+            self.assertFalse(cached)
+        with self.fetch('a.h5') as (path, cached):
+            self.assertTrue(cached)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'first')
+        self.assertEqual(len(self.source.downloads), 1)
+
+        # A new generation is a different entry
+        self.source.put('scenes', 'a.h5', b'second')
+        with self.fetch('a.h5') as (path, cached):
+            self.assertFalse(cached)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'second')
+
+    def entry(self, path, bucket='scenes'):
+        return self.cache.entry_path(cache_key(bucket, path, self.source.generation(bucket, path)))
+
+    def test_least_recently_used_evicted_unless_in_use(self):
+        for name in ('a.h5', 'b.h5', 'c.h5', 'd.h5'):
+            self.source.put('scenes', name, bytes(1000))
+        for mtime, name in enumerate(('a.h5', 'b.h5'), start=1):
+            with self.fetch(name):
+                pass
+            os.utime(self.entry(name), (mtime, mtime))
+        # Using a makes b the least recently used
+        with self.fetch('a.h5'):
+            pass
+        with self.fetch('c.h5'):
+            pass
+        self.assertFalse(os.path.exists(self.entry('b.h5')))
+        self.assertEqual(self.cache.size_bytes(), 2000)
+
+        # Entries in use are kept even if that exceeds the budget
+        with self.fetch('a.h5'), self.fetch('c.h5'), self.fetch('d.h5'):
+            self.assertEqual(self.cache.size_bytes(), 3000)
+        self.assertEqual(self.cache.evict(), 2000)
+        self.assertTrue(os.path.exists(self.entry('d.h5')))
+
+    def test_failed_download_leaves_nothing(self):
+        def fail(destination):
+            with open(destination, 'wb') as f:
+                f.write(b'partial')
+            raise OSError('connection reset')
+
+        with self.assertRaises(OSError):
+            with self.cache.open('scenes', 'a.h5', 1, fail):
+                pass
+        self.assertEqual(self.cached_files(), [])
+
+
+class ProcessorTests(TestCase):
+    """CloudDetectionProcessor end to end, in a scratch media directory"""
+
+    def setUp(self):
+        warnings.simplefilter('ignore', FutureWarning)
+        self.tmpdir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        # The processor writes results relative to the working directory
+        os.chdir(self.tmpdir)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.tmpdir, GEOLOCATION_CACHE_DIR=os.path.join(self.tmpdir, 'geo'))
+        self.settings_override.enable()
+
+        os.makedirs(os.path.join(self.tmpdir, 'satellite_data'))
+        h5_path = write_synthetic_h5(
+            os.path.join(self.tmpdir, 'satellite_data', 'scene_L1B_test.h5'), shape=(400, 400),
+            n_small=300, n_large=12, seed=1)
+        self.satellite_data = SatelliteData.objects.create(
+            file_name='scene_L1B_test.h5', file_path='satellite_data/scene_L1B_test.h5',
+            file_size=os.path.getsize(h5_path))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def process(self, **overrides):
+        with override_settings(**overrides):
+            CloudDetectionProcessor(self.satellite_data).process_satellite_data()
+        self.satellite_data.refresh_from_db()
+        return self.satellite_data
+
+    def test_statistics_from_in_memory_arrays(self):
+        data = self.process(TCC_PERSIST_ARRAYS='async')
+        self.assertEqual(data.status, 'completed', data.error_message)
+
+        results_dir = os.path.join('media', 'results', str(data.id))
+        mask = np.load(os.path.join(results_dir, 'scene_mask.npy'))
+        bt = np.load(os.path.join(results_dir, 'scene_BT.npy'))
+        self.assertEqual(data.total_pixels, mask.size)
+        self.assertEqual(data.cloud_pixels, int(mask.sum()))
+        self.assertAlmostEqual(data.min_temperature, float(np.nanmin(bt)), places=3)
+        self.assertAlmostEqual(data.avg_temperature, float(np.nanmean(bt)), places=2)
+        self.assertTrue(data.brightness_temperature_plot)
+        self.assertTrue({'algorithm', 'read', 'threshold', 'label', 'plot', 'thumbnails', 'stats', 'save'}
+                        <= set(data.stage_timings))
+        for field in (data.thumbnail_small, data.thumbnail_image, data.thumbnail_retina):
+            self.assertTrue(field.name.endswith('.webp'))
+            self.assertTrue(os.path.exists(field.path))
+
+    def test_temperature_statistics_cover_tropical_window(self):
+        data = self.process(TCC_PERSIST_ARRAYS='sync')
+        self.assertEqual(data.status, 'completed', data.error_message)
+        windowed = np.load(os.path.join('media', 'results', str(data.id), 'scene_BT.npy'))
+        full = extract_tcc_mask(data.file_path.path, os.path.join(self.tmpdir, 'full'), make_plot=False,
+                                tropical_window=False, persist='none')['bt']
+
+        in_window = full[~np.isnan(windowed)]
+        self.assertEqual(data.total_pixels, full.size)
+        self.assertAlmostEqual(data.min_temperature, float(np.nanmin(in_window)), places=3)
+        self.assertAlmostEqual(data.max_temperature, float(np.nanmax(in_window)), places=3)
+        self.assertAlmostEqual(data.avg_temperature, float(np.nanmean(in_window)), places=2)
+        # Not the full-disk figures
+        self.assertNotAlmostEqual(data.avg_temperature, float(np.nanmean(full)), places=2)
+
+    def test_worker_processes_queued_job(self):
+        enqueue_job(self.satellite_data)
+        with override_settings(TCC_PERSIST_ARRAYS='none'):
+            self.assertEqual(run_worker(worker_id='worker-1', exit_when_idle=True), 1)
+
+        self.satellite_data.refresh_from_db()
+        self.assertEqual(self.satellite_data.status, 'completed', self.satellite_data.error_message)
+        self.assertEqual(self.satellite_data.attempts, 1)
+        self.assertIsNone(self.satellite_data.lease_owner)
+        self.assertIsNone(self.satellite_data.lease_expires_at)
+        self.assertGreater(self.satellite_data.memory_estimate_mb, 0)
+        self.assertIsNotNone(self.satellite_data.peak_memory_mb)
+        self.assertGreaterEqual(self.satellite_data.wait_seconds, 0)
+        self.assertGreater(self.satellite_data.service_seconds, 0)
+
+    def test_logs_written_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.process(TCC_PERSIST_ARRAYS='none')
+        self.assertEqual(data.status, 'completed', data.error_message)
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "cloud_detection_processinglog"')]
+        self.assertGreater(data.logs.count(), 20)
+        self.assertLessEqual(len(inserts), 4)
+
+    def test_failure_logs_flushed(self):
+        SatelliteData.objects.filter(pk=self.satellite_data.pk).update(file_path='satellite_data/missing.h5')
+        self.satellite_data.refresh_from_db()
+        data = self.process()
+        self.assertEqual(data.status, 'failed')
+        self.assertTrue(data.logs.filter(level='error', message__startswith='Processing failed').exists())
+
+    def test_memory_profile_opt_in(self):
+        data = self.process(TCC_PERSIST_ARRAYS='none')
+        self.assertIsNone(data.memory_profile)
+
+        data = self.process(TCC_PERSIST_ARRAYS='none', TCC_MEMORY_PROFILE=True)
+        self.assertEqual(data.status, 'completed', data.error_message)
+        self.assertEqual(set(data.memory_profile), set(data.stage_timings))
+        self.assertGreater(data.memory_profile['read']['traced_peak_mb'], 0)
+        self.assertIn('Per-stage memory', str(SatelliteDataAdmin.memory_profile_summary.short_description))
+        self.assertIn('<table>', SatelliteDataAdmin(SatelliteData, admin.site).memory_profile_summary(data))
+
+    def test_input_opened_once(self):
+        with mock.patch('cloud_detection.hdf5_session.h5py.File', wraps=h5py.File) as h5_open:
+            data = self.process(TCC_PERSIST_ARRAYS='none')
+        self.assertEqual(data.status, 'completed', data.error_message)
+        self.assertEqual(h5_open.call_count, 1)
+
+    def test_queued_duplicate_reuses_result(self):
+        with open(self.satellite_data.file_path.path, 'rb') as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        SatelliteData.objects.filter(pk=self.satellite_data.pk).update(content_sha256=sha256)
+        self.satellite_data.refresh_from_db()
+        data = self.process(TCC_PERSIST_ARRAYS='none')
+        self.assertEqual((data.status, data.params_fingerprint), ('completed', tcc_fingerprint()))
+
+        duplicate = SatelliteData.objects.create(
+            file_name='copy.h5', file_path=data.file_path.name, file_size=data.file_size, content_sha256=sha256)
+        with mock.patch('cloud_detection.processing.extract_tcc_mask', side_effect=AssertionError('reprocessed')):
+            CloudDetectionProcessor(duplicate).process_satellite_data()
+        duplicate.refresh_from_db()
+        self.assertEqual((duplicate.status, duplicate.reused_from_id), ('completed', data.pk), duplicate.error_message)
+        self.assertEqual(duplicate.cloud_pixels, data.cloud_pixels)
+
+    def test_gcs_input_cached_across_attempts(self):
+        source = FakeObjectSource(os.path.join(self.tmpdir, 'gcs'))
+        with open(self.satellite_data.file_path.path, 'rb') as f:
+            source.put('scenes', 'scene_L1B_test.h5', f.read())
+        SatelliteData.objects.filter(pk=self.satellite_data.pk).update(
+            upload_source='gcs', gcs_bucket='scenes', gcs_path='scene_L1B_test.h5')
+        self.satellite_data.refresh_from_db()
+
+        cache_dir = os.path.join(self.tmpdir, 'inputs')
+        with override_settings(TCC_PERSIST_ARRAYS='none', INPUT_CACHE_DIR=cache_dir):
+            for _attempt in range(2):
+                CloudDetectionProcessor(self.satellite_data, input_source=source).process_satellite_data()
+                self.satellite_data.refresh_from_db()
+                self.assertEqual(self.satellite_data.status, 'completed', self.satellite_data.error_message)
+        self.assertEqual(len(source.downloads), 1)
+        # One generation lookup per attempt, shared by the checkpoint key and the cache
+        self.assertEqual(source.lookups, 2)
+
+        # Without the cache a failed attempt still removes its download
+        downloads = []
+        real_mkstemp = tempfile.mkstemp
+
+        def mkstemp(*args, **kwargs):
+            fd, path = real_mkstemp(*args, **kwargs)
+            downloads.append(path)
+            return fd, path
+
+        with override_settings(INPUT_CACHE_DIR=''), \
+                mock.patch('cloud_detection.input_cache.tempfile.mkstemp', side_effect=mkstemp), \
+                mock.patch('cloud_detection.processing.extract_tcc_mask', side_effect=RuntimeError('boom')):
+            CloudDetectionProcessor(self.satellite_data, input_source=source).process_satellite_data()
+        self.satellite_data.refresh_from_db()
+        self.assertEqual(self.satellite_data.status, 'failed')
+        self.assertEqual(len(downloads), 1)
+        self.assertFalse(os.path.exists(downloads[0]))
+
+    def test_retry_resumes_after_failed_stage(self):
+        with mock.patch.object(CloudDetectionProcessor, 'copy_plot_to_django_media',
+                               side_effect=OSError('disk full')):
+            data = self.process(TCC_PERSIST_ARRAYS='sync')
+        self.assertEqual(data.status, 'failed')
+        manifest = json.load(open(os.path.join('media', 'results', str(data.id), 'manifest.json')))
+        self.assertEqual(set(manifest['stages']), {'arrays', 'stats'})
+
+        with mock.patch('cloud_detection.processing.extract_tcc_mask', side_effect=AssertionError('recomputed')):
+            data = self.process(TCC_PERSIST_ARRAYS='sync')
+        self.assertEqual(data.status, 'completed', data.error_message)
+        self.assertTrue(os.path.exists(data.brightness_temperature_plot.path))
+        self.assertTrue(os.path.exists(data.thumbnail_small.path))
+        self.assertTrue(data.logs.filter(message='Using the statistics of an earlier attempt').exists())
+
+    def test_retry_skips_plot_and_thumbnails(self):
+        with mock.patch.object(CloudDetectionProcessor, 'wait_for_persisted_arrays', side_effect=RuntimeError('boom')):
+            data = self.process(TCC_PERSIST_ARRAYS='none')
+        self.assertEqual(data.status, 'failed')
+        plot_name = data.brightness_temperature_plot.name
+
+        with mock.patch('cloud_detection.processing.extract_tcc_mask', side_effect=AssertionError('recomputed')), \
+                mock.patch('cloud_detection.processing.save_plot', side_effect=AssertionError('rendered')):
+            data = self.process(TCC_PERSIST_ARRAYS='none')
+        self.assertEqual(data.status, 'completed', data.error_message)
+        self.assertEqual(data.brightness_temperature_plot.name, plot_name)
+        self.assertTrue(data.thumbnail_retina.name.endswith('.webp'))
+
+        # A completed job is reprocessed from scratch
+        with mock.patch('cloud_detection.processing.extract_tcc_mask', side_effect=RuntimeError('recomputed')):
+            data = self.process(TCC_PERSIST_ARRAYS='none')
+        self.assertEqual(data.status, 'failed')
+
+    def test_damaged_checkpoint_recomputed(self):
+        with mock.patch.object(CloudDetectionProcessor, 'copy_plot_to_django_media',
+                               side_effect=OSError('disk full')):
+            data = self.process(TCC_PERSIST_ARRAYS='sync')
+        results_dir = os.path.join('media', 'results', str(data.id))
+        with open(os.path.join(results_dir, 'scene_BT.npy'), 'r+b') as f:
+            f.seek(-4, os.SEEK_END)
+            f.write(b'\0\0\0\0')
+        # The plot still needs the arrays, which are recomputed
+        data = self.process(TCC_PERSIST_ARRAYS='sync')
+        self.assertEqual(data.status, 'completed', data.error_message)
+        self.assertFalse(data.logs.filter(message='Using the BT/mask arrays of an earlier attempt').exists())
+
+    def test_checkpoints_ignored_when_parameters_change(self):
+        with mock.patch.object(CloudDetectionProcessor, 'copy_plot_to_django_media',
+                               side_effect=OSError('disk full')):
+            self.process(TCC_PERSIST_ARRAYS='sync')
+        with mock.patch('cloud_detection.processing.tcc_fingerprint', return_value='changed'), \
+                mock.patch('cloud_detection.processing.extract_tcc_mask', side_effect=RuntimeError('recomputed')):
+            data = self.process(TCC_PERSIST_ARRAYS='sync')
+        self.assertEqual(data.status, 'failed')
+        self.assertIn('recomputed', data.error_message)
+
+    def test_cancelled_between_stages(self):
+        token = CancelToken()
+        token.cancel('Cancelled by user')
+        with override_settings(TCC_PERSIST_ARRAYS='none'):
+            CloudDetectionProcessor(self.satellite_data, cancel_token=token).process_satellite_data()
+        self.satellite_data.refresh_from_db()
+        self.assertEqual((self.satellite_data.status, self.satellite_data.error_message),
+                         ('cancelled', 'Cancelled by user'))
+
+        token = CancelToken()
+        real_extract = extract_tcc_mask
+
+        def extract_then_time_out(*args, **kwargs):
+            result = real_extract(*args, **kwargs)
+            token.cancel('Exceeded the 1s time budget', timed_out=True)
+            return result
+
+        with override_settings(TCC_PERSIST_ARRAYS='none'), \
+                mock.patch('cloud_detection.processing.extract_tcc_mask', side_effect=extract_then_time_out):
+            CloudDetectionProcessor(self.satellite_data, cancel_token=token).process_satellite_data()
+        self.satellite_data.refresh_from_db()
+        self.assertEqual(self.satellite_data.status, 'failed')
+        self.assertIsNone(self.satellite_data.cloud_pixels)
+        self.assertTrue(self.satellite_data.logs.filter(
+            message='Processing stopped: Exceeded the 1s time budget').exists())
+
+    def test_cancel_between_stage_saves_not_lost(self):
+        token = CancelToken()
+        processor = CloudDetectionProcessor(self.satellite_data, cancel_token=token)
+        watchdog = JobWatchdog(self.satellite_data, 'worker-1', token, budget_seconds=0)
+        real_render = processor.render_plot
+
+        def cancel_while_rendering(result, extent):
+            # The user cancels before the plot stage saves; the watchdog
+            # notices only after that save
+            self.assertEqual(cancel_job(SatelliteData.objects.get(pk=self.satellite_data.pk)), 'cancelling')
+            thumbnail_files = real_render(result, extent)
+            watchdog.poll()
+            return thumbnail_files
+
+        with override_settings(TCC_PERSIST_ARRAYS='none'), \
+                mock.patch.object(processor, 'render_plot', side_effect=cancel_while_rendering):
+            processor.process_satellite_data()
+        self.satellite_data.refresh_from_db()
+        self.assertEqual((self.satellite_data.status, self.satellite_data.cancel_requested), ('cancelled', True))
+
+    def test_tiled_run_cancelled_between_tiles(self):
+        calls = []
+
+        def cancel():
+            calls.append(None)
+            if len(calls) == 3:
+                raise JobCancelled('Cancelled by user')
+
+        output_dir = os.path.join(self.tmpdir, 'tiled')
+        with self.assertRaises(JobCancelled):
+            extract_tcc_mask(self.satellite_data.file_path.path, output_dir, max_memory_mb=0.5,
+                             make_plot=False, cancel=cancel)
+        self.assertEqual(len(calls), 3)
+        # The scratch label file is removed
+        self.assertFalse(any(name.endswith('.labels') for name in os.listdir(output_dir)))
+
+    def test_arrays_not_persisted(self):
+        data = self.process(TCC_PERSIST_ARRAYS='none')
+        self.assertEqual(data.status, 'completed', data.error_message)
+        self.assertGreater(data.cloud_pixels, 0)
+        results_dir = os.path.join('media', 'results', str(data.id))
+        self.assertFalse(any(name.endswith('.npy') for name in os.listdir(results_dir)))
+
+
+class BatchTests(TestCase):
+    """Batch detection over a directory of L1B files"""
+
+    def setUp(self):
+        warnings.simplefilter('ignore', FutureWarning)
+        self.tmpdir = tempfile.mkdtemp()
+        self.archive = os.path.join(self.tmpdir, 'archive')
+        os.makedirs(self.archive)
+        for seed in (1, 2):
+            write_synthetic_h5(os.path.join(self.archive, f'scene{seed}_L1B.h5'), shape=(300, 300),
+                               n_small=100, n_large=8, seed=seed)
+        # Same content under another name
+        shutil.copy(os.path.join(self.archive, 'scene1_L1B.h5'), os.path.join(self.archive, 'copy_L1B.h5'))
+        with open(os.path.join(self.archive, 'notes.txt'), 'w') as f:
+            f.write('not a scene')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_batch_summary_and_resume(self):
+        output_dir = os.path.join(self.tmpdir, 'out')
+        report = run_batch(self.archive, output_dir, workers=2, parameters={'min_radius_km': 40})
+        self.assertEqual((report['files'], report['processed'], report['skipped'], report['failed']), (3, 3, 0, 0))
+        self.assertGreater(report['files_per_minute'], 0)
+
+        records = read_summary(os.path.join(output_dir, 'summary.jsonl'))
+        self.assertEqual(sorted(os.path.basename(r['file']) for r in records),
+                         ['copy_L1B.h5', 'scene1_L1B.h5', 'scene2_L1B.h5'])
+        # Hashed in the workers
+        by_name = {os.path.basename(r['file']): r for r in records}
+        self.assertEqual(by_name['copy_L1B.h5']['sha256'], by_name['scene1_L1B.h5']['sha256'])
+        self.assertEqual(by_name['scene1_L1B.h5']['sha256'], file_digest(os.path.join(self.archive, 'scene1_L1B.h5')))
+        reference = extract_tcc_mask(os.path.join(self.archive, 'scene2_L1B.h5'), os.path.join(self.tmpdir, 'ref'),
+                                     min_radius_km=40, make_plot=False)
+        record = next(r for r in records if r['file'].endswith('scene2_L1B.h5'))
+        self.assertEqual(record['cloud_pixels'], int(reference['mask'].sum()))
+        self.assertEqual(record['cloud_cluster_count'], reference['cluster_count'])
+        self.assertTrue(os.path.exists(record['mask_file']))
+
+        # A second run only picks up new and modified files
+        write_synthetic_h5(os.path.join(self.archive, 'scene3_L1B.h5'), shape=(300, 300), n_small=50, seed=3)
+        os.utime(os.path.join(self.archive, 'scene2_L1B.h5'), ns=(0, 10 ** 9))
+        report = run_batch(os.path.join(self.archive, 'scene*_L1B.h5'), output_dir, workers=1,
+                           parameters={'min_radius_km': 40})
+        self.assertEqual((report['files'], report['processed'], report['skipped']), (3, 2, 1))
+        self.assertEqual(len(read_summary(os.path.join(output_dir, 'summary.jsonl'))), 5)
+
+    def test_same_named_files_kept_apart(self):
+        for name, seed in (('a', 1), ('b', 2)):
+            os.makedirs(os.path.join(self.archive, name))
+            write_synthetic_h5(os.path.join(self.archive, name, 'scene_L1B.h5'), shape=(300, 300), n_small=50,
+                               seed=seed)
+        shutil.copy(os.path.join(self.archive, 'scene1_L1B.h5'), os.path.join(self.archive, 'scene1_L1B.hdf5'))
+        output_dir = os.path.join(self.tmpdir, 'out')
+        run_batch(os.path.join(self.archive, '**', 'scene*_L1B.*'), output_dir, workers=2,
+                  parameters={'min_radius_km': 40})
+
+        records = read_summary(os.path.join(output_dir, 'summary.jsonl'))
+        self.assertEqual(len(records), 5)
+        mask_dirs = {os.path.relpath(os.path.dirname(r['mask_file']), output_dir) for r in records}
+        self.assertEqual(mask_dirs, {'scene1_L1B_h5', 'scene1_L1B_hdf5', 'scene2_L1B_h5',
+                                     os.path.join('a', 'scene_L1B_h5'), os.path.join('b', 'scene_L1B_h5')})
+
+    def test_command_writes_csv(self):
+        os.remove(os.path.join(self.archive, 'copy_L1B.h5'))
+        with open(os.path.join(self.archive, 'broken_L1B.h5'), 'wb') as f:
+            f.write(b'truncated')
+        summary = os.path.join(self.tmpdir, 'summary.csv')
+        out = io.StringIO()
+        call_command('tcc_batch', self.archive, output_dir=os.path.join(self.tmpdir, 'out'), summary=summary,
+                     workers=2, persist='none', geo_cache_dir=os.path.join(self.tmpdir, 'geo'), stdout=out)
+        records = {os.path.basename(r['file']): r for r in read_summary(summary)}
+        self.assertEqual(set(records), {'broken_L1B.h5', 'scene1_L1B.h5', 'scene2_L1B.h5'})
+        self.assertEqual(records['broken_L1B.h5']['status'], 'error')
+        self.assertEqual(records['scene1_L1B.h5']['status'], 'ok')
+        self.assertEqual(records['scene1_L1B.h5']['mask_file'], '')
+        self.assertIn('files/minute', out.getvalue())
+        self.assertIn('1 file(s) failed', out.getvalue())
+
+    def test_command_defaults(self):
+        from .management.commands.tcc_batch import Command, default_workers
+
+        files = [os.path.join(self.archive, name) for name in ('scene1_L1B.h5', 'notes.txt')]
+        per_file_mb = model_peak_mb((300, 300), 4)
+        with override_settings(JOB_MEMORY_BUDGET_MB=3 * per_file_mb):
+            self.assertEqual(default_workers(files, None), min(3, os.cpu_count()))
+        with override_settings(JOB_MEMORY_BUDGET_MB=1):
+            self.assertEqual(default_workers(files, None), 1)
+
+        command = Command(stdout=io.StringIO())
+        command.report_file({'file': 'empty_L1B.h5', 'status': 'ok', 'cloud_coverage_percentage': None,
+                             'cloud_cluster_count': 0, 'seconds': 0.5}, False)
+        self.assertIn('empty_L1B.h5: n/a TCC', command.stdout.getvalue())
+
+
+class IngestTests(TestCase):
+    """Watch-folder ingestion of files dropped by the ground station"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.media = os.path.join(self.tmpdir, 'media')
+        self.incoming = os.path.join(self.tmpdir, 'incoming')
+        os.makedirs(self.incoming)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.content = hdf5_bytes(self.tmpdir)
+        self.now = time.time()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def drop(self, name, content=None):
+        path = os.path.join(self.incoming, name)
+        with open(path, 'wb') as f:
+            f.write(self.content if content is None else content)
+        return path
+
+    def watcher(self, **options):
+        options.setdefault('stable_seconds', 30)
+        options.setdefault('max_backlog', 0)
+        return FolderWatcher(self.incoming, clock=lambda: self.now, **options)
+
+    def test_waits_until_file_is_stable(self):
+        path = self.drop('scene_L1B.h5')
+        watcher = self.watcher()
+        # Too recently written
+        self.assertEqual(watcher.poll(), [])
+        self.now += 60
+        # Still being appended to
+        with open(path, 'ab') as f:
+            f.write(b'\0' * 16)
+        self.assertEqual(watcher.poll(), [])
+        self.now += 60
+        [satellite_data] = watcher.poll()
+        self.assertEqual(satellite_data.status, 'queued')
+        self.assertEqual(satellite_data.upload_source, 'watch')
+        self.assertEqual(satellite_data.ingest_source, path)
+        self.assertEqual(satellite_data.file_size, len(self.content) + 16)
+        self.assertEqual(watcher.poll(), [])
+
+    def test_links_instead_of_copying(self):
+        path = self.drop('scene_L1B.h5')
+        self.now += 60
+        [satellite_data] = self.watcher().poll()
+        stored = os.path.join(self.media, satellite_data.file_path.name)
+        self.assertTrue(satellite_data.file_path.name.startswith('uploads/'))
+        self.assertTrue(os.path.samefile(stored, path))
+        self.assertEqual(satellite_data.content_sha256, hashlib.sha256(self.content).hexdigest())
+
+    def test_skips_files_that_are_not_hdf5(self):
+        self.drop('broken_L1B.h5', b'not an hdf5 file' * 100)
+        self.drop('notes.txt', b'readme')
+        self.drop('.partial_L1B.h5')
+        self.now += 60
+        watcher = self.watcher()
+        with self.assertLogs('cloud_detection.ingest', level='WARNING'):
+            self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.poll(), [])
+        self.assertFalse(SatelliteData.objects.exists())
+
+    def test_backpressure_holds_files_until_backlog_drains(self):
+        for index in range(3):
+            self.drop(f'scene{index}_L1B.h5')
+        self.now += 60
+        watcher = self.watcher(max_backlog=2)
+        self.assertEqual(len(watcher.poll()), 2)
+        with self.assertLogs('cloud_detection.ingest', level='WARNING'):
+            self.assertEqual(watcher.poll(), [])
+        self.assertTrue(watcher.paused)
+
+        SatelliteData.objects.filter(status='queued').update(status='completed')
+        self.assertEqual(len(watcher.poll()), 1)
+        self.assertFalse(watcher.paused)
+
+    def test_restarted_watcher_skips_ingested_files(self):
+        path = self.drop('scene_L1B.h5')
+        # Not yet written for long enough
+        self.assertEqual(run_ingest(self.incoming, once=True, stable_seconds=30, max_backlog=0), 0)
+        os.utime(path, (self.now - 60, self.now - 60))
+        self.assertEqual(run_ingest(self.incoming, once=True, stable_seconds=30, max_backlog=0), 1)
+        self.assertEqual(run_ingest(self.incoming, once=True, stable_seconds=30, max_backlog=0), 0)
+        self.assertEqual(self.watcher().poll(), [])
+        self.assertEqual(SatelliteData.objects.count(), 1)
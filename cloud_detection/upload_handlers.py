@@ -0,0 +1,206 @@
+"""
+Streaming upload handling for HDF5 scenes.
+
+StreamingUploadHandler writes each uploaded file chunk by chunk straight to
+its final name under uploads/ in the default storage, hashing it (SHA-256)
+on the way, so neither Django's in-memory nor its temporary-file handler
+holds a second copy. The HDF5 signature and superblock are checked as soon
+as the first bytes arrive and anything else is rejected before the rest of
+the request body is read. Storages without local paths get the upload in a
+temporary file instead, still hashed and checked while it streams.
+
+Install it on a view with the streaming_upload decorator; dedup.save_upload
+recognizes files already in place and only records them.
+"""
+
+import hashlib
+import os
+from datetime import datetime
+from functools import wraps
+
+from django.contrib import messages
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from django.shortcuts import redirect
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+# The superblock sits at the start of the file or after a user block of
+# 512, 1024, 2048... bytes; further offsets are not searched
+SIGNATURE_OFFSETS = (0, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# Signature plus the superblock fields checked
+SUPERBLOCK_CHECK_BYTES = 16
+VALID_FIELD_SIZES = (2, 4, 8, 16, 32)
+
+
+class InvalidUpload(ValueError):
+    """The uploaded bytes are not an HDF5 file."""
+
+
+def check_hdf5_header(head, complete=False):
+    """
+    Validate the start of an HDF5 file. Returns True once a valid superblock
+    is found, False while more bytes are needed; raises InvalidUpload.
+    complete says head is the whole file.
+    """
+    for offset in SIGNATURE_OFFSETS:
+        end = offset + SUPERBLOCK_CHECK_BYTES
+        if len(head) < end:
+            if complete:
+                break
+            return False
+        if head[offset:offset + len(HDF5_SIGNATURE)] != HDF5_SIGNATURE:
+            continue
+        version = head[offset + 8]
+        if version > 3:
+            raise InvalidUpload(f"Unsupported HDF5 superblock version {version}")
+        # (size of offsets, size of lengths)
+        sizes = head[offset + 13:offset + 15] if version < 2 else head[offset + 9:offset + 11]
+        if any(size not in VALID_FIELD_SIZES for size in sizes):
+            raise InvalidUpload("Corrupt HDF5 superblock")
+        return True
+    raise InvalidUpload("Not an HDF5 file (no HDF5 signature)")
+
+
+def upload_name(file_name):
+    """Storage name for a new upload of file_name."""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f'uploads/satellite_data_{timestamp}_{file_name}'
+
+
+def create_in_storage(storage, name):
+    """
+    Create a new, empty file under an available variant of name in a
+    local storage; returns (storage name, file open for writing).
+    """
+    while True:
+        name = storage.get_available_name(storage.generate_filename(name))
+        path = storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            destination = open(path, 'xb')
+        except FileExistsError:
+            continue  # taken by a concurrent upload
+        if storage.file_permissions_mode is not None:
+            os.chmod(path, storage.file_permissions_mode)
+        return name, destination
+
+
+def has_local_paths(storage):
+    try:
+        storage.path('')
+    except NotImplementedError:
+        return False
+    return True
+
+
+class StoredUpload(UploadedFile):
+    """An upload already written to storage by StreamingUploadHandler."""
+
+    def __init__(self, storage_name, sha256, file, name, content_type, size, charset, content_type_extra=None):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.storage_name = storage_name
+        self.sha256 = sha256
+        # Set by dedup.save_upload once a record refers to the file
+        self.committed = False
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """Streams uploads into storage while hashing and validating them."""
+
+    def __init__(self, request=None, storage=None):
+        super().__init__(request)
+        self.storage = storage or default_storage
+        self.error = None
+        self.uploads = []
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.head = b''
+        self.validated = False
+        if has_local_paths(self.storage):
+            self.storage_name, self.file = create_in_storage(self.storage, upload_name(self.file_name))
+        else:
+            # Remote storage: stream to a temporary file, saved by the view
+            self.storage_name = None
+            self.file = TemporaryUploadedFile(
+                self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.validated:
+            self.head += raw_data
+            self._validate(complete=False)
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def _validate(self, complete):
+        try:
+            self.validated = check_hdf5_header(self.head, complete)
+        except InvalidUpload as e:
+            self.error = f'{self.file_name}: {e}'
+            self._discard()
+            raise StopUpload(connection_reset=True)
+        if self.validated:
+            self.head = b''
+
+    def _discard(self):
+        self.file.close()
+        if self.storage_name:
+            self.storage.delete(self.storage_name)
+
+    def file_complete(self, file_size):
+        if not self.validated:
+            self._validate(complete=True)
+        if self.storage_name is None:
+            self.file.seek(0)
+            self.file.size = file_size
+            self.file.sha256 = self.sha256.hexdigest()
+            return self.file
+        self.file.close()
+        upload = StoredUpload(
+            self.storage_name, self.sha256.hexdigest(), self.storage.open(self.storage_name, 'rb'),
+            self.file_name, self.content_type, file_size, self.charset, self.content_type_extra)
+        self.uploads.append(upload)
+        return upload
+
+    def upload_interrupted(self):
+        if getattr(self, 'file', None) is not None and not self.file.closed:
+            self._discard()
+
+    def discard_uncommitted(self):
+        """
+        Close every stored upload, delete those that no record took (e.g.
+        the form was invalid) and any file left incomplete by a failed
+        request.
+        """
+        self.upload_interrupted()
+        for upload in self.uploads:
+            upload.close()
+            if not upload.committed:
+                self.storage.delete(upload.storage_name)
+        self.uploads = []
+
+
+def streaming_upload(view):
+    """
+    Stream a view's file uploads through StreamingUploadHandler. Rejected
+    files are reported with messages and redirect back to the page.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        handler = StreamingUploadHandler(request)
+        request.upload_handlers.insert(0, handler)
+        try:
+            if request.method == 'POST':
+                request.POST  # parse the body now, through the handler
+                if handler.error:
+                    messages.error(request, f'Upload rejected: {handler.error}')
+                    return redirect(request.get_full_path())
+            return view(request, *args, **kwargs)
+        finally:
+            handler.discard_uncommitted()
+    return wrapper
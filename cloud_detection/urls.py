@@ -18,19 +18,25 @@ urlpatterns = [
     path('upload-large/', views.upload_large_files, name='upload_large_files'),
     
     # API endpoints
-    path('api/get-upload-url/', views.get_upload_url, name='get_upload_url'),
+    path('api/uploads/', views.api_create_upload, name='api_create_upload'),
+    path('api/uploads/<uuid:upload_id>/', views.api_upload_session, name='api_upload_session'),
+    path('api/uploads/<uuid:upload_id>/chunks/<int:index>/', views.api_upload_chunk, name='api_upload_chunk'),
+    path('api/uploads/<uuid:upload_id>/finalize/', views.api_finalize_upload, name='api_finalize_upload'),
     path('api/process-upload/', views.process_upload, name='process_upload'),
     path('api/real-time-data/', views.api_real_time_data, name='api_real_time_data'),
     path('api/analytics-data/', views.api_analytics_data, name='api_analytics_data'),
     path('api/analytics-details/<int:data_id>/', views.api_analytics_details, name='api_analytics_details'),
     path('api/system-status/', views.api_system_status, name='api_system_status'),
     path('api/chart-data/', views.api_chart_data, name='api_chart_data'),
+    path('api/stage-timings/', views.api_stage_timings, name='api_stage_timings'),
+    path('api/queue-latency/', views.api_queue_latency, name='api_queue_latency'),
     
     # Results and processing
     path('results/<int:data_id>/', views.results, name='results'),
     path('view-results/<int:data_id>/', views.view_results, name='view_results'),
     path('processing-status/<int:data_id>/', views.processing_status, name='processing_status'),
     path('retry-processing/<int:data_id>/', views.retry_processing, name='retry_processing'),
+    path('cancel-processing/<int:data_id>/', views.cancel_processing, name='cancel_processing'),
     
     # History and data management
     path('history/', views.history, name='history'),
@@ -17,9 +17,12 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import SatelliteData
+from .models import SatelliteData, UploadSession
 from .forms import SatelliteDataForm
-from .processing import process_satellite_file
+from .dedup import save_upload
+from .jobs import cancel_job, enqueue_job, submit_job
+from .upload_handlers import streaming_upload
+from . import chunked_upload
 import json
 from datetime import datetime
 import traceback
@@ -31,10 +34,15 @@ from datetime import datetime, timedelta
 import os
 import json
 import logging
-from .models import SatelliteData
+from .models import SatelliteData, UploadSession
 from .forms import SatelliteDataForm
-from .processing import process_satellite_file
+from .dedup import save_upload
+from .jobs import cancel_job, enqueue_job, submit_job
+from .upload_handlers import streaming_upload
+from . import chunked_upload
 from .export_utils import export_pdf_report, export_csv_data, export_image
+from .profiling import STAGE_FIELDS, stage_percentiles
+from .scheduling import claim_order, latency_percentiles
 import requests
 from django.db.models import Avg
 
@@ -89,94 +97,71 @@ def landing_view(request):
 
 @csrf_exempt
 @login_required
+@streaming_upload
 def home(request):
     """Handle file upload"""
     if request.method == 'POST':
-        print(f"📤 Upload Debug: Processing POST request")
-        print(f"📤 Upload Debug: FILES = {list(request.FILES.keys())}")
-        print(f"📤 Upload Debug: POST = {list(request.POST.keys())}")
+        logger.debug('Upload from %s: files %s, fields %s',
+                     request.user, list(request.FILES.keys()), list(request.POST.keys()))
         
         form = SatelliteDataForm(request.POST, request.FILES)
-        print(f"📤 Upload Debug: Form valid = {form.is_valid()}")
         
         if form.is_valid():
             try:
                 # Save the uploaded file directly
                 uploaded_file = request.FILES['file_path']
-                print(f"📤 Upload Debug: File name = {uploaded_file.name}")
-                print(f"📤 Upload Debug: File size = {uploaded_file.size} bytes")
                 
                 # Create a unique filename
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 filename = f"satellite_data_{timestamp}_{uploaded_file.name}"
-                print(f"📤 Upload Debug: Generated filename = {filename}")
                 
-                # Save file to media directory
-                file_path = default_storage.save(f'uploads/{filename}', uploaded_file)
-                print(f"📤 Upload Debug: Saved file path = {file_path}")
+                # Record the file the upload handler streamed (and hashed) into media
+                file_path, content_sha256 = save_upload(uploaded_file, f'uploads/{filename}')
                 
                 # Create database record
                 satellite_data = form.save(commit=False)
                 satellite_data.file_path = file_path
+                satellite_data.content_sha256 = content_sha256
                 satellite_data.upload_datetime = datetime.now()
-                satellite_data.status = 'uploaded'
                 satellite_data.uploaded_by = request.user  # Explicitly set user
                 satellite_data.save()
                 
-                print(f"📤 Upload Debug: Created database record")
-                print(f"📤 Upload Debug: Record ID = {satellite_data.id}")
-                print(f"📤 Upload Debug: Record user = {satellite_data.uploaded_by}")
-                print(f"📤 Upload Debug: Record status = {satellite_data.status}")
+                logger.debug('Saved upload %s (%s bytes) as %s, record %s',
+                             uploaded_file.name, uploaded_file.size, file_path, satellite_data.id)
                 
-                # Process the data
-                print(f"📤 Upload Debug: Starting processing...")
-                result = process_satellite_file(satellite_data.id)
-                print(f"📤 Upload Debug: Processing result = {result}")
-                
-                if result:
-                    print(f"📤 Upload Debug: Processing successful, redirecting to results")
-                    messages.success(request, 'Data processed successfully!')
-                    return redirect('cloud_detection:results', data_id=satellite_data.id)
+                # Reuse the results of an identical file, or queue for the workers
+                if submit_job(satellite_data):
+                    logger.info('Upload %s reused the results of job %s', satellite_data.id, satellite_data.reused_from_id)
+                    messages.success(request, 'This file was already processed; its results were reused')
                 else:
-                    print(f"📤 Upload Debug: Processing failed")
-                    messages.error(request, 'Processing failed')
+                    logger.info('Upload %s queued for processing', satellite_data.id)
+                    messages.success(request, 'File uploaded and queued for processing')
+                return redirect('cloud_detection:home')
                     
             except Exception as e:
-                print(f"📤 Upload Debug: Exception occurred = {str(e)}")
-                import traceback
-                print(f"📤 Upload Debug: Traceback = {traceback.format_exc()}")
-                logger.error(f"Error processing upload: {str(e)}")
+                logger.exception('Error processing upload: %s', e)
                 messages.error(request, f'Error processing file: {str(e)}')
         else:
-            print(f"📤 Upload Debug: Form errors = {form.errors}")
+            logger.debug('Upload form errors: %s', form.errors.as_json())
             for field, errors in form.errors.items():
                 for error in errors:
-                    print(f"📤 Upload Debug: Field '{field}' error = {error}")
                     messages.error(request, f'{field}: {error}')
     else:
-        print(f"📤 Upload Debug: GET request, creating form")
         form = SatelliteDataForm()
     
     try:
-        print(f"📊 Dashboard Debug: Loading dashboard data for user {request.user}")
-        
         # Get user's processed files
         user_files = SatelliteData.objects.filter(uploaded_by=request.user).order_by('-upload_datetime')[:5]
-        print(f"📊 Dashboard Debug: Found {user_files.count()} user files")
         
         # Get analytics data
         total_files = SatelliteData.objects.filter(uploaded_by=request.user).count()
         completed_files = SatelliteData.objects.filter(uploaded_by=request.user, status='completed').count()
-        processing_files = SatelliteData.objects.filter(uploaded_by=request.user, status__in=['uploaded', 'processing']).count()
-        
-        print(f"📊 Dashboard Debug: Analytics - Total: {total_files}, Completed: {completed_files}, Processing: {processing_files}")
+        processing_files = SatelliteData.objects.filter(uploaded_by=request.user, status__in=['uploaded', 'queued', 'processing']).count()
         
         # Calculate average cloud coverage
         completed_data = SatelliteData.objects.filter(uploaded_by=request.user, status='completed', cloud_coverage_percentage__isnull=False)
         avg_cloud_coverage = completed_data.aggregate(Avg('cloud_coverage_percentage'))['cloud_coverage_percentage__avg'] or 0
         
-        print(f"📊 Dashboard Debug: Average cloud coverage: {avg_cloud_coverage}")
-        
         # Get weather data
         weather_data = get_weather_data(request)
         
@@ -192,7 +177,7 @@ def home(request):
         return render(request, 'cloud_detection/home.html', {'form': form, **context})
         
     except Exception as e:
-        print(f"Error in home view: {e}")
+        logger.exception('Error loading dashboard: %s', e)
         messages.error(request, f'Error loading dashboard: {str(e)}')
         return render(request, 'cloud_detection/home.html', {
             'user_files': [],
@@ -205,75 +190,56 @@ def home(request):
 
 @csrf_exempt
 @login_required
+@streaming_upload
 def upload_file(request):
     """Handle file upload"""
-    print(f"📤 Upload Debug: Method = {request.method}")
-    print(f"📤 Upload Debug: User = {request.user} (ID: {request.user.id})")
-    
     if request.method == 'POST':
-        print(f"📤 Upload Debug: Processing POST request")
-        print(f"📤 Upload Debug: FILES = {list(request.FILES.keys())}")
-        print(f"📤 Upload Debug: POST = {list(request.POST.keys())}")
+        logger.debug('Upload from %s: files %s, fields %s',
+                     request.user, list(request.FILES.keys()), list(request.POST.keys()))
         
         form = SatelliteDataForm(request.POST, request.FILES)
-        print(f"📤 Upload Debug: Form valid = {form.is_valid()}")
         
         if form.is_valid():
             try:
                 # Save the uploaded file directly
                 uploaded_file = request.FILES['file_path']
-                print(f"📤 Upload Debug: File name = {uploaded_file.name}")
-                print(f"📤 Upload Debug: File size = {uploaded_file.size} bytes")
                 
                 # Create a unique filename
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 filename = f"satellite_data_{timestamp}_{uploaded_file.name}"
-                print(f"📤 Upload Debug: Generated filename = {filename}")
                 
-                # Save file to media directory
-                file_path = default_storage.save(f'uploads/{filename}', uploaded_file)
-                print(f"📤 Upload Debug: Saved file path = {file_path}")
+                # Record the file the upload handler streamed (and hashed) into media
+                file_path, content_sha256 = save_upload(uploaded_file, f'uploads/{filename}')
                 
                 # Create database record
                 satellite_data = form.save(commit=False)
                 satellite_data.file_path = file_path
+                satellite_data.content_sha256 = content_sha256
                 satellite_data.upload_datetime = datetime.now()
-                satellite_data.status = 'uploaded'
                 satellite_data.uploaded_by = request.user  # Explicitly set user
                 satellite_data.save()
                 
-                print(f"📤 Upload Debug: Created database record")
-                print(f"📤 Upload Debug: Record ID = {satellite_data.id}")
-                print(f"📤 Upload Debug: Record user = {satellite_data.uploaded_by}")
-                print(f"📤 Upload Debug: Record status = {satellite_data.status}")
-                
-                # Process the data
-                print(f"📤 Upload Debug: Starting processing...")
-                result = process_satellite_file(satellite_data.id)
-                print(f"📤 Upload Debug: Processing result = {result}")
+                logger.debug('Saved upload %s (%s bytes) as %s, record %s',
+                             uploaded_file.name, uploaded_file.size, file_path, satellite_data.id)
                 
-                if result:
-                    print(f"📤 Upload Debug: Processing successful, redirecting to dashboard")
-                    messages.success(request, 'Data processed successfully!')
-                    return redirect('cloud_detection:home')  # Redirect to dashboard to show updated data
+                # Reuse the results of an identical file, or queue for the workers
+                if submit_job(satellite_data):
+                    logger.info('Upload %s reused the results of job %s', satellite_data.id, satellite_data.reused_from_id)
+                    messages.success(request, 'This file was already processed; its results were reused')
                 else:
-                    print(f"📤 Upload Debug: Processing failed")
-                    messages.error(request, 'Processing failed')
+                    logger.info('Upload %s queued for processing', satellite_data.id)
+                    messages.success(request, 'File uploaded and queued for processing')
+                return redirect('cloud_detection:home')  # Redirect to dashboard to show updated data
                     
             except Exception as e:
-                print(f"📤 Upload Debug: Exception occurred = {str(e)}")
-                import traceback
-                print(f"📤 Upload Debug: Traceback = {traceback.format_exc()}")
-                logger.error(f"Error processing upload: {str(e)}")
+                logger.exception('Error processing upload: %s', e)
                 messages.error(request, f'Error processing file: {str(e)}')
         else:
-            print(f"📤 Upload Debug: Form errors = {form.errors}")
+            logger.debug('Upload form errors: %s', form.errors.as_json())
             for field, errors in form.errors.items():
                 for error in errors:
-                    print(f"📤 Upload Debug: Field '{field}' error = {error}")
                     messages.error(request, f'{field}: {error}')
     else:
-        print(f"📤 Upload Debug: GET request, creating form")
         form = SatelliteDataForm()
     
     try:
@@ -283,7 +249,7 @@ def upload_file(request):
         # Get analytics data
         total_files = SatelliteData.objects.filter(uploaded_by=request.user).count()
         completed_files = SatelliteData.objects.filter(uploaded_by=request.user, status='completed').count()
-        processing_files = SatelliteData.objects.filter(uploaded_by=request.user, status__in=['uploaded', 'processing']).count()
+        processing_files = SatelliteData.objects.filter(uploaded_by=request.user, status__in=['uploaded', 'queued', 'processing']).count()
         
         # Calculate average cloud coverage
         completed_data = SatelliteData.objects.filter(uploaded_by=request.user, status='completed', cloud_coverage_percentage__isnull=False)
@@ -305,7 +271,7 @@ def upload_file(request):
         return render(request, 'cloud_detection/home.html', {'form': form, **context})
         
     except Exception as e:
-        print(f"Error in upload view: {e}")
+        logger.exception('Error loading upload page: %s', e)
         messages.error(request, f'Error loading upload page: {str(e)}')
         return render(request, 'cloud_detection/home.html', {
             'user_files': [],
@@ -324,23 +290,66 @@ def upload_large_files(request):
     return render(request, 'cloud_detection/upload_large_files.html')
 
 @csrf_exempt
-def get_upload_url(request):
-    """Get upload URL for large files"""
+@login_required
+@require_http_methods(["POST"])
+def api_create_upload(request):
+    """
+    Open a resumable chunked upload. JSON body: file_name, file_size and
+    optionally chunk_size, satellite_name and data_type.
+    """
     try:
-        # For now, return a simple response indicating direct upload is preferred
-        return JsonResponse({
-            'success': True,
-            'message': 'Direct upload is preferred for this application',
-            'upload_url': None,
-            'filename': None,
-            'bucket_name': None
-        })
-    except Exception as e:
-        logger.error(f"Error in get_upload_url: {str(e)}")
-        return JsonResponse({
-            'success': False,
-            'error': str(e)
-        })
+        params = json.loads(request.body or b'{}')
+        upload = chunked_upload.create_session(
+            request.user, params.get('file_name'), int(params.get('file_size', 0)),
+            chunk_size=int(params['chunk_size']) if params.get('chunk_size') else None,
+            satellite_name=params.get('satellite_name'), data_type=params.get('data_type'),
+        )
+    except (ValueError, TypeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, **chunked_upload.upload_status(upload)}, status=201)
+
+@csrf_exempt
+@login_required
+@require_http_methods(["GET", "DELETE"])
+def api_upload_session(request, upload_id):
+    """Received chunks and byte ranges of an upload (GET), or abort it (DELETE)"""
+    upload = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    if request.method == 'DELETE':
+        chunked_upload.abort_session(upload)
+        return JsonResponse({'success': True})
+    return JsonResponse({'success': True, **chunked_upload.upload_status(upload)})
+
+@csrf_exempt
+@login_required
+@require_http_methods(["PUT"])
+def api_upload_chunk(request, upload_id, index):
+    """Store one chunk; the raw request body is the chunk's bytes"""
+    upload = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        chunked_upload.write_chunk(upload, index, request, content_length)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'index': index})
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+def api_finalize_upload(request, upload_id):
+    """Assemble a fully received upload and queue it for processing"""
+    upload = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    try:
+        satellite_data = chunked_upload.finalize(upload)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    reused = satellite_data.reused_from_id is not None
+    return JsonResponse({
+        'success': True,
+        'data_id': satellite_data.id,
+        'reused': reused,
+        'message': ('This file was already processed; its results were reused' if reused
+                    else 'File uploaded and queued for processing'),
+    })
 
 @csrf_exempt
 def process_upload(request):
@@ -366,13 +375,13 @@ def process_upload(request):
                 description=f'Uploaded file: {uploaded_file.name}'
             )
             
-            # Process the data
-            result = process_satellite_file(satellite_data.id)
+            # Queue the data for the processing workers
+            enqueue_job(satellite_data)
             
             return JsonResponse({
                 'success': True,
                 'data_id': satellite_data.id,
-                'message': 'File uploaded and processing started'
+                'message': 'File uploaded and queued for processing'
             })
             
         except Exception as e:
@@ -470,10 +479,18 @@ def processing_status(request, data_id):
     """Get processing status"""
     try:
         satellite_data = SatelliteData.objects.get(id=data_id)
-        return JsonResponse({
+        response = {
             'status': satellite_data.status,
-            'progress': satellite_data.progress or 0
-        })
+            'attempts': satellite_data.attempts,
+        }
+        if satellite_data.status == 'processing':
+            response['cancel_requested'] = satellite_data.cancel_requested
+        if satellite_data.status == 'queued':
+            # Where the job stands in the scheduler's current claim order
+            order = claim_order(SatelliteData.objects.filter(status='queued'), timezone.now())
+            if satellite_data.pk in order:
+                response['queue_position'] = order.index(satellite_data.pk) + 1
+        return JsonResponse(response)
     except SatelliteData.DoesNotExist:
         return JsonResponse({'error': 'Data not found'}, status=404)
 
@@ -482,14 +499,9 @@ def retry_processing(request, data_id):
     """Retry processing"""
     try:
         satellite_data = get_object_or_404(SatelliteData, id=data_id)
-        if satellite_data.status in ['failed', 'pending']:
-            satellite_data.status = 'uploaded'
-            satellite_data.save()
-            result = process_satellite_file(satellite_data.id)
-            if result:
-                messages.success(request, 'Processing restarted successfully')
-            else:
-                messages.error(request, 'Processing failed')
+        if satellite_data.status in ['failed', 'pending', 'cancelled']:
+            enqueue_job(satellite_data)
+            messages.success(request, 'File re-queued; stages completed by the last attempt will be reused')
         else:
             messages.warning(request, 'File is already processing or completed')
         return redirect('cloud_detection:processing_status', data_id=data_id)
@@ -497,6 +509,24 @@ def retry_processing(request, data_id):
         messages.error(request, f'Error retrying processing: {str(e)}')
         return redirect('cloud_detection:home')
 
+@login_required
+@require_http_methods(["POST"])
+def cancel_processing(request, data_id):
+    """Cancel queued or running processing of one of the user's files"""
+    satellite_data = get_object_or_404(SatelliteData, id=data_id, uploaded_by=request.user)
+    try:
+        outcome = cancel_job(satellite_data)
+        if outcome == 'cancelled':
+            messages.success(request, 'Processing cancelled')
+        elif outcome == 'cancelling':
+            messages.success(request, 'Cancellation requested; processing stops after its current step')
+        else:
+            messages.warning(request, 'File is not queued or processing')
+        return redirect('cloud_detection:processing_status', data_id=data_id)
+    except Exception as e:
+        messages.error(request, f'Error cancelling processing: {str(e)}')
+        return redirect('cloud_detection:home')
+
 def download_file(request, data_id, file_type):
     """Download file"""
     try:
@@ -653,6 +683,79 @@ def api_system_status(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+def _report_query(request):
+    """
+    days (default 7), limit (default 1000) and percentiles (default
+    50,90,99) query parameters of the job report endpoints; raises ValueError.
+    """
+    days = int(request.GET.get('days', 7))
+    limit = int(request.GET.get('limit', 1000))
+    percentiles = [float(p) for p in request.GET.get('percentiles', '50,90,99').split(',')]
+    if not all(0 <= p <= 100 for p in percentiles):
+        raise ValueError('percentiles must be between 0 and 100')
+    return days, limit, percentiles
+
+@login_required
+@require_http_methods(["GET"])
+def api_stage_timings(request):
+    """
+    Per-stage timing percentiles across recent jobs.
+    Query parameters: days (default 7), status (default completed),
+    limit (most recent jobs, default 1000) and percentiles (default 50,90,99).
+    """
+    try:
+        days, limit, percentiles = _report_query(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    status = request.GET.get('status', 'completed')
+    timings = SatelliteData.objects.filter(
+        status=status,
+        stage_timings__isnull=False,
+        processing_end_time__gte=timezone.now() - timedelta(days=days),
+    ).order_by('-processing_end_time').values_list('stage_timings', flat=True)[:limit]
+    timings = list(timings)
+
+    return JsonResponse({
+        'jobs': len(timings),
+        'status': status,
+        'days': days,
+        'fields': list(STAGE_FIELDS),
+        'stages': stage_percentiles(timings, percentiles),
+    })
+
+@login_required
+@require_http_methods(["GET"])
+def api_queue_latency(request):
+    """
+    Queue wait, service and turnaround time percentiles across recent jobs,
+    overall and, for staff, per user. Query parameters: days (default 7),
+    limit (most recent jobs, default 1000) and percentiles (default 50,90,99).
+    """
+    try:
+        days, limit, percentiles = _report_query(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    jobs = list(SatelliteData.objects.filter(
+        wait_seconds__isnull=False,
+        service_seconds__isnull=False,
+        processing_end_time__gte=timezone.now() - timedelta(days=days),
+    ).order_by('-processing_end_time').values_list(
+        'uploaded_by__username', 'wait_seconds', 'service_seconds')[:limit])
+
+    report = {
+        'days': days,
+        'scheduling': settings.JOB_SCHEDULING,
+        'overall': latency_percentiles([(wait, service) for _user, wait, service in jobs], percentiles),
+    }
+    if request.user.is_staff:
+        by_user = {}
+        for username, wait, service in jobs:
+            by_user.setdefault(username or 'anonymous', []).append((wait, service))
+        report['users'] = {user: latency_percentiles(times, percentiles) for user, times in sorted(by_user.items())}
+    return JsonResponse(report)
+
 @csrf_exempt
 def api_chart_data(request):
     """Get chart data for cloud coverage trends"""
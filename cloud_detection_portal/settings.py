@@ -165,6 +165,76 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = config('DATA_UPLOAD_MAX_MEMORY_SIZE', default=2097
 DATA_UPLOAD_MAX_NUMBER_FIELDS = config('DATA_UPLOAD_MAX_NUMBER_FIELDS', default=1000, cast=int)
 FILE_UPLOAD_TIMEOUT = config('FILE_UPLOAD_TIMEOUT', default=600, cast=int)  # 10 minutes timeout for large files
 print(f"📤 Optimized for 40-100MB files: {FILE_UPLOAD_MAX_MEMORY_SIZE // (1024*1024)}MB max size")
+# Resumable chunked uploads (api/uploads/) not finalized within this many
+# hours are discarded with their staged data.
+UPLOAD_SESSION_TTL_HOURS = config('UPLOAD_SESSION_TTL_HOURS', default=24, cast=int)
+
+# TCC algorithm memory settings
+# Files larger than TCC_TILED_THRESHOLD_MB are processed in row tiles so that
+# the algorithm's working set stays within TCC_MAX_MEMORY_MB (same results).
+TCC_TILED_THRESHOLD_MB = config('TCC_TILED_THRESHOLD_MB', default=50, cast=int)
+TCC_MAX_MEMORY_MB = config('TCC_MAX_MEMORY_MB', default=512, cast=int)
+
+# How the BT/mask .npy artifacts are written: 'async' (background writer,
+# off the critical path), 'sync', or 'none' (statistics and plots are always
+# computed from the in-memory arrays).
+TCC_PERSIST_ARRAYS = config('TCC_PERSIST_ARRAYS', default='async')
+
+# Result plot renderer: 'fast' (lookup tables + PIL, sub-second) or
+# 'publication' (the full matplotlib figure).
+TCC_RENDER_MODE = config('TCC_RENDER_MODE', default='fast')
+
+# Record per-stage RSS and tracemalloc peaks and the top allocation sites of
+# every job (shown in the admin). Slows processing down; enable to profile.
+TCC_MEMORY_PROFILE = config('TCC_MEMORY_PROFILE', default=False, cast=bool)
+
+# Job queue: uploads are queued and processed by `manage.py run_workers`.
+# A worker renews its lease on a job every JOB_LEASE_SECONDS / 3; jobs whose
+# lease expires are re-queued, up to JOB_MAX_ATTEMPTS claims.
+JOB_WORKERS = config('JOB_WORKERS', default=2, cast=int)
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', default=2.0, cast=float)
+JOB_LEASE_SECONDS = config('JOB_LEASE_SECONDS', default=300, cast=int)
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=3, cast=int)
+# Wall-clock budget of one job (0: none). A job past its budget, or one a user
+# cancels, stops at its next cancellation point; one that reaches none within
+# JOB_CANCEL_GRACE_SECONDS is abandoned and its worker process restarted. The
+# watchdog checks every JOB_WATCHDOG_INTERVAL seconds.
+JOB_TIME_BUDGET_SECONDS = config('JOB_TIME_BUDGET_SECONDS', default=900, cast=int)
+JOB_CANCEL_GRACE_SECONDS = config('JOB_CANCEL_GRACE_SECONDS', default=120, cast=int)
+JOB_WATCHDOG_INTERVAL = config('JOB_WATCHDOG_INTERVAL', default=5.0, cast=float)
+# Claim order (see cloud_detection/scheduling.py): 'fair' takes turns between
+# users by jobs running and processing time received over the last
+# JOB_FAIR_SHARE_WINDOW_SECONDS, smallest input first within a user; 'fifo'
+# is queue order. Higher SatelliteData.priority always goes first.
+JOB_SCHEDULING = config('JOB_SCHEDULING', default='fair')
+JOB_FAIR_SHARE_WINDOW_SECONDS = config('JOB_FAIR_SHARE_WINDOW_SECONDS', default=3600, cast=int)
+# Estimated peak memory (MB) the jobs on one host may use together; jobs that
+# would exceed it wait in the queue. Sized for 16GB VMs; 0 disables the check.
+JOB_MEMORY_BUDGET_MB = config('JOB_MEMORY_BUDGET_MB', default=12288, cast=int)
+
+# Processing logs are buffered per job and written in batches to JOB_LOG_SINK:
+# 'database' (ProcessingLog rows) or 'jsonl' (one file per job in JOB_LOG_DIR).
+JOB_LOG_SINK = config('JOB_LOG_SINK', default='database')
+JOB_LOG_DIR = config('JOB_LOG_DIR', default=str(BASE_DIR / 'logs' / 'jobs'))
+JOB_LOG_BUFFER_SIZE = config('JOB_LOG_BUFFER_SIZE', default=200, cast=int)
+
+# Watch-folder ingestion (`manage.py watch_ingest`): files unchanged for
+# INGEST_STABLE_SECONDS are linked into storage and queued, polling every
+# INGEST_POLL_INTERVAL seconds; no files are admitted while
+# INGEST_MAX_BACKLOG or more jobs are queued or processing (0: no limit).
+INGEST_POLL_INTERVAL = config('INGEST_POLL_INTERVAL', default=10.0, cast=float)
+INGEST_STABLE_SECONDS = config('INGEST_STABLE_SECONDS', default=60, cast=int)
+INGEST_MAX_BACKLOG = config('INGEST_MAX_BACKLOG', default=20, cast=int)
+
+# Decoded INSAT-3DR lat/lon grids are cached here and memory-mapped by every
+# worker (the grids are fixed for a geostationary satellite). Empty disables.
+GEOLOCATION_CACHE_DIR = config('GEOLOCATION_CACHE_DIR', default=str(BASE_DIR / 'cache' / 'geolocation'))
+
+# GCS-sourced inputs are kept here between attempts and reprocessing, keyed
+# by object generation; least recently used entries go beyond
+# INPUT_CACHE_MAX_MB. Empty disables (a temporary download per attempt).
+INPUT_CACHE_DIR = config('INPUT_CACHE_DIR', default=str(BASE_DIR / 'cache' / 'inputs'))
+INPUT_CACHE_MAX_MB = config('INPUT_CACHE_MAX_MB', default=10240, cast=int)
 
 # Session and cache settings for better performance on Compute Engine
 if ENVIRONMENT == 'production':
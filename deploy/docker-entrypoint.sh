@@ -0,0 +1,30 @@
+#!/bin/sh
+# Container entrypoint. PROCESS_ROLE selects what the container runs:
+#   web    - gunicorn only
+#   worker - the processing workers only (manage.py run_workers)
+#   all    - both (the default: uploads are only queued by the web app, and
+#            the SQLite fallback database is not shared between containers)
+
+set -e
+
+start_web() {
+    exec gunicorn --bind 0.0.0.0:$PORT --workers 2 --timeout 300 --access-logfile - --error-logfile - \
+        cloud_detection_portal.wsgi:application
+}
+
+case "${PROCESS_ROLE:-all}" in
+    web)
+        start_web
+        ;;
+    worker)
+        exec python manage.py run_workers
+        ;;
+    all)
+        python manage.py run_workers &
+        start_web
+        ;;
+    *)
+        echo "Unknown PROCESS_ROLE: $PROCESS_ROLE (expected web, worker or all)" >&2
+        exit 1
+        ;;
+esac
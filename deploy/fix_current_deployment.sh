@@ -46,6 +46,33 @@ StandardError=journal
 WantedBy=multi-user.target
 EOF
 
+# Create systemd service for the processing workers (uploads are queued
+# by the web app and processed here)
+echo "🔧 Creating worker service..."
+sudo tee /etc/systemd/system/tropical-cloud-workers.service > /dev/null << 'EOF'
+[Unit]
+Description=Tropical Cloud Detection processing workers
+After=network.target
+
+[Service]
+Type=exec
+User=root
+Group=root
+WorkingDirectory=/opt/tropical-cloud-detection
+Environment=PATH=/opt/tropical-cloud-detection/venv/bin
+EnvironmentFile=/opt/tropical-cloud-detection/.env
+ExecStart=/opt/tropical-cloud-detection/venv/bin/python manage.py run_workers
+KillSignal=SIGTERM
+TimeoutStopSec=900
+Restart=always
+RestartSec=10
+StandardOutput=journal
+StandardError=journal
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 # Create logs directory
 sudo mkdir -p /opt/tropical-cloud-detection/logs
 sudo chmod 755 /opt/tropical-cloud-detection/logs
@@ -53,9 +80,11 @@ sudo chmod 755 /opt/tropical-cloud-detection/logs
 # Reload systemd and enable service
 sudo systemctl daemon-reload
 sudo systemctl enable tropical-cloud-detection
+sudo systemctl enable tropical-cloud-workers
 
 # Start the service
 sudo systemctl start tropical-cloud-detection
+sudo systemctl restart tropical-cloud-workers
 
 # Wait for service to start
 echo "⏳ Waiting for service to start..."
@@ -83,4 +112,5 @@ echo "*/5 * * * * /opt/tropical-cloud-detection/health_check.sh" | sudo crontab
 echo "✅ Deployment fixed!"
 echo "🔧 Service is now managed by systemd and will auto-restart"
 echo "📊 Check logs with: sudo journalctl -u tropical-cloud-detection -f"
+echo "📊 Worker logs: sudo journalctl -u tropical-cloud-workers -f"
 echo "🔧 Check status with: sudo systemctl status tropical-cloud-detection" 
\ No newline at end of file
@@ -114,6 +114,30 @@ RestartSec=10
 WantedBy=multi-user.target
 EOF
 
+# Create systemd service for the processing workers (uploads are queued by
+# the web app and processed here)
+cat > /etc/systemd/system/tropical-cloud-workers.service << EOF
+[Unit]
+Description=Tropical Cloud Detection processing workers
+After=network.target
+
+[Service]
+Type=exec
+User=root
+Group=root
+WorkingDirectory=/opt/tropical-cloud-detection
+Environment=PATH=/opt/tropical-cloud-detection/venv/bin
+EnvironmentFile=/opt/tropical-cloud-detection/.env
+ExecStart=/opt/tropical-cloud-detection/venv/bin/python manage.py run_workers
+KillSignal=SIGTERM
+TimeoutStopSec=900
+Restart=always
+RestartSec=10
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 # Configure Nginx
 echo "🌐 Setting up Nginx configuration..."
 cat > /etc/nginx/sites-available/tropical-cloud-detection << EOF
@@ -194,6 +218,7 @@ python manage.py migrate
 
 # Restart services
 systemctl restart tropical-cloud-detection
+systemctl restart tropical-cloud-workers
 systemctl reload nginx
 
 echo "✅ Application updated successfully!"
@@ -209,10 +234,11 @@ chmod -R 755 /opt/tropical-cloud-detection
 echo "🚀 Starting services..."
 systemctl daemon-reload
 systemctl enable tropical-cloud-detection
+systemctl enable tropical-cloud-workers
 systemctl enable nginx
 
 # Note: We'll start the service after the code is uploaded
-# systemctl start tropical-cloud-detection
+# systemctl start tropical-cloud-detection tropical-cloud-workers
 systemctl start nginx
 
 # Create a simple status page until the app is deployed
@@ -243,7 +269,7 @@ echo "📊 Setup Summary:"
 echo "  - System packages installed"
 echo "  - Python environment configured"
 echo "  - Nginx configured and running on port 8080"
-echo "  - Systemd service created (ready to start after code upload)"
+echo "  - Systemd services created for the web app and workers (ready to start after code upload)"
 echo "  - Application directory: /opt/tropical-cloud-detection"
 echo ""
 echo "📝 Next steps:"
@@ -251,6 +277,6 @@ echo "  1. Upload your application code to /opt/tropical-cloud-detection"
 echo "  2. Install dependencies: pip install -r requirements.txt"
 echo "  3. Run migrations: python manage.py migrate"
 echo "  4. Collect static files: python manage.py collectstatic --noinput"
-echo "  5. Start the application: systemctl start tropical-cloud-detection"
+echo "  5. Start the application: systemctl start tropical-cloud-detection tropical-cloud-workers"
 echo ""
 echo "🔗 Access your application at: http://$(curl -s http://metadata.google.internal/computeMetadata/v1/instance/network-interfaces/0/access-configs/0/external-ip -H "Metadata-Flavor: Google"):8080" 
\ No newline at end of file